@@ -6,4 +6,5 @@ class GestionConfig(AppConfig):
     name = 'gestion'
 
     def ready(self):
+        import gestion.checks  # noqa: F401  Registrar las verificaciones del sistema
         import gestion.signals  # Registrar las señales
@@ -0,0 +1,93 @@
+# gestion/autenticacion.py
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class CacheUsuarios:
+    """
+    Caché LRU en memoria del proceso, con tamaño máximo y vencimiento por entrada.
+    Segura entre hilos (workers gthread).
+    """
+    def __init__(self, maximo, ttl):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+
+    def obtener(self, clave):
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            vence, valor = entrada
+            if vence < time.monotonic():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        with self._candado:
+            self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, clave):
+        with self._candado:
+            self._entradas.pop(clave, None)
+
+    def limpiar(self):
+        with self._candado:
+            self._entradas.clear()
+
+
+cache_usuarios = CacheUsuarios(
+    maximo=getattr(settings, 'JWT_CACHE_USUARIOS_MAXIMO', 1024),
+    ttl=getattr(settings, 'JWT_CACHE_USUARIOS_TTL', 60),
+)
+
+
+class JWTAutenticacionCacheada(JWTAuthentication):
+    """
+    JWTAuthentication que resuelve el usuario del token desde cache_usuarios en lugar de
+    consultar la tabla de usuarios en cada petición. La firma y el vencimiento del token
+    se validan igual que siempre. Los cambios en un usuario invalidan su entrada (ver
+    gestion/signals.py); como la caché es por proceso, otro worker puede ver el cambio
+    recién al vencer la entrada (JWT_CACHE_USUARIOS_TTL segundos).
+
+    Solo se autentican tokens de acceso; la lista negra de tokens de refresco sigue a
+    cargo de token_blacklist en /api/token/refresh/.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            return super().get_user(validated_token)
+
+        usuario = cache_usuarios.obtener(user_id)
+        if usuario is None:
+            usuario = super().get_user(validated_token)
+            cache_usuarios.guardar(user_id, usuario)
+        else:
+            self._validar(usuario, validated_token)
+        # Copia por petición: lo que una vista guarde en request.user no se comparte
+        return copy.copy(usuario)
+
+    def _validar(self, usuario, validated_token):
+        """Mismas comprobaciones que JWTAuthentication.get_user hace tras la consulta."""
+        if not usuario.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(usuario.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
@@ -0,0 +1,204 @@
+# gestion/cargas.py
+
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from .models import CargaArchivo
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de cada lectura del cuerpo de la petición al escribir en disco
+TAMANO_BLOQUE = 64 * 1024
+
+
+class ErrorCarga(Exception):
+    """
+    Error de una subida por fragmentos. `codigo` es el estado HTTP sugerido y `datos`
+    se agrega a la respuesta (por ejemplo, el desplazamiento correcto para reanudar).
+    """
+
+    def __init__(self, mensaje, codigo=400, datos=None):
+        super().__init__(mensaje)
+        self.codigo = codigo
+        self.datos = {"error": mensaje, **(datos or {})}
+
+
+def ruta_carga(carga):
+    # Se conserva la extensión original: los lectores la usan para reconocer el formato
+    extension = os.path.splitext(carga.nombre_archivo)[1].lower()
+    return os.path.join(settings.CARGAS_DIR, f"{carga.id}{extension}")
+
+
+def parsear_content_range(cabecera):
+    """
+    Interpreta 'bytes inicio-fin/total' y devuelve (inicio, fin, total); fin es inclusivo.
+    """
+    try:
+        unidad, rango = cabecera.strip().split(' ', 1)
+        intervalo, total = rango.split('/', 1)
+        inicio, fin = intervalo.split('-', 1)
+        if unidad != 'bytes':
+            raise ValueError
+        return int(inicio), int(fin), int(total)
+    except ValueError:
+        raise ErrorCarga("Cabecera Content-Range inválida. Usa 'bytes inicio-fin/total'.")
+
+
+def crear_carga(usuario, nombre_archivo, tamano_total):
+    if tamano_total <= 0:
+        raise ErrorCarga("El tamaño total debe ser mayor a 0.")
+    if tamano_total > settings.CARGA_TAMANO_MAXIMO:
+        raise ErrorCarga(f"El archivo supera el tamaño máximo permitido ({settings.CARGA_TAMANO_MAXIMO} bytes).")
+
+    os.makedirs(settings.CARGAS_DIR, exist_ok=True)
+    carga = CargaArchivo.objects.create(
+        usuario=usuario,
+        nombre_archivo=nombre_archivo,
+        tamano_total=tamano_total,
+    )
+    open(ruta_carga(carga), 'wb').close()
+    logger.info(f"Carga iniciada: {carga.id} ({nombre_archivo}, {tamano_total} bytes)")
+    return carga
+
+
+def _reservar(carga, inicio):
+    """
+    Marca la carga como recibiendo un fragmento desde `inicio`, con un UPDATE condicional:
+    solo una petición a la vez escribe en el archivo, sin mantener abierta una transacción
+    mientras llega el cuerpo. Una reserva vence a los CARGA_RESERVA_SEGUNDOS (el worker
+    que la tenía murió). Devuelve la marca de la reserva o None si no se pudo tomar.
+    """
+    ahora = timezone.now()
+    reserva = ahora + timedelta(seconds=settings.CARGA_RESERVA_SEGUNDOS)
+    reservadas = CargaArchivo.objects.filter(
+        Q(recibiendo_hasta__isnull=True) | Q(recibiendo_hasta__lt=ahora),
+        pk=carga.pk, estado='En Progreso', bytes_recibidos=inicio,
+    ).update(recibiendo_hasta=reserva)
+    return reserva if reservadas else None
+
+
+def recibir_fragmento(carga_id, usuario, stream, inicio, longitud, total=None):
+    """
+    Agrega al archivo en disco un fragmento leído del stream de la petición, por bloques.
+    El fragmento debe comenzar exactamente en bytes_recibidos; si no, se responde 409 con
+    el desplazamiento correcto para que el cliente reanude desde ahí.
+    Devuelve (carga, completo), donde completo indica si llegó el fragmento entero.
+    """
+    carga = CargaArchivo.objects.get(id=carga_id, usuario=usuario)
+    if total is not None and total != carga.tamano_total:
+        raise ErrorCarga("El tamaño total no coincide con el declarado al iniciar la carga.")
+    if inicio + longitud > carga.tamano_total:
+        raise ErrorCarga("El fragmento excede el tamaño total declarado.")
+
+    reserva = _reservar(carga, inicio)
+    if reserva is None:
+        carga.refresh_from_db()
+        if carga.estado != 'En Progreso':
+            raise ErrorCarga("La carga ya fue completada.", codigo=409, datos={"bytes_recibidos": carga.bytes_recibidos})
+        if inicio != carga.bytes_recibidos:
+            raise ErrorCarga(
+                "El fragmento no continúa la carga; reanuda desde bytes_recibidos.",
+                codigo=409,
+                datos={"bytes_recibidos": carga.bytes_recibidos}
+            )
+        raise ErrorCarga(
+            "Otro fragmento de esta carga se está recibiendo; reintenta en unos segundos.",
+            codigo=409,
+            datos={"bytes_recibidos": carga.bytes_recibidos}
+        )
+
+    ruta = ruta_carga(carga)
+    escritos = 0
+    try:
+        with open(ruta, 'r+b' if os.path.exists(ruta) else 'wb') as destino:
+            # Descartar restos de un fragmento anterior interrumpido a medio escribir
+            destino.truncate(inicio)
+            destino.seek(inicio)
+            while escritos < longitud:
+                try:
+                    bloque = stream.read(min(TAMANO_BLOQUE, longitud - escritos))
+                except (OSError, UnreadablePostError):
+                    bloque = b''
+                if not bloque:
+                    break
+                destino.write(bloque)
+                escritos += len(bloque)
+    except Exception:
+        CargaArchivo.objects.filter(pk=carga.pk, recibiendo_hasta=reserva).update(recibiendo_hasta=None)
+        raise
+
+    # Si la conexión se cortó a mitad del fragmento se conserva lo recibido: el cliente
+    # consulta bytes_recibidos y reanuda desde ahí.
+    carga.bytes_recibidos = inicio + escritos
+    if carga.bytes_recibidos == carga.tamano_total:
+        carga.estado = 'Completada'
+    carga.recibiendo_hasta = None
+    carga.fecha_actualizacion = timezone.now()
+    confirmadas = CargaArchivo.objects.filter(pk=carga.pk, recibiendo_hasta=reserva).update(
+        bytes_recibidos=carga.bytes_recibidos, estado=carga.estado,
+        recibiendo_hasta=None, fecha_actualizacion=carga.fecha_actualizacion,
+    )
+    if not confirmadas:
+        # La reserva venció y otra petición tomó la carga: lo escrito aquí no cuenta
+        carga.refresh_from_db()
+        raise ErrorCarga(
+            "El fragmento tardó demasiado y la carga fue retomada por otra petición.",
+            codigo=409,
+            datos={"bytes_recibidos": carga.bytes_recibidos}
+        )
+    if carga.estado == 'Completada':
+        logger.info(f"Carga completada: {carga.id}")
+    return carga, escritos == longitud
+
+
+def hash_carga(carga):
+    digest = hashlib.sha256()
+    with open(ruta_carga(carga), 'rb') as origen:
+        for bloque in iter(lambda: origen.read(TAMANO_BLOQUE), b''):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def eliminar_archivo_carga(carga):
+    try:
+        os.remove(ruta_carga(carga))
+    except FileNotFoundError:
+        pass
+
+
+def purgar_cargas_abandonadas(horas=None):
+    """
+    Borra las cargas sin importar (en progreso o completadas) que no cambian hace más de
+    `horas` (CARGA_VIGENCIA_HORAS por defecto), con sus archivos, y los archivos de
+    CARGAS_DIR que ya no tienen carga. Devuelve (cargas, archivos) borrados.
+    """
+    horas = settings.CARGA_VIGENCIA_HORAS if horas is None else horas
+    limite = timezone.now() - timedelta(hours=horas)
+    abandonadas = list(CargaArchivo.objects.filter(
+        estado__in=['En Progreso', 'Completada'], fecha_actualizacion__lt=limite
+    ))
+    for carga in abandonadas:
+        eliminar_archivo_carga(carga)
+    cargas = CargaArchivo.objects.filter(pk__in=[carga.pk for carga in abandonadas]).delete()[0]
+
+    archivos = 0
+    if os.path.isdir(settings.CARGAS_DIR):
+        vigentes = {str(pk) for pk in CargaArchivo.objects.values_list('pk', flat=True)}
+        for entrada in os.scandir(settings.CARGAS_DIR):
+            identificador = entrada.name.split('.', 1)[0]
+            if (
+                entrada.is_file() and identificador not in vigentes
+                and entrada.stat().st_mtime < limite.timestamp()
+            ):
+                os.remove(entrada.path)
+                archivos += 1
+    if cargas or archivos:
+        logger.info(f"Cargas abandonadas borradas: {cargas} (archivos sin carga: {archivos}).")
+    return cargas, archivos
@@ -0,0 +1,31 @@
+# gestion/checks.py
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends de caché que no se comparten entre procesos
+CACHES_LOCALES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_compartida():
+    return settings.CACHES['default']['BACKEND'] not in CACHES_LOCALES
+
+
+@register(Tags.caches)
+def verificar_cache_replica(app_configs, **kwargs):
+    """
+    La adherencia al primario tras una escritura (gestion/replicas.py) se guarda en la
+    caché: con una caché por proceso, otro worker no la ve y lee de la réplica datos que
+    aún no llegaron.
+    """
+    if not settings.DATABASE_REPLICA_URL or cache_compartida():
+        return []
+    return [Error(
+        "DATABASE_REPLICA_URL requiere una caché compartida entre procesos.",
+        hint="Configura CACHE_BACKEND (por ejemplo django.core.cache.backends.redis.RedisCache) y CACHE_LOCATION.",
+        obj='CACHES',
+        id='gestion.E001',
+    )]
@@ -0,0 +1,297 @@
+# gestion/conciliacion.py
+
+import logging
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When
+
+from .models import Articulo, HistorialPrestamo, HistorialStock, Movimiento
+from .totales_catalogos import registrar_cambio_articulos
+
+logger = logging.getLogger(__name__)
+
+# Efecto de cada tipo de movimiento sobre el stock del artículo del movimiento.
+# 'Cambio de Estado' no mueve stock; 'Anulacion' invierte el efecto del movimiento revertido.
+# 'Saldo Inicial' no es un cambio de stock sino la base del registro (ver saldos_iniciales).
+TIPOS_SUMAN = ['Entrada', 'Nuevo Articulo', 'Regresado']
+TIPOS_RESTAN = ['Salida', 'Prestamo', 'Cambio de Estado por Unidad']
+TIPO_SALDO_INICIAL = 'Saldo Inicial'
+
+# Artículos que se bloquean y corrigen por transacción al reparar
+TAMANO_LOTE_CONCILIACION = 1000
+
+COMENTARIO_CONCILIACION = "Conciliación del stock con el registro de movimientos."
+
+
+class ErrorConciliacion(Exception):
+    pass
+
+
+def delta_stock_origen():
+    """Efecto con signo de cada movimiento sobre el stock de su propio artículo."""
+    cantidad = F('cantidad')
+    return Case(
+        When(tipo_movimiento__in=TIPOS_SUMAN, then=cantidad),
+        When(tipo_movimiento__in=TIPOS_RESTAN, then=-cantidad),
+        When(
+            tipo_movimiento='Anulacion',
+            movimiento_revertido__tipo_movimiento__in=TIPOS_SUMAN,
+            then=-cantidad,
+        ),
+        When(
+            tipo_movimiento='Anulacion',
+            movimiento_revertido__tipo_movimiento__in=TIPOS_RESTAN,
+            then=cantidad,
+        ),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def delta_stock_destino():
+    """Efecto sobre el artículo destino: la transferencia suma y su anulación descuenta."""
+    return Case(
+        When(tipo_movimiento='Cambio de Estado por Unidad', then=F('cantidad')),
+        When(tipo_movimiento='Anulacion', then=-F('cantidad')),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def delta_prestado():
+    """Efecto con signo de cada movimiento sobre las unidades prestadas de su artículo."""
+    cantidad = F('cantidad')
+    return Case(
+        When(tipo_movimiento='Prestamo', then=cantidad),
+        When(tipo_movimiento='Regresado', then=-cantidad),
+        When(tipo_movimiento='Anulacion', movimiento_revertido__tipo_movimiento='Prestamo', then=-cantidad),
+        When(tipo_movimiento='Anulacion', movimiento_revertido__tipo_movimiento='Regresado', then=cantidad),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def saldos_iniciales(ids=None):
+    """
+    Último 'Saldo Inicial' de cada artículo: {articulo_id: (stock, stock_prestado)}.
+    Los movimientos anteriores a él no cuentan: el saldo ya refleja su efecto.
+    """
+    aperturas = Movimiento.objects.filter(tipo_movimiento=TIPO_SALDO_INICIAL)
+    if ids is not None:
+        aperturas = aperturas.filter(articulo_id__in=ids)
+    ultimas = aperturas.order_by().values('articulo_id').annotate(ultima=Max('id')).values('ultima')
+    return {
+        articulo_id: (stock, prestado or 0)
+        for articulo_id, stock, prestado in Movimiento.objects.filter(id__in=ultimas)
+        .values_list('articulo_id', 'cantidad', 'stock_prestado_inicial')
+    }
+
+
+def posteriores_al_saldo_inicial(movimientos, campo='articulo_id'):
+    """Deja los movimientos posteriores al último saldo inicial del artículo `campo` (todos si no tiene)."""
+    apertura = (
+        Movimiento.objects.filter(tipo_movimiento=TIPO_SALDO_INICIAL, articulo_id=OuterRef(campo))
+        .order_by('-id').values('id')[:1]
+    )
+    return movimientos.alias(apertura=Subquery(apertura)).filter(Q(apertura__isnull=True) | Q(id__gt=F('apertura')))
+
+
+def stock_esperado(ids=None, aperturas=None):
+    """
+    Stock que corresponde a cada artículo según el registro de movimientos: {articulo_id: stock}.
+    Es el saldo inicial del artículo (si tiene) más dos consultas agrupadas sobre los
+    movimientos posteriores (artículo del movimiento y artículo destino de las
+    transferencias de estado), sin cargar los movimientos en memoria.
+    """
+    if aperturas is None:
+        aperturas = saldos_iniciales(ids)
+    origen = Movimiento.objects.filter(tipo_movimiento__in=TIPOS_SUMAN + TIPOS_RESTAN + ['Anulacion'])
+    # Una transferencia de estado suma en el destino; su anulación lo descuenta
+    destino = Movimiento.objects.filter(
+        articulo_destino_id__isnull=False,
+        tipo_movimiento__in=['Cambio de Estado por Unidad', 'Anulacion'],
+    )
+    if ids is not None:
+        origen = origen.filter(articulo_id__in=ids)
+        destino = destino.filter(articulo_destino_id__in=ids)
+    origen = posteriores_al_saldo_inicial(origen)
+    destino = posteriores_al_saldo_inicial(destino, 'articulo_destino_id')
+
+    esperado = {articulo_id: stock for articulo_id, (stock, _) in aperturas.items()}
+    for articulo_id, total in (
+        origen.order_by().values('articulo_id').annotate(total=Sum(delta_stock_origen())).values_list('articulo_id', 'total')
+    ):
+        esperado[articulo_id] = esperado.get(articulo_id, 0) + total
+    for articulo_id, total in (
+        destino.order_by().values('articulo_destino_id')
+        .annotate(total=Sum(delta_stock_destino()))
+        .values_list('articulo_destino_id', 'total')
+    ):
+        esperado[articulo_id] = esperado.get(articulo_id, 0) + total
+    return esperado
+
+
+def prestado_esperado(ids=None, aperturas=None):
+    """
+    Unidades prestadas de cada artículo: {articulo_id: cantidad}. Sin saldo inicial son las
+    de sus préstamos abiertos (usa el índice parcial prestamo_abierto_idx). Con saldo
+    inicial son las prestadas en ese momento más los préstamos y devoluciones posteriores,
+    porque lo prestado antes del saldo puede no tener préstamos que lo respalden.
+    """
+    if aperturas is None:
+        aperturas = saldos_iniciales(ids)
+    abiertos = HistorialPrestamo.objects.filter(cantidad_restante__gt=0)
+    if ids is not None:
+        abiertos = abiertos.filter(articulo_id__in=ids)
+    prestado = dict(
+        abiertos.order_by().values('articulo_id')
+        .annotate(total=Sum('cantidad_restante'))
+        .values_list('articulo_id', 'total')
+    )
+    if not aperturas:
+        return prestado
+
+    posteriores = Movimiento.objects.filter(tipo_movimiento__in=['Prestamo', 'Regresado', 'Anulacion'])
+    if ids is not None:
+        posteriores = posteriores.filter(articulo_id__in=ids)
+    movimientos = dict(
+        posteriores_al_saldo_inicial(posteriores).filter(apertura__isnull=False)
+        .order_by().values('articulo_id').annotate(total=Sum(delta_prestado()))
+        .values_list('articulo_id', 'total')
+    )
+    for articulo_id, (_, inicial) in aperturas.items():
+        prestado[articulo_id] = inicial + movimientos.get(articulo_id, 0)
+    return prestado
+
+
+def _comparar(articulo, esperado, prestado):
+    stock = esperado.get(articulo['id'], 0)
+    stock_prestado = prestado.get(articulo['id'], 0)
+    if (
+        articulo['stock_actual'] == stock
+        and articulo['stock_prestado'] == stock_prestado
+        and articulo['prestado'] == (stock_prestado > 0)
+    ):
+        return None
+    return {
+        'articulo': articulo['id'],
+        'nombre': articulo['nombre'],
+        'stock_actual': articulo['stock_actual'],
+        'stock_esperado': stock,
+        'stock_prestado': articulo['stock_prestado'],
+        'stock_prestado_esperado': stock_prestado,
+        'prestado': articulo['prestado'],
+        'prestado_esperado': stock_prestado > 0,
+        # Un saldo negativo indica movimientos faltantes, y un artículo sin saldo inicial ni
+        # movimientos no tiene registro con que compararlo: ninguno se corrige solo con el stock
+        'reparable': stock >= 0 and articulo['id'] in esperado,
+    }
+
+
+def detectar_discrepancias(ids=None):
+    """
+    Compara el stock guardado de los artículos (todos o los de `ids`) con el que resulta
+    del registro de movimientos y de los préstamos abiertos. Genera un dict por artículo
+    con diferencias. Los totales esperados se calculan con consultas agrupadas una sola
+    vez y los artículos se recorren en streaming.
+    """
+    aperturas = saldos_iniciales(ids)
+    esperado = stock_esperado(ids, aperturas)
+    prestado = prestado_esperado(ids, aperturas)
+
+    articulos = Articulo.objects.order_by('id').values('id', 'nombre', 'stock_actual', 'stock_prestado', 'prestado')
+    if ids is not None:
+        articulos = articulos.filter(id__in=ids)
+    for articulo in articulos.iterator(chunk_size=2000):
+        discrepancia = _comparar(articulo, esperado, prestado)
+        if discrepancia:
+            yield discrepancia
+
+
+def reparar_discrepancias(ids, usuario, tamano_lote=TAMANO_LOTE_CONCILIACION):
+    """
+    Lleva el stock de los artículos indicados a lo que dice el registro de movimientos.
+    Trabaja por lotes: cada lote se bloquea, se recalcula con las filas ya bloqueadas (por
+    si hubo movimientos después de la detección) y se corrige con un bulk_update, dejando
+    una entrada 'Conciliacion' en HistorialStock por cada stock disponible corregido.
+    Devuelve la cantidad de artículos corregidos y los ids que no se pudieron corregir.
+    """
+    ids = sorted(set(ids))
+    corregidos = 0
+    omitidos = []
+    for inicio in range(0, len(ids), tamano_lote):
+        lote = ids[inicio:inicio + tamano_lote]
+        with transaction.atomic():
+            articulos = list(Articulo.objects.select_for_update().filter(id__in=lote).order_by('id'))
+            aperturas = saldos_iniciales(lote)
+            esperado = stock_esperado(lote, aperturas)
+            prestado = prestado_esperado(lote, aperturas)
+
+            modificados = []
+            historial = []
+            for articulo in articulos:
+                stock = esperado.get(articulo.id, 0)
+                stock_prestado = prestado.get(articulo.id, 0)
+                if stock < 0 or articulo.id not in esperado:
+                    omitidos.append(articulo.id)
+                    continue
+                if (articulo.stock_actual, articulo.stock_prestado, articulo.prestado) == (
+                    stock, stock_prestado, stock_prestado > 0
+                ):
+                    continue
+                if articulo.stock_actual != stock:
+                    historial.append(HistorialStock(
+                        articulo=articulo,
+                        tipo_movimiento='Conciliacion',
+                        cantidad=abs(stock - articulo.stock_actual),
+                        stock_anterior=articulo.stock_actual,
+                        stock_actual=stock,
+                        usuario=usuario,
+                        comentario=COMENTARIO_CONCILIACION,
+                        ubicacion_id=articulo.ubicacion_id,
+                    ))
+                articulo.stock_actual = stock
+                articulo.stock_prestado = stock_prestado
+                articulo.prestado = stock_prestado > 0
+                modificados.append(articulo)
+
+            Articulo.objects.bulk_update(modificados, ['stock_actual', 'stock_prestado', 'prestado'])
+            registrar_cambio_articulos()
+            HistorialStock.objects.bulk_create(historial)
+        corregidos += len(modificados)
+
+    logger.info(
+        f"Conciliación de stock por {usuario}: {corregidos} artículo(s) corregido(s), "
+        f"{len(omitidos)} sin corregir (saldo negativo o sin registro de movimientos)."
+    )
+    return corregidos, omitidos
+
+
+def conciliar(ids=None, reparar=False, usuario=None, limite=None):
+    """
+    Detecta las diferencias (opcionalmente limitadas a `ids`) y, si `reparar`, las corrige
+    a nombre de `usuario`. Devuelve un resumen con hasta `limite` discrepancias detalladas.
+    """
+    if reparar and usuario is None:
+        raise ErrorConciliacion("Se requiere un usuario para reparar el stock.")
+
+    total = 0
+    detalle = []
+    reparables = []
+    for discrepancia in detectar_discrepancias(ids):
+        total += 1
+        if limite is None or len(detalle) < limite:
+            detalle.append(discrepancia)
+        if discrepancia['reparable']:
+            reparables.append(discrepancia['articulo'])
+
+    resumen = {
+        'total_discrepancias': total,
+        'no_reparables': total - len(reparables),
+        'discrepancias': detalle,
+    }
+    if reparar:
+        corregidos, omitidos = reparar_discrepancias(reparables, usuario)
+        resumen['corregidos'] = corregidos
+        resumen['omitidos'] = omitidos
+    return resumen
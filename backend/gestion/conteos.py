@@ -0,0 +1,269 @@
+# gestion/conteos.py
+
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Articulo, HistorialStock, LineaConteo, Movimiento, SesionConteo
+from .totales_catalogos import registrar_cambio_articulos
+
+logger = logging.getLogger(__name__)
+
+# Líneas que se insertan o ajustan por consulta
+TAMANO_LOTE_CONTEO = 2000
+# Máximo de lecturas aceptadas en un envío
+MAXIMO_LECTURAS_ENVIO = 5000
+
+# Códigos con los que un lector puede identificar un artículo
+CAMPOS_CODIGO = ['codigo_interno', 'numero_serie', 'codigo_minvu', 'mac']
+
+MODOS_CONTEO = ('sumar', 'reemplazar')
+
+
+class ErrorConteo(Exception):
+    def __init__(self, mensaje, detalle=None):
+        super().__init__(mensaje)
+        self.detalle = detalle or []
+
+
+def _lotes(secuencia, tamano):
+    for inicio in range(0, len(secuencia), tamano):
+        yield secuencia[inicio:inicio + tamano]
+
+
+def abrir_sesion(nombre, usuario, ubicacion=None, categoria=None):
+    """
+    Abre una sesión de conteo con una línea por artículo del alcance (todos, o los de una
+    ubicación y/o categoría) que guarda su stock en ese momento.
+    """
+    articulos = Articulo.objects.all()
+    if ubicacion is not None:
+        articulos = articulos.filter(ubicacion=ubicacion)
+    if categoria is not None:
+        articulos = articulos.filter(categoria=categoria)
+
+    with transaction.atomic():
+        sesion = SesionConteo.objects.create(nombre=nombre, usuario=usuario, ubicacion=ubicacion, categoria=categoria)
+        # La foto del stock se toma en la misma transacción que crea la sesión
+        foto = list(articulos.order_by('id').values_list('id', 'stock_actual'))
+        for lote in _lotes(foto, TAMANO_LOTE_CONTEO):
+            LineaConteo.objects.bulk_create([
+                LineaConteo(sesion=sesion, articulo_id=articulo_id, stock_inicial=stock)
+                for articulo_id, stock in lote
+            ])
+
+    logger.info(f"Sesión de conteo {sesion.id} abierta por {usuario} con {len(foto)} artículo(s).")
+    return sesion
+
+
+def _bloquear_abierta(sesion_id):
+    sesion = SesionConteo.objects.select_for_update().get(pk=sesion_id)
+    if sesion.estado != 'Abierta':
+        raise ErrorConteo(f"La sesión de conteo está {sesion.estado.lower()}.")
+    return sesion
+
+
+def _resolver_codigos(sesion, codigos):
+    """
+    {codigo: articulo_id} para los códigos que identifican a un único artículo de la sesión.
+    Devuelve también los códigos ambiguos (más de un artículo).
+    """
+    condicion = Q()
+    for campo in CAMPOS_CODIGO:
+        condicion |= Q(**{f'{campo}__in': codigos})
+
+    encontrados = defaultdict(set)
+    for fila in (
+        Articulo.objects.filter(condicion, lineas_conteo__sesion=sesion)
+        .values('id', *CAMPOS_CODIGO)
+    ):
+        for campo in CAMPOS_CODIGO:
+            if fila[campo] in codigos:
+                encontrados[fila[campo]].add(fila['id'])
+
+    resueltos = {codigo: ids.pop() for codigo, ids in encontrados.items() if len(ids) == 1}
+    ambiguos = sorted(codigo for codigo, ids in encontrados.items() if len(ids) > 1)
+    return resueltos, ambiguos
+
+
+def registrar_conteos(sesion_id, lecturas, modo='sumar'):
+    """
+    Registra un envío de lecturas: [{"articulo": id} o {"codigo": "..."}, "cantidad": n].
+    En modo 'sumar' (lector de códigos) cada lectura se acumula, por defecto de a 1; en
+    'reemplazar' la cantidad enviada pasa a ser la contada. Todo el envío se aplica con un
+    UPDATE por lote. Devuelve cuántas líneas se actualizaron y las lecturas rechazadas.
+    """
+    if modo not in MODOS_CONTEO:
+        raise ErrorConteo(f"Modo de conteo no válido: {modo}.")
+    if not lecturas:
+        raise ErrorConteo("No se enviaron lecturas.")
+    if len(lecturas) > MAXIMO_LECTURAS_ENVIO:
+        raise ErrorConteo(f"Se pueden enviar hasta {MAXIMO_LECTURAS_ENVIO} lecturas por envío.")
+
+    normalizadas = []
+    for posicion, lectura in enumerate(lecturas, start=1):
+        try:
+            cantidad = int(lectura.get('cantidad', 1))
+            articulo_id = int(lectura['articulo']) if lectura.get('articulo') is not None else None
+            codigo = str(lectura['codigo']).strip() if articulo_id is None else None
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ErrorConteo(f"Lectura {posicion}: debe indicar 'articulo' o 'codigo' y una cantidad entera.")
+        if cantidad < 0:
+            raise ErrorConteo(f"Lectura {posicion}: la cantidad no puede ser negativa.")
+        normalizadas.append((posicion, articulo_id, codigo, cantidad))
+
+    with transaction.atomic():
+        sesion = _bloquear_abierta(sesion_id)
+
+        codigos = {codigo for _, articulo_id, codigo, _ in normalizadas if articulo_id is None}
+        resueltos, ambiguos = _resolver_codigos(sesion, codigos) if codigos else ({}, [])
+        en_sesion = set(
+            sesion.lineas.filter(
+                articulo_id__in={a for _, a, _, _ in normalizadas if a is not None} | set(resueltos.values())
+            ).values_list('articulo_id', flat=True)
+        )
+
+        cantidades = defaultdict(int)
+        rechazadas = []
+        for posicion, articulo_id, codigo, cantidad in normalizadas:
+            if articulo_id is None:
+                if codigo in ambiguos:
+                    rechazadas.append({"lectura": posicion, "codigo": codigo, "error": "Código ambiguo."})
+                    continue
+                articulo_id = resueltos.get(codigo)
+            if articulo_id not in en_sesion:
+                rechazadas.append({
+                    "lectura": posicion, "codigo": codigo, "articulo": articulo_id,
+                    "error": "El artículo no está incluido en la sesión.",
+                })
+                continue
+            if modo == 'sumar':
+                cantidades[articulo_id] += cantidad
+            else:
+                cantidades[articulo_id] = cantidad
+
+        ahora = timezone.now()
+        ids = sorted(cantidades)
+        for lote in _lotes(ids, TAMANO_LOTE_CONTEO):
+            nuevo = Case(
+                *[When(articulo_id=articulo_id, then=Value(cantidades[articulo_id])) for articulo_id in lote],
+                output_field=IntegerField(),
+            )
+            if modo == 'sumar':
+                nuevo = Coalesce(F('cantidad_contada'), Value(0)) + nuevo
+            sesion.lineas.filter(articulo_id__in=lote).update(cantidad_contada=nuevo, fecha_conteo=ahora)
+
+    return {"lineas_actualizadas": len(ids), "rechazadas": rechazadas}
+
+
+def diferencias(sesion, no_contados_en_cero=False):
+    """
+    Líneas cuyo conteo difiere del stock al abrir la sesión. Los artículos sin contar se
+    omiten, salvo que `no_contados_en_cero` los considere contados en 0.
+    """
+    contada = Coalesce(F('cantidad_contada'), Value(0)) if no_contados_en_cero else F('cantidad_contada')
+    lineas = sesion.lineas.annotate(contada=contada).exclude(contada=F('stock_inicial'))
+    if not no_contados_en_cero:
+        lineas = lineas.filter(cantidad_contada__isnull=False)
+    return lineas.annotate(diferencia=F('contada') - F('stock_inicial')).order_by('articulo_id')
+
+
+def confirmar_sesion(sesion_id, usuario, no_contados_en_cero=False):
+    """
+    Aplica las diferencias de la sesión en una transacción. El ajuste de cada artículo es
+    (contado - stock al abrir), sumado a su stock actual, de modo que los movimientos
+    registrados durante el conteo se conservan. Cada lote de artículos se ajusta con un
+    UPDATE y un movimiento Entrada/Salida (con su historial) por artículo vía bulk_create.
+    """
+    with transaction.atomic():
+        sesion = _bloquear_abierta(sesion_id)
+        pendientes = list(
+            diferencias(sesion, no_contados_en_cero).values_list('articulo_id', 'diferencia')
+        )
+
+        ahora = timezone.now()
+        comentario = f"Ajuste por conteo de inventario '{sesion.nombre}' (sesión {sesion.id})."
+        negativos = []
+        entradas = salidas = 0
+        for lote in _lotes(pendientes, TAMANO_LOTE_CONTEO):
+            ajustes = dict(lote)
+            articulos = list(
+                Articulo.objects.select_for_update().filter(id__in=ajustes).order_by('id')
+                .values('id', 'stock_actual', 'ubicacion_id')
+            )
+            negativos += [a['id'] for a in articulos if a['stock_actual'] + ajustes[a['id']] < 0]
+            if negativos:
+                # Se sigue revisando para informar todos los artículos, pero no se escribe nada
+                continue
+
+            Articulo.objects.filter(id__in=ajustes).update(
+                stock_actual=F('stock_actual') + Case(
+                    *[When(id=articulo_id, then=Value(ajuste)) for articulo_id, ajuste in ajustes.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+            registrar_cambio_articulos()
+
+            movimientos = []
+            historial = []
+            for articulo in articulos:
+                ajuste = ajustes[articulo['id']]
+                tipo = 'Entrada' if ajuste > 0 else 'Salida'
+                if ajuste > 0:
+                    entradas += 1
+                else:
+                    salidas += 1
+                movimientos.append(Movimiento(
+                    articulo_id=articulo['id'],
+                    tipo_movimiento=tipo,
+                    cantidad=abs(ajuste),
+                    fecha=ahora,
+                    usuario=usuario,
+                    ubicacion_id=articulo['ubicacion_id'],
+                    comentario=comentario,
+                ))
+                historial.append(HistorialStock(
+                    articulo_id=articulo['id'],
+                    tipo_movimiento=tipo,
+                    cantidad=abs(ajuste),
+                    stock_anterior=articulo['stock_actual'],
+                    stock_actual=articulo['stock_actual'] + ajuste,
+                    usuario=usuario,
+                    comentario=comentario,
+                    ubicacion_id=articulo['ubicacion_id'],
+                ))
+            Movimiento.objects.bulk_create(movimientos)
+            HistorialStock.objects.bulk_create(historial)
+
+        if negativos:
+            raise ErrorConteo(
+                "El ajuste dejaría stock negativo en algunos artículos (hubo salidas durante el conteo).",
+                negativos[:50],
+            )
+
+        sesion.estado = 'Confirmada'
+        sesion.fecha_cierre = ahora
+        sesion.resultado = {
+            "ajustados": entradas + salidas,
+            "entradas": entradas,
+            "salidas": salidas,
+            "no_contados_en_cero": no_contados_en_cero,
+        }
+        sesion.save(update_fields=['estado', 'fecha_cierre', 'resultado'])
+
+    logger.info(f"Sesión de conteo {sesion.id} confirmada por {usuario}: {sesion.resultado}")
+    return sesion
+
+
+def cancelar_sesion(sesion_id):
+    with transaction.atomic():
+        sesion = _bloquear_abierta(sesion_id)
+        sesion.estado = 'Cancelada'
+        sesion.fecha_cierre = timezone.now()
+        sesion.save(update_fields=['estado', 'fecha_cierre'])
+    return sesion
@@ -0,0 +1,243 @@
+# gestion/edicion_masiva.py
+
+import logging
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Articulo, Categoria, EstadoArticulo, HistorialStock, Movimiento, Ubicacion
+from .totales_catalogos import registrar_cambio_articulos
+
+logger = logging.getLogger(__name__)
+
+# Máximo de artículos que puede alcanzar una edición masiva
+MAXIMO_EDICION_MASIVA = 10000
+# Artículos por UPDATE
+TAMANO_LOTE_EDICION = 1000
+# Ids de ejemplo que se devuelven cuando una validación falla
+MUESTRA_ERRORES = 20
+
+# Campos que se pueden cambiar y el catálogo al que apuntan (None para valores simples)
+CAMPOS_EDITABLES = {
+    'ubicacion': Ubicacion,
+    'estado': EstadoArticulo,
+    'categoria': Categoria,
+    'stock_minimo': None,
+}
+
+# Filtros aceptados para elegir los artículos en lugar de una lista de ids
+FILTROS_PERMITIDOS = {
+    'categoria': 'categoria_id',
+    'ubicacion': 'ubicacion_id',
+    'estado': 'estado_id',
+    'marca': 'marca_id',
+    'modelo': 'modelo_id',
+    'nombre': 'nombre__icontains',
+}
+
+# Campos únicos por estado (unique_together de Articulo)
+CAMPOS_UNICOS_POR_ESTADO = ['codigo_interno', 'codigo_minvu', 'numero_serie', 'mac']
+
+# Categorías que exigen MAC por nombre (ver Articulo.clean)
+CATEGORIAS_REQUIEREN_MAC = ["Torre", "PC"]
+
+
+class ErrorEdicionMasiva(Exception):
+    def __init__(self, mensaje, articulos=None):
+        super().__init__(mensaje)
+        self.articulos = articulos or []
+
+
+def seleccionar_articulos(ids=None, filtro=None):
+    """
+    Queryset de los artículos a editar a partir de una lista de ids o de un filtro
+    (ver FILTROS_PERMITIDOS). Se exige uno de los dos para no editar todo por accidente.
+    """
+    if ids:
+        return Articulo.objects.filter(id__in=ids)
+    if filtro:
+        desconocidos = set(filtro) - set(FILTROS_PERMITIDOS)
+        if desconocidos:
+            raise ErrorEdicionMasiva(f"Filtros no permitidos: {', '.join(sorted(desconocidos))}.")
+        return Articulo.objects.filter(**{FILTROS_PERMITIDOS[campo]: valor for campo, valor in filtro.items()})
+    raise ErrorEdicionMasiva("Se debe indicar una lista de 'ids' o un 'filtro'.")
+
+
+def preparar_cambios(cambios):
+    """
+    Valida el patch y resuelve los catálogos: devuelve {campo: valor} con instancias
+    (o None) para las claves foráneas y enteros para stock_minimo.
+    """
+    if not cambios:
+        raise ErrorEdicionMasiva("No se indicaron cambios.")
+    desconocidos = set(cambios) - set(CAMPOS_EDITABLES)
+    if desconocidos:
+        raise ErrorEdicionMasiva(f"Campos no editables en lote: {', '.join(sorted(desconocidos))}.")
+
+    preparados = {}
+    for campo, valor in cambios.items():
+        modelo = CAMPOS_EDITABLES[campo]
+        if modelo is None:
+            try:
+                valor = int(valor)
+            except (TypeError, ValueError):
+                raise ErrorEdicionMasiva(f"El campo '{campo}' debe ser un número entero.")
+            if valor < 0:
+                raise ErrorEdicionMasiva(f"El campo '{campo}' no puede ser negativo.")
+        elif valor is None:
+            # El estado es obligatorio para registrar el movimiento de cambio de estado
+            if campo == 'estado':
+                raise ErrorEdicionMasiva("El estado no puede quedar vacío.")
+        else:
+            valor = modelo.objects.filter(pk=valor).first()
+            if valor is None:
+                raise ErrorEdicionMasiva(f"No existe el valor indicado para '{campo}'.")
+        preparados[campo] = valor
+    return preparados
+
+
+def _muestra(queryset):
+    return list(queryset.order_by('id').values_list('id', flat=True)[:MUESTRA_ERRORES])
+
+
+def validar_cambios(seleccion, cambios):
+    """
+    Reglas de Articulo.clean y de unicidad por estado evaluadas sobre todo el conjunto,
+    con una consulta por regla en lugar de un full_clean por artículo.
+    """
+    categoria = cambios.get('categoria')
+    if categoria is not None:
+        requeridos = [
+            (categoria.requiere_codigo_interno, 'codigo_interno', "El código interno es obligatorio para esta categoría."),
+            (categoria.requiere_codigo_minvu, 'codigo_minvu', "El código Minvu es obligatorio para esta categoría."),
+            (categoria.requiere_numero_serie, 'numero_serie', "El número de serie es obligatorio para esta categoría."),
+            (
+                categoria.requiere_mac or categoria.nombre in CATEGORIAS_REQUIEREN_MAC, 'mac',
+                "El MAC Address es obligatorio para esta categoría.",
+            ),
+        ]
+        for requerido, campo, mensaje in requeridos:
+            if not requerido:
+                continue
+            sin_valor = _muestra(seleccion.filter(Q(**{f'{campo}__isnull': True}) | Q(**{campo: ''})))
+            if sin_valor:
+                raise ErrorEdicionMasiva(mensaje, sin_valor)
+
+    estado = cambios.get('estado')
+    if estado is not None:
+        for campo in CAMPOS_UNICOS_POR_ESTADO:
+            con_valor = seleccion.filter(**{f'{campo}__isnull': False})
+            # Dos artículos seleccionados que terminarían en el mismo estado con el mismo código
+            repetidos = list(
+                con_valor.order_by().values(campo).annotate(total=Count('id')).filter(total__gt=1)
+                .values_list(campo, flat=True)[:MUESTRA_ERRORES]
+            )
+            # O un artículo no seleccionado que ya tiene ese código en el estado destino
+            ocupados = list(
+                Articulo.objects.filter(estado=estado, **{f'{campo}__in': con_valor.values(campo)})
+                .exclude(id__in=seleccion.values('id'))
+                .values_list(campo, flat=True)[:MUESTRA_ERRORES]
+            )
+            conflictivos = set(repetidos) | set(ocupados)
+            if conflictivos:
+                raise ErrorEdicionMasiva(
+                    f"Ya existirían artículos con el mismo {campo} en el estado '{estado.nombre}': "
+                    f"{', '.join(sorted(map(str, conflictivos)))}.",
+                    _muestra(con_valor.filter(**{f'{campo}__in': conflictivos})),
+                )
+
+
+def _describir(valor):
+    return '-' if valor is None else str(valor)
+
+
+def editar_articulos(seleccion, cambios, usuario, comentario=None, tamano_lote=TAMANO_LOTE_EDICION):
+    """
+    Aplica `cambios` (ver preparar_cambios) a los artículos de `seleccion` en una transacción:
+    bloquea la selección, valida las reglas por conjunto y escribe con un UPDATE por lote.
+    Un cambio de estado queda como movimiento 'Cambio de Estado' y el resto de los cambios
+    como una entrada 'Edicion' en HistorialStock, todo con bulk_create.
+    Devuelve la cantidad de artículos actualizados.
+    """
+    cambios = preparar_cambios(cambios)
+    valores = {campo: getattr(valor, 'pk', valor) for campo, valor in cambios.items()}
+    atributos = {Articulo._meta.get_field(campo).attname: valor for campo, valor in valores.items()}
+    nombres = {
+        campo: {valor.pk: valor.nombre} for campo, valor in cambios.items()
+        if CAMPOS_EDITABLES[campo] is not None and valor is not None
+    }
+
+    with transaction.atomic():
+        ids = list(seleccion.select_for_update().order_by('id').values_list('id', flat=True))
+        if not ids:
+            raise ErrorEdicionMasiva("Ningún artículo coincide con la selección.")
+        if len(ids) > MAXIMO_EDICION_MASIVA:
+            raise ErrorEdicionMasiva(f"Se pueden editar hasta {MAXIMO_EDICION_MASIVA} artículos por operación.")
+
+        validar_cambios(Articulo.objects.filter(id__in=ids), cambios)
+
+        # Nombres de los valores anteriores para describir el cambio en el historial
+        for campo, modelo in CAMPOS_EDITABLES.items():
+            if campo in cambios and modelo is not None:
+                anteriores = Articulo.objects.filter(id__in=ids).values(f'{campo}_id').distinct()
+                nombres.setdefault(campo, {}).update(
+                    modelo.objects.filter(pk__in=anteriores).values_list('pk', 'nombre')
+                )
+
+        ahora = timezone.now()
+        actualizados = 0
+        for inicio in range(0, len(ids), tamano_lote):
+            lote = ids[inicio:inicio + tamano_lote]
+            antes = list(
+                Articulo.objects.filter(id__in=lote)
+                .values(*{'id', 'stock_actual', 'ubicacion_id', *atributos})
+            )
+            actualizados += Articulo.objects.filter(id__in=lote).update(**atributos)
+            registrar_cambio_articulos()
+
+            movimientos = []
+            historial = []
+            for fila in antes:
+                diferencias = [
+                    (campo, fila[attname], atributos[attname])
+                    for campo, attname in ((c, Articulo._meta.get_field(c).attname) for c in cambios)
+                    if fila[attname] != atributos[attname]
+                ]
+                if not diferencias:
+                    continue
+                ubicacion_id = atributos.get('ubicacion_id', fila['ubicacion_id'])
+                for campo, anterior, nuevo in diferencias:
+                    if CAMPOS_EDITABLES[campo] is not None:
+                        anterior = nombres[campo].get(anterior)
+                        nuevo = nombres[campo].get(nuevo)
+                    texto = comentario or f"Edición masiva de {campo}: '{_describir(anterior)}' a '{_describir(nuevo)}'."
+                    if campo == 'estado':
+                        movimientos.append(Movimiento(
+                            articulo_id=fila['id'],
+                            tipo_movimiento='Cambio de Estado',
+                            cantidad=0,
+                            fecha=ahora,
+                            usuario=usuario,
+                            ubicacion_id=ubicacion_id,
+                            comentario=texto,
+                            estado_nuevo_id=atributos['estado_id'],
+                            estado_anterior_id=fila['estado_id'],
+                        ))
+                    historial.append(HistorialStock(
+                        articulo_id=fila['id'],
+                        tipo_movimiento='Cambio de Estado' if campo == 'estado' else 'Edicion',
+                        cantidad=0,
+                        stock_anterior=fila['stock_actual'],
+                        stock_actual=fila['stock_actual'],
+                        usuario=usuario,
+                        comentario=texto,
+                        ubicacion_id=ubicacion_id,
+                    ))
+            Movimiento.objects.bulk_create(movimientos)
+            HistorialStock.objects.bulk_create(historial)
+
+    logger.info(
+        f"Edición masiva por {usuario}: {actualizados} artículo(s), cambios en {', '.join(cambios)}."
+    )
+    return actualizados
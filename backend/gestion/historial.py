@@ -0,0 +1,257 @@
+# gestion/historial.py
+
+import csv
+import gzip
+import logging
+import os
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+TABLA = 'historial_stock'
+
+# Archivos de meses archivados: backups/historial_stock/historial_stock_AAAA_MM.<formato>
+DIRECTORIO_ARCHIVO = os.path.join(settings.BASE_DIR, 'backups', TABLA)
+
+# Columnas que se exportan; coinciden con los atributos del modelo HistorialStock
+COLUMNAS = [
+    'id', 'articulo_id', 'tipo_movimiento', 'cantidad', 'stock_anterior', 'stock_actual',
+    'fecha', 'usuario_id', 'comentario', 'motivo_id', 'ubicacion_id',
+]
+COLUMNAS_ENTERAS = {'id', 'articulo_id', 'cantidad', 'stock_anterior', 'stock_actual', 'usuario_id'}
+COLUMNAS_OPCIONALES = {'motivo_id', 'ubicacion_id'}
+
+EXTENSIONES = {'csv': '.csv.gz', 'parquet': '.parquet'}
+
+
+# ---------------------------------------------------------------------------
+# Particiones (solo PostgreSQL)
+# ---------------------------------------------------------------------------
+
+def es_postgresql(conexion=connection):
+    return conexion.vendor == 'postgresql'
+
+
+def inicio_mes(anio, mes):
+    return datetime(anio, mes, 1, tzinfo=dt_timezone.utc)
+
+
+def mes_siguiente(anio, mes):
+    return (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def nombre_particion(anio, mes):
+    return f"{TABLA}_p{anio:04d}_{mes:02d}"
+
+
+def esta_particionada(cursor):
+    cursor.execute(
+        "SELECT c.relkind = 'p' FROM pg_class c "
+        "WHERE c.oid = to_regclass(%s)",
+        [TABLA]
+    )
+    fila = cursor.fetchone()
+    return bool(fila and fila[0])
+
+
+def particiones_existentes(cursor):
+    """
+    Devuelve {(anio, mes): nombre} de las particiones mensuales adjuntas a la tabla.
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s)",
+        [TABLA]
+    )
+    particiones = {}
+    prefijo = f"{TABLA}_p"
+    for (nombre,) in cursor.fetchall():
+        if nombre.startswith(prefijo):
+            anio, mes = nombre[len(prefijo):].split('_')
+            particiones[(int(anio), int(mes))] = nombre
+    return particiones
+
+
+def crear_particion(cursor, anio, mes):
+    """
+    Crea la partición del mes si no existe. Las filas de ese mes que hubieran caído en la
+    partición por defecto se mueven a la nueva (PostgreSQL no permite crearla si no).
+    """
+    nombre = nombre_particion(anio, mes)
+    desde = inicio_mes(anio, mes)
+    hasta = inicio_mes(*mes_siguiente(anio, mes))
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [nombre])
+    if cursor.fetchone()[0]:
+        return False
+
+    cursor.execute(f"ALTER TABLE {TABLA} DETACH PARTITION {TABLA}_default")
+    cursor.execute(
+        f"CREATE TABLE {nombre} PARTITION OF {TABLA} FOR VALUES FROM (%s) TO (%s)",
+        [desde, hasta]
+    )
+    cursor.execute(
+        f"WITH movidas AS (DELETE FROM {TABLA}_default WHERE fecha >= %s AND fecha < %s RETURNING *) "
+        f"INSERT INTO {nombre} SELECT * FROM movidas",
+        [desde, hasta]
+    )
+    cursor.execute(f"ALTER TABLE {TABLA} ATTACH PARTITION {TABLA}_default DEFAULT")
+    logger.info(f"Partición creada: {nombre}")
+    return True
+
+
+def asegurar_particiones(meses_adelante=3, conexion=connection):
+    """
+    Crea las particiones del mes actual y de los `meses_adelante` siguientes.
+    No hace nada fuera de PostgreSQL o si la tabla no está particionada.
+    """
+    if not es_postgresql(conexion):
+        return []
+    creadas = []
+    with conexion.cursor() as cursor:
+        if not esta_particionada(cursor):
+            return []
+        hoy = datetime.now(dt_timezone.utc)
+        anio, mes = hoy.year, hoy.month
+        for _ in range(meses_adelante + 1):
+            if crear_particion(cursor, anio, mes):
+                creadas.append(nombre_particion(anio, mes))
+            anio, mes = mes_siguiente(anio, mes)
+    return creadas
+
+
+# ---------------------------------------------------------------------------
+# Archivo de meses antiguos
+# ---------------------------------------------------------------------------
+
+def ruta_archivo(anio, mes, formato):
+    return os.path.join(DIRECTORIO_ARCHIVO, f"{TABLA}_{anio:04d}_{mes:02d}{EXTENSIONES[formato]}")
+
+
+def meses_archivados():
+    """
+    Devuelve {(anio, mes): ruta} de los meses con archivo en backups/.
+    """
+    if not os.path.isdir(DIRECTORIO_ARCHIVO):
+        return {}
+    meses = {}
+    prefijo = f"{TABLA}_"
+    for nombre in os.listdir(DIRECTORIO_ARCHIVO):
+        for extension in EXTENSIONES.values():
+            if nombre.startswith(prefijo) and nombre.endswith(extension):
+                anio, mes = nombre[len(prefijo):-len(extension)].split('_')
+                meses[(int(anio), int(mes))] = os.path.join(DIRECTORIO_ARCHIVO, nombre)
+    return meses
+
+
+def _valor_exportado(fila, columna):
+    valor = fila[columna]
+    if columna == 'fecha':
+        return valor.isoformat()
+    return '' if valor is None else valor
+
+
+def escribir_archivo(filas, anio, mes, formato='csv'):
+    """
+    Escribe las filas (dicts con COLUMNAS) del mes en backups/. Se escribe a un archivo
+    temporal y se renombra al final para no dejar un archivo incompleto si algo falla.
+    Devuelve (ruta, cantidad de filas).
+    """
+    os.makedirs(DIRECTORIO_ARCHIVO, exist_ok=True)
+    ruta = ruta_archivo(anio, mes, formato)
+    temporal = f"{ruta}.tmp"
+    total = 0
+
+    if formato == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        columnas = {columna: [] for columna in COLUMNAS}
+        for fila in filas:
+            for columna in COLUMNAS:
+                columnas[columna].append(fila[columna])
+            total += 1
+        pq.write_table(pa.table(columnas), temporal, compression='zstd')
+    else:
+        with gzip.open(temporal, 'wt', encoding='utf-8', newline='') as destino:
+            escritor = csv.writer(destino)
+            escritor.writerow(COLUMNAS)
+            for fila in filas:
+                escritor.writerow([_valor_exportado(fila, columna) for columna in COLUMNAS])
+                total += 1
+
+    os.replace(temporal, ruta)
+    return ruta, total
+
+
+def _normalizar(fila):
+    for columna in COLUMNAS_ENTERAS | COLUMNAS_OPCIONALES:
+        valor = fila.get(columna)
+        fila[columna] = None if valor in ('', None) else int(valor)
+    if isinstance(fila['fecha'], str):
+        fila['fecha'] = datetime.fromisoformat(fila['fecha'])
+    if fila.get('comentario') == '':
+        fila['comentario'] = None
+    return fila
+
+
+def leer_archivo(ruta):
+    """
+    Genera las filas de un mes archivado como dicts con COLUMNAS.
+    """
+    if ruta.endswith(EXTENSIONES['parquet']):
+        import pyarrow.parquet as pq
+        for lote in pq.ParquetFile(ruta).iter_batches():
+            for fila in lote.to_pylist():
+                yield _normalizar(fila)
+    else:
+        with gzip.open(ruta, 'rt', encoding='utf-8', newline='') as origen:
+            for fila in csv.DictReader(origen):
+                yield _normalizar(fila)
+
+
+def meses_archivados_en_rango(desde=None, hasta=None):
+    """Meses archivados que se cruzan con [desde, hasta); un límite en None queda abierto."""
+    return [
+        (anio, mes) for anio, mes in sorted(meses_archivados())
+        if not (desde and inicio_mes(*mes_siguiente(anio, mes)) <= desde)
+        and not (hasta and inicio_mes(anio, mes) >= hasta)
+    ]
+
+
+def filas_archivadas(desde=None, hasta=None, articulo_id=None):
+    """
+    Filas de los meses archivados que se cruzan con [desde, hasta), opcionalmente de un
+    solo artículo.
+    """
+    for (anio, mes), ruta in sorted(meses_archivados().items()):
+        inicio, fin = inicio_mes(anio, mes), inicio_mes(*mes_siguiente(anio, mes))
+        if (desde and fin <= desde) or (hasta and inicio >= hasta):
+            continue
+        for fila in leer_archivo(ruta):
+            if articulo_id is not None and fila['articulo_id'] != articulo_id:
+                continue
+            if (desde and fila['fecha'] < desde) or (hasta and fila['fecha'] >= hasta):
+                continue
+            yield fila
+
+
+def eliminar_mes(anio, mes, conexion=connection):
+    """
+    Quita de la base de datos las filas de un mes ya archivado. En PostgreSQL se separa y
+    elimina la partición completa; en otros motores (o si las filas estaban en la
+    partición por defecto) se borran por rango de fechas.
+    """
+    desde = inicio_mes(anio, mes)
+    hasta = inicio_mes(*mes_siguiente(anio, mes))
+    with conexion.cursor() as cursor:
+        if es_postgresql(conexion) and esta_particionada(cursor):
+            nombre = particiones_existentes(cursor).get((anio, mes))
+            if nombre:
+                cursor.execute(f"ALTER TABLE {TABLA} DETACH PARTITION {nombre}")
+                cursor.execute(f"DROP TABLE {nombre}")
+                return
+        # El historial es de solo inserción: el borrado por archivo va directo a SQL
+        cursor.execute(f"DELETE FROM {TABLA} WHERE fecha >= %s AND fecha < %s", [desde, hasta])
@@ -0,0 +1,164 @@
+# gestion/idempotencia.py
+
+import functools
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import ClaveIdempotencia
+
+logger = logging.getLogger(__name__)
+
+CABECERA = 'Idempotency-Key'
+LARGO_MAXIMO_CLAVE = 255
+
+
+def huella_solicitud(request):
+    """
+    SHA-256 del método, la ruta con sus parámetros, los datos y el contenido de los
+    archivos adjuntos. Se calcula sobre los datos ya interpretados para no cargar en
+    memoria el cuerpo de una importación grande.
+    """
+    huella = hashlib.sha256()
+    huella.update(f"{request.method} {request.get_full_path()}\n".encode())
+
+    datos = request.data
+    if hasattr(datos, 'lists'):
+        datos = {campo: [v for v in valores if not isinstance(v, UploadedFile)] for campo, valores in datos.lists()}
+    huella.update(json.dumps(datos, sort_keys=True, cls=DjangoJSONEncoder, default=str).encode())
+
+    for campo, archivo in sorted(request.FILES.items()):
+        huella.update(f"\n{campo}:{archivo.name}:{archivo.size}\n".encode())
+        for parte in archivo.chunks():
+            huella.update(parte)
+        archivo.seek(0)
+    return huella.hexdigest()
+
+
+def _reservar(request, clave, endpoint, hash_solicitud):
+    """
+    Registra la clave como 'En proceso' (en su propia transacción, para que un reintento
+    simultáneo la vea) o devuelve la respuesta que corresponde si ya existía.
+    Devuelve (registro, respuesta); si respuesta no es None, no hay que ejecutar la vista.
+    """
+    ahora = timezone.now()
+    nuevos = {
+        'endpoint': endpoint,
+        'hash_solicitud': hash_solicitud,
+        'estado': 'En proceso',
+        'codigo_estado': None,
+        'respuesta': None,
+        'fecha_vencimiento': ahora + timedelta(hours=settings.IDEMPOTENCIA_TTL),
+    }
+    registro, creado = ClaveIdempotencia.objects.get_or_create(usuario=request.user, clave=clave, defaults=nuevos)
+    if creado:
+        return registro, None
+
+    abandonada = (
+        registro.estado == 'En proceso'
+        and registro.fecha_creacion < ahora - timedelta(seconds=settings.IDEMPOTENCIA_ABANDONO)
+    )
+    if registro.fecha_vencimiento <= ahora or abandonada:
+        # Se reutiliza solo si nadie más la tomó entre la lectura y esta actualización
+        tomada = ClaveIdempotencia.objects.filter(
+            pk=registro.pk, estado=registro.estado, fecha_creacion=registro.fecha_creacion
+        ).update(fecha_creacion=ahora, **nuevos)
+        if tomada:
+            registro.refresh_from_db()
+            return registro, None
+        registro.refresh_from_db()
+
+    if registro.endpoint != endpoint or registro.hash_solicitud != hash_solicitud:
+        return registro, Response(
+            {"error": f"La clave {CABECERA} ya se usó con una solicitud distinta."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if registro.estado == 'En proceso':
+        return registro, Response(
+            {"error": f"Una solicitud con la misma {CABECERA} todavía está en proceso."},
+            status=status.HTTP_409_CONFLICT
+        )
+    respuesta = Response(registro.respuesta, status=registro.codigo_estado)
+    respuesta['Idempotent-Replayed'] = 'true'
+    return registro, respuesta
+
+
+def _guardar(registro, respuesta):
+    datos = json.loads(json.dumps(respuesta.data, cls=DjangoJSONEncoder))
+    ClaveIdempotencia.objects.filter(pk=registro.pk).update(
+        estado='Completada', codigo_estado=respuesta.status_code, respuesta=datos
+    )
+
+
+def idempotente(vista=None, atomica=True):
+    """
+    Decorador para acciones de escritura de un ViewSet/APIView. Si la solicitud trae
+    Idempotency-Key, la respuesta queda guardada (por usuario y clave) y un reintento con
+    la misma clave y el mismo contenido la recibe de nuevo sin ejecutar la vista.
+
+    Con atomica=True la vista y el guardado de la respuesta ocurren en una misma
+    transacción: si el proceso muere a mitad, no queda ni la escritura ni la respuesta y
+    el reintento (pasado IDEMPOTENCIA_ABANDONO) la ejecuta de nuevo. Las importaciones,
+    que confirman por lotes, usan atomica=False.
+    Las respuestas 5xx y las excepciones no se guardan: la clave queda libre.
+    """
+    if vista is None:
+        return functools.partial(idempotente, atomica=atomica)
+
+    @functools.wraps(vista)
+    def envoltura(self, request, *args, **kwargs):
+        clave = request.headers.get(CABECERA)
+        if not clave or not request.user.is_authenticated:
+            return vista(self, request, *args, **kwargs)
+        if len(clave) > LARGO_MAXIMO_CLAVE:
+            return Response(
+                {"error": f"La cabecera {CABECERA} admite hasta {LARGO_MAXIMO_CLAVE} caracteres."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        endpoint = f"{request.method} {request.resolver_match.view_name if request.resolver_match else request.path}"
+        registro, respuesta = _reservar(request, clave, endpoint, huella_solicitud(request))
+        if respuesta is not None:
+            logger.info(f"Solicitud repetida con {CABECERA} {clave} en {endpoint}: {respuesta.status_code}.")
+            return respuesta
+
+        try:
+            if atomica:
+                with transaction.atomic():
+                    respuesta = vista(self, request, *args, **kwargs)
+                    if isinstance(respuesta, Response) and respuesta.status_code < 500:
+                        _guardar(registro, respuesta)
+            else:
+                respuesta = vista(self, request, *args, **kwargs)
+                if isinstance(respuesta, Response) and respuesta.status_code < 500:
+                    _guardar(registro, respuesta)
+        except Exception:
+            registro.delete()
+            raise
+        if not isinstance(respuesta, Response) or respuesta.status_code >= 500:
+            registro.delete()
+        return respuesta
+
+    return envoltura
+
+
+def purgar_claves_vencidas(tamano_lote=5000):
+    """Borra en lotes las claves vencidas. Devuelve cuántas se borraron."""
+    total = 0
+    while True:
+        ids = list(
+            ClaveIdempotencia.objects.filter(fecha_vencimiento__lte=timezone.now())
+            .order_by('fecha_vencimiento').values_list('id', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return total
+        total += ClaveIdempotencia.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,914 @@
+# gestion/importacion.py
+
+import csv
+import hashlib
+import io
+import logging
+import os
+
+from openpyxl import load_workbook
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Articulo, Categoria, Ubicacion, Marca, Modelo, EstadoArticulo, HistorialStock, Movimiento
+from .plantillas import obtener_catalogos, version_catalogos
+from .totales_catalogos import registrar_cambio_articulos, version_articulos
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_REQUERIDOS = ['nombre', 'stock_actual', 'stock_minimo', 'categoria', 'ubicacion']
+
+EJEMPLO_ESTRUCTURA = {
+    "nombre": "Ejemplo Artículo",
+    "stock_actual": 10,
+    "stock_minimo": 5,
+    "categoria": "Tecnología",
+    "ubicacion": "Bodega 1"
+}
+
+# Renombrar columnas para que coincidan con los nombres esperados en el código
+MAPEO_COLUMNAS = {
+    'Nombre': 'nombre',
+    'nombre': 'nombre',
+    'Stock_Actual': 'stock_actual',
+    'stock_actual': 'stock_actual',
+    'Stock_Minimo': 'stock_minimo',
+    'stock_minimo': 'stock_minimo',
+    'Categoría': 'categoria',
+    'categoría': 'categoria',
+    'Ubicación': 'ubicacion',
+    'ubicación': 'ubicacion',
+    'Marca': 'marca',
+    'marca': 'marca',
+    'Modelo': 'modelo',
+    'modelo': 'modelo',
+    'Estado': 'estado',
+    'estado': 'estado',
+    'N° Serie': 'numero_serie',
+    'n° serie': 'numero_serie',
+    'MAC': 'mac',
+    'mac': 'mac',
+    'Cód. Interno': 'codigo_interno',
+    'cód. interno': 'codigo_interno',
+    'Cód. Minvu': 'codigo_minvu',
+    'cód. minvu': 'codigo_minvu',
+    'Descripción': 'descripcion',
+    'descripción': 'descripcion',
+}
+
+CAMPOS_NUMERICOS = ['stock_actual', 'stock_minimo']
+
+CAMPOS_TEXTO = [
+    'nombre', 'categoria', 'ubicacion', 'estado', 'modelo', 'marca',
+    'numero_serie', 'codigo_minvu', 'codigo_interno', 'mac', 'descripcion'
+]
+
+# Campos que identifican un artículo existente
+CAMPOS_UNICOS = ['numero_serie', 'mac', 'codigo_interno', 'codigo_minvu']
+
+# Campos de catálogo (FK por nombre) y su modelo
+CATALOGOS = {
+    'categoria': Categoria,
+    'ubicacion': Ubicacion,
+    'marca': Marca,
+    'modelo': Modelo,
+    'estado': EstadoArticulo,
+}
+
+# Las previsualizaciones se guardan en caché por hash del archivo
+PREVIA_CACHE_PREFIJO = 'importacion:previa:'
+PREVIA_CACHE_TTL = 60 * 30
+
+# Tamaño de los lotes para consultas IN (...) y para escritura en bloque
+TAMANO_LOTE_CONSULTA = 500
+TAMANO_LOTE_ESCRITURA = 500
+# Bytes leídos para detectar el separador de un CSV
+TAMANO_MUESTRA_CSV = 64 * 1024
+
+# Campos que la importación escribe en Articulo
+CAMPOS_ESCRITURA = [
+    'nombre', 'stock_actual', 'stock_minimo', 'categoria', 'ubicacion', 'marca', 'modelo',
+    'estado', 'numero_serie', 'mac', 'codigo_interno', 'codigo_minvu', 'descripcion'
+]
+COMENTARIO_IMPORTACION = "Importación de artículos."
+
+ATRIBUTOS_ESCRITURA = [Articulo._meta.get_field(campo).attname for campo in CAMPOS_ESCRITURA]
+
+
+class ErrorImportacion(Exception):
+    """
+    Error que invalida el archivo completo. `datos` se devuelve tal cual en la respuesta.
+    """
+
+    def __init__(self, mensaje, datos=None):
+        super().__init__(mensaje)
+        self.datos = {"error": mensaje, **(datos or {})}
+
+
+class ErrorFila(Exception):
+    pass
+
+
+def hash_archivo(archivo):
+    """
+    SHA-256 del contenido de un archivo subido, leído por bloques.
+    """
+    digest = hashlib.sha256()
+    for bloque in archivo.chunks():
+        digest.update(bloque)
+    archivo.seek(0)
+    return digest.hexdigest()
+
+
+def extension_archivo(nombre):
+    return os.path.splitext(nombre)[1].lower()
+
+
+def validar_formato(nombre):
+    """
+    Verifica la extensión del archivo a importar.
+    """
+    if extension_archivo(nombre) not in LECTORES:
+        logger.warning("Formato de archivo no soportado para importación.")
+        raise ErrorImportacion("Formato no soportado. Usa archivos Excel (.xlsx), CSV (.csv) o Parquet (.parquet).")
+
+
+def _fila_vacia(valores):
+    return all(_es_vacio(v) or (isinstance(v, str) and not v.strip()) for v in valores)
+
+
+def filas_desde_excel(origen, mapear=None):
+    """
+    Genera (fila_num, dict) leyendo un .xlsx con openpyxl en modo read_only: las filas se
+    recorren en streaming, sin cargar la hoja completa en memoria.
+    `origen` puede ser una ruta o un archivo subido.
+    """
+    try:
+        wb = load_workbook(origen, read_only=True, data_only=True)
+    except Exception as e:
+        logger.error(f"Error al leer el archivo: {str(e)}")
+        raise ErrorImportacion(f"Error al leer el archivo: {str(e)}")
+
+    try:
+        filas = wb.worksheets[0].iter_rows(values_only=True)
+        encabezados = next(filas, None)
+        if encabezados is None:
+            raise ErrorImportacion("El archivo no contiene filas.")
+        columnas = (mapear or mapear_encabezados)(encabezados)
+        for fila_num, valores in enumerate(filas, 2):  # El encabezado está en la fila 1
+            if _fila_vacia(valores):
+                continue
+            yield fila_num, dict(zip(columnas, valores))
+    finally:
+        wb.close()
+
+
+def filas_desde_csv(origen, mapear=None):
+    """
+    Genera (fila_num, dict) leyendo un CSV en UTF-8 con el módulo csv, línea a línea.
+    El separador (',' o ';', como exporta Excel en configuración regional española) se
+    detecta con las primeras líneas. `origen` puede ser una ruta o un archivo subido.
+    """
+    if isinstance(origen, (str, os.PathLike)):
+        binario = open(origen, 'rb')
+    else:
+        origen.seek(0)
+        binario = origen.file if hasattr(origen, 'file') else origen
+
+    texto = io.TextIOWrapper(binario, encoding='utf-8-sig', newline='')
+    try:
+        muestra = texto.read(TAMANO_MUESTRA_CSV)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+
+        lector = csv.reader(texto, dialecto)
+        try:
+            encabezados = next(lector, None)
+            if encabezados is None:
+                raise ErrorImportacion("El archivo no contiene filas.")
+            columnas = (mapear or mapear_encabezados)(encabezados)
+            for valores in lector:
+                if _fila_vacia(valores):
+                    continue
+                # line_num cuenta líneas físicas, así los mensajes coinciden con el editor
+                yield lector.line_num, dict(zip(columnas, valores))
+        except (UnicodeDecodeError, csv.Error) as e:
+            logger.error(f"Error al leer el archivo: {str(e)}")
+            raise ErrorImportacion(f"Error al leer el archivo: {str(e)}")
+    finally:
+        # Separar el wrapper para no cerrar el archivo subido, que sigue siendo de Django
+        texto.detach()
+        if isinstance(origen, (str, os.PathLike)):
+            binario.close()
+
+
+def filas_desde_parquet(origen, mapear=None):
+    """
+    Genera (fila_num, dict) leyendo un .parquet. Con pyarrow se recorre por lotes de
+    registros; sin él se recurre a pandas (que necesita fastparquet).
+    La numeración supone el encabezado en la fila 1, igual que en Excel y CSV.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        pq = None
+
+    try:
+        if pq is not None:
+            archivo = pq.ParquetFile(origen)
+            columnas = (mapear or mapear_encabezados)(archivo.schema_arrow.names)
+            lotes = archivo.iter_batches(batch_size=TAMANO_LOTE_ESCRITURA)
+            registros = (
+                valores
+                for lote in lotes
+                for valores in zip(*(columna.to_pylist() for columna in lote.columns))
+            )
+        else:
+            import pandas as pd
+            df = pd.read_parquet(origen)
+            columnas = (mapear or mapear_encabezados)(df.columns)
+            registros = df.itertuples(index=False, name=None)
+    except ErrorImportacion:
+        raise
+    except ImportError:
+        raise ErrorImportacion("El servidor no tiene soporte para archivos Parquet (falta pyarrow).")
+    except Exception as e:
+        logger.error(f"Error al leer el archivo: {str(e)}")
+        raise ErrorImportacion(f"Error al leer el archivo: {str(e)}")
+
+    for fila_num, valores in enumerate(registros, 2):
+        if _fila_vacia(valores):
+            continue
+        yield fila_num, dict(zip(columnas, valores))
+
+
+# Lector de filas según la extensión del archivo
+LECTORES = {
+    '.xlsx': filas_desde_excel,
+    '.csv': filas_desde_csv,
+    '.parquet': filas_desde_parquet,
+}
+
+
+def filas_desde_archivo(origen, nombre, mapear=None):
+    """
+    Elige el lector por la extensión de `nombre`; todos entregan (fila_num, dict) con los
+    encabezados ya mapeados, así que comparten limpieza, validación y escritura.
+    `mapear` reemplaza a mapear_encabezados para archivos que no son de artículos.
+    """
+    validar_formato(nombre)
+    return LECTORES[extension_archivo(nombre)](origen, mapear)
+
+
+def mapear_encabezados(encabezados):
+    """
+    Limpia y renombra los encabezados; falla si falta alguna columna obligatoria.
+    """
+    columnas = [str(c).strip() if c is not None else '' for c in encabezados]
+    columnas = [MAPEO_COLUMNAS.get(c, c) for c in columnas]
+
+    faltantes = [col for col in CAMPOS_REQUERIDOS if col not in columnas]
+    if faltantes:
+        logger.warning(f"Faltan columnas obligatorias en el archivo: {', '.join(faltantes)}.")
+        raise ErrorImportacion(
+            f"Faltan columnas obligatorias: {', '.join(faltantes)}.",
+            {"ejemplo_formato": EJEMPLO_ESTRUCTURA}
+        )
+    logger.debug(f"Columnas después de renombrar: {columnas}")
+    return columnas
+
+
+def _es_vacio(valor):
+    # `valor != valor` detecta NaN y NaT sin depender del tipo concreto
+    return valor is None or valor != valor
+
+
+def _a_entero(valor):
+    if _es_vacio(valor) or valor == '':
+        return 0
+    if isinstance(valor, bool):
+        return int(valor)
+    try:
+        numero = float(valor) if not isinstance(valor, (int, float)) else valor
+    except (TypeError, ValueError):
+        return 0
+    if numero != numero or numero in (float('inf'), float('-inf')):
+        return 0
+    return int(numero)
+
+
+def limpiar_fila(fila):
+    """
+    Normaliza tipos de una fila cruda: números a int (0 si no es válido), textos sin
+    espacios y campos únicos vacíos como None.
+    """
+    limpia = {}
+    for campo in CAMPOS_NUMERICOS:
+        if campo in fila:
+            limpia[campo] = _a_entero(fila[campo])
+    for campo in CAMPOS_TEXTO:
+        if campo in fila:
+            valor = fila[campo]
+            texto = '' if _es_vacio(valor) else str(valor).strip()
+            if campo in CAMPOS_UNICOS and not texto:
+                texto = None
+            limpia[campo] = texto
+    return limpia
+
+
+def validar_fila(fila_num, fila):
+    """
+    Valida los campos requeridos de una fila limpia y devuelve los valores tipados.
+    Lanza ErrorFila con el mensaje que se reporta al usuario.
+    """
+    nombre_val = fila.get('nombre')
+    stock_actual_val = fila.get('stock_actual')
+    stock_minimo_val = fila.get('stock_minimo')
+    categoria_val = fila.get('categoria')
+    ubicacion_val = fila.get('ubicacion')
+
+    if not nombre_val or stock_actual_val is None or stock_minimo_val is None or not categoria_val or not ubicacion_val:
+        logger.warning(f"Fila {fila_num}: Faltan campos requeridos. Se omitirá esta fila.")
+        raise ErrorFila(
+            f"Fila {fila_num}: Faltan uno o más campos requeridos (nombre, stock_actual, stock_minimo, categoria, ubicacion)."
+        )
+
+    try:
+        stock_actual_int = int(stock_actual_val)
+        stock_minimo_int = int(stock_minimo_val)
+        if stock_actual_int < 0:
+            raise ValueError("El stock actual no puede ser negativo.")
+        if stock_minimo_int < 0:
+            raise ValueError("El stock mínimo no puede ser negativo.")
+    except Exception as e:
+        logger.error(f"Fila {fila_num}: Error al convertir datos requeridos - {str(e)}.")
+        raise ErrorFila(f"Fila {fila_num}: Error al convertir datos requeridos - {str(e)}.")
+
+    def opcional(campo):
+        valor = fila.get(campo)
+        return valor.strip() if isinstance(valor, str) and valor.strip() else None
+
+    return {
+        'nombre': str(nombre_val).strip(),
+        'stock_actual': stock_actual_int,
+        'stock_minimo': stock_minimo_int,
+        'categoria': str(categoria_val).strip(),
+        'ubicacion': str(ubicacion_val).strip(),
+        'marca': opcional('marca'),
+        'modelo': opcional('modelo'),
+        'estado': opcional('estado'),
+        'numero_serie': opcional('numero_serie'),
+        'mac': opcional('mac'),
+        'codigo_interno': opcional('codigo_interno'),
+        'codigo_minvu': opcional('codigo_minvu'),
+        'descripcion': opcional('descripcion'),
+    }
+
+
+class ResolutorCatalogos:
+    """
+    Resuelve nombres de catálogo a objetos usando una caché precargada, sin distinguir
+    mayúsculas. Los nombres que faltan se crean por lote con asegurar(): un
+    bulk_create(ignore_conflicts=True) y una relectura por modelo, en lugar de un
+    get_or_create por fila.
+    """
+
+    def __init__(self):
+        # Optimizar consultas a la base de datos cargando en caché
+        self.caches = {
+            campo: {obj.nombre.lower(): obj for obj in modelo.objects.all()}
+            for campo, modelo in CATALOGOS.items()
+        }
+
+    @staticmethod
+    def normalizar(valor):
+        return str(valor).strip() if valor else ''
+
+    def asegurar(self, filas_datos):
+        """
+        Crea los nombres de catálogo de `filas_datos` que todavía no existen. Se guarda
+        la primera forma en que aparece cada nombre en el archivo; los nombres más largos
+        que la columna no se crean y resolver() los informa como error de la fila.
+        """
+        faltantes = {campo: {} for campo in CATALOGOS}
+        for datos in filas_datos:
+            for campo in CATALOGOS:
+                nombre = self.normalizar(datos.get(campo))
+                if nombre and nombre.lower() not in self.caches[campo]:
+                    faltantes[campo].setdefault(nombre.lower(), nombre)
+
+        for campo, nombres in faltantes.items():
+            modelo = CATALOGOS[campo]
+            largo = modelo._meta.get_field('nombre').max_length
+            nombres = [nombre for nombre in nombres.values() if len(nombre) <= largo]
+            if not nombres:
+                continue
+            # Si otra importación creó el mismo nombre a la vez (con cualquier mayúscula), el
+            # índice único LOWER(nombre) hace que se ignore y la relectura trae esa fila
+            modelo.objects.bulk_create([modelo(nombre=nombre) for nombre in nombres], ignore_conflicts=True)
+            for obj in modelo.objects.por_nombres(nombres):
+                self.caches[campo].setdefault(obj.nombre.lower(), obj)
+            logger.info(f"{modelo.__name__}: {len(nombres)} nombres nuevos en la importación: {', '.join(nombres[:20])}")
+
+    def resolver(self, campo, valor, fila_num=None):
+        nombre = self.normalizar(valor)
+        if not nombre:
+            return None
+        obj = self.caches[campo].get(nombre.lower())
+        if obj is None:
+            raise ErrorFila(
+                _error_largo_catalogo(campo, nombre, fila_num)
+                or f"Fila {fila_num}: no se pudo crear {campo} '{nombre}'."
+            )
+        return obj
+
+
+def _error_largo_catalogo(campo, nombre, fila_num):
+    largo = CATALOGOS[campo]._meta.get_field('nombre').max_length
+    if len(nombre) > largo:
+        return f"Fila {fila_num}: {campo} '{nombre[:40]}...' supera los {largo} caracteres."
+    return None
+
+
+def _agrupar(iterable, tamano):
+    lote = []
+    for elemento in iterable:
+        lote.append(elemento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _condiciones_unicos(filas_validas):
+    """
+    Genera condiciones Q (por conjuntos) para buscar los artículos que coinciden con
+    algún campo único de las filas.
+    """
+    valores = {campo: set() for campo in CAMPOS_UNICOS}
+    for _, datos in filas_validas:
+        for campo in CAMPOS_UNICOS:
+            if datos[campo]:
+                valores[campo].add(datos[campo])
+
+    lotes = [(campo, lote) for campo in CAMPOS_UNICOS for lote in _en_lotes(valores[campo])]
+    # Agrupar varios campos por consulta mientras no se supere el tamaño del lote
+    for inicio in range(0, len(lotes), 4):
+        condicion = Q()
+        for campo, lote in lotes[inicio:inicio + 4]:
+            condicion |= Q(**{f"{campo}__in": lote})
+        yield condicion
+
+
+def importar_filas(filas, usuario, continue_on_errors=True, tamano_lote=TAMANO_LOTE_ESCRITURA):
+    """
+    Crea o actualiza artículos a partir de filas (fila_num, dict).
+    Un artículo existente se identifica por cualquiera de sus campos únicos.
+    Las filas se procesan en lotes: cada lote se resuelve con consultas por conjuntos y
+    se escribe con bulk_create/bulk_update, por lo que la memoria no crece con el archivo.
+    Cada cambio de stock queda registrado como movimiento de `usuario` (ver conciliación).
+    """
+    resolutor = ResolutorCatalogos()
+    resultado = {
+        "creados": 0,
+        "actualizados": 0,
+        "omitidos": 0,
+        "errores": [],
+    }
+
+    for lote in _agrupar(filas, tamano_lote):
+        if not _importar_lote(lote, resolutor, resultado, continue_on_errors, usuario):
+            break
+
+    return resultado
+
+
+def _importar_lote(lote, resolutor, resultado, continue_on_errors, usuario):
+    """
+    Importa un lote de filas. Devuelve False si la importación debe detenerse.
+    """
+    def registrar_error(mensaje):
+        resultado['errores'].append(mensaje)
+        resultado['omitidos'] += 1
+
+    # 1) Validar filas y resolver catálogos (los que faltan se crean una vez por lote)
+    validas = []
+    detener = False
+    for fila_num, fila_cruda in lote:
+        logger.debug(f"Procesando fila {fila_num}: {fila_cruda}")
+        try:
+            validas.append((fila_num, validar_fila(fila_num, limpiar_fila(fila_cruda))))
+            continue
+        except ErrorFila as e:
+            registrar_error(str(e))
+        if not continue_on_errors:
+            detener = True
+            break
+
+    resolutor.asegurar(datos for _, datos in validas)
+    preparadas = []
+    for fila_num, datos in validas:
+        try:
+            fks = {campo: resolutor.resolver(campo, datos[campo], fila_num) for campo in CATALOGOS}
+        except ErrorFila as e:
+            registrar_error(str(e))
+            if not continue_on_errors:
+                detener = True
+                break
+            continue
+        preparadas.append((fila_num, datos, fks))
+
+    # 2) Cargar los artículos existentes que coinciden con algún campo único
+    existentes = {}
+    for condicion in _condiciones_unicos([(fila_num, datos) for fila_num, datos, _ in preparadas]):
+        for articulo in Articulo.objects.filter(condicion).select_related('categoria'):
+            existentes[articulo.id] = articulo
+
+    indice = {campo: {} for campo in CAMPOS_UNICOS}
+    for articulo_id in sorted(existentes):
+        for campo in CAMPOS_UNICOS:
+            valor = getattr(existentes[articulo_id], campo)
+            if valor:
+                indice[campo].setdefault(valor, existentes[articulo_id])
+
+    # 3) Aplicar cada fila en memoria (una fila posterior puede actualizar un artículo
+    #    creado por una fila anterior del mismo lote)
+    operaciones = []
+    stock_inicial = {}
+    for fila_num, datos, fks in preparadas:
+        coincidencias = [indice[campo][datos[campo]] for campo in CAMPOS_UNICOS if datos[campo] in indice[campo]]
+        guardados = [a for a in coincidencias if a.pk is not None]
+        if guardados:
+            articulo = min(guardados, key=lambda a: a.pk)
+        else:
+            articulo = coincidencias[0] if coincidencias else None
+
+        es_nuevo = articulo is None
+        if es_nuevo:
+            articulo = Articulo()
+        stock_inicial.setdefault(id(articulo), articulo.stock_actual)
+        # Copia por attname (categoria_id, ...) para no cargar los objetos relacionados
+        anterior = {campo: getattr(articulo, campo) for campo in ATRIBUTOS_ESCRITURA}
+
+        articulo.nombre = datos['nombre']
+        articulo.stock_actual = datos['stock_actual']
+        articulo.stock_minimo = datos['stock_minimo']
+        for campo in CATALOGOS:
+            setattr(articulo, campo, fks[campo])
+        for campo in CAMPOS_UNICOS + ['descripcion']:
+            if datos[campo] or es_nuevo:
+                setattr(articulo, campo, datos[campo])
+
+        try:
+            # Validaciones sin consultas: longitudes y reglas de categoría (Articulo.clean)
+            articulo.clean_fields(exclude=list(CATALOGOS))
+            articulo.clean()
+        except ValidationError as e:
+            for campo, valor in anterior.items():
+                setattr(articulo, campo, valor)
+            accion = "crear" if es_nuevo else "actualizar"
+            logger.error(f"Fila {fila_num}: Error al {accion} el artículo - {str(e)}.")
+            registrar_error(f"Fila {fila_num}: Error al {accion} el artículo - {str(e)}.")
+            if not continue_on_errors:
+                detener = True
+                break
+            continue
+
+        operaciones.append((fila_num, articulo, es_nuevo))
+        for campo in CAMPOS_UNICOS:
+            valor = getattr(articulo, campo)
+            if valor:
+                indice[campo].setdefault(valor, articulo)
+
+    # 4) Escribir el lote
+    nuevos = list({id(a): a for _, a, es_nuevo in operaciones if es_nuevo}.values())
+    modificados = list({id(a): a for _, a, es_nuevo in operaciones if not es_nuevo and a.pk is not None}.values())
+    try:
+        with transaction.atomic():
+            Articulo.objects.bulk_create(nuevos)
+            Articulo.objects.bulk_update(modificados, CAMPOS_ESCRITURA)
+            registrar_cambio_articulos()
+            _registrar_movimientos(nuevos + modificados, stock_inicial, usuario, {id(a) for a in nuevos})
+    except IntegrityError as ie:
+        logger.warning(f"Conflicto de integridad en el lote ({str(ie)}); se guardará fila por fila.")
+        for articulo in nuevos:
+            articulo.pk = None
+            articulo._state.adding = True
+        return _guardar_fila_por_fila(operaciones, resultado, continue_on_errors, stock_inicial, usuario) and not detener
+
+    for _, _, es_nuevo in operaciones:
+        resultado['creados' if es_nuevo else 'actualizados'] += 1
+    logger.info(f"Lote importado: {len(nuevos)} artículos creados, {len(modificados)} actualizados.")
+    return not detener
+
+
+def _registrar_movimientos(articulos, stock_inicial, usuario, creados):
+    """
+    Registra como movimientos (y su historial) los cambios de stock de la importación, para
+    que el stock siga coincidiendo con el libro de movimientos: 'Nuevo Articulo' para los
+    artículos creados con stock y 'Entrada'/'Salida' por la diferencia en los actualizados.
+    `creados` es el conjunto de id() de los artículos nuevos.
+    """
+    movimientos = []
+    historial = []
+    ahora = timezone.now()
+    for articulo in articulos:
+        anterior = stock_inicial[id(articulo)]
+        diferencia = articulo.stock_actual - anterior
+        if diferencia == 0:
+            continue
+        if id(articulo) in creados:
+            tipo = 'Nuevo Articulo'
+        else:
+            tipo = 'Entrada' if diferencia > 0 else 'Salida'
+        movimientos.append(Movimiento(
+            articulo=articulo, tipo_movimiento=tipo, cantidad=abs(diferencia), fecha=ahora,
+            usuario=usuario, ubicacion_id=articulo.ubicacion_id, comentario=COMENTARIO_IMPORTACION,
+        ))
+        historial.append(HistorialStock(
+            articulo=articulo, tipo_movimiento=tipo, cantidad=abs(diferencia), stock_anterior=anterior,
+            stock_actual=articulo.stock_actual, usuario=usuario, comentario=COMENTARIO_IMPORTACION,
+            ubicacion_id=articulo.ubicacion_id,
+        ))
+        # Una fila posterior que vuelva a tocar el artículo registra solo su propia diferencia
+        stock_inicial[id(articulo)] = articulo.stock_actual
+    Movimiento.objects.bulk_create(movimientos)
+    HistorialStock.objects.bulk_create(historial)
+
+
+def _guardar_fila_por_fila(operaciones, resultado, continue_on_errors, stock_inicial, usuario):
+    """
+    Camino lento para un lote con conflictos: guarda cada artículo con su propia
+    validación completa para reportar el error de la fila que corresponde.
+    """
+    guardados = set()
+    for fila_num, articulo, es_nuevo in operaciones:
+        if id(articulo) in guardados:
+            resultado['creados' if es_nuevo else 'actualizados'] += 1
+            continue
+        accion = "crear" if articulo.pk is None else "actualizar"
+        try:
+            with transaction.atomic():
+                articulo.save()
+                creados = {id(articulo)} if accion == "crear" else set()
+                _registrar_movimientos([articulo], stock_inicial, usuario, creados)
+        except IntegrityError as ie:
+            mensaje = f"Fila {fila_num}: Error de integridad al {accion} el artículo - {str(ie)}."
+        except Exception as e:
+            mensaje = f"Fila {fila_num}: Error al {accion} el artículo - {str(e)}."
+        else:
+            guardados.add(id(articulo))
+            resultado['creados' if es_nuevo else 'actualizados'] += 1
+            continue
+        logger.error(mensaje)
+        resultado['errores'].append(mensaje)
+        resultado['omitidos'] += 1
+        if not continue_on_errors:
+            return False
+    return True
+
+
+# -------------------------------------------------------------------
+# Previsualización (dry run)
+# -------------------------------------------------------------------
+
+CAMPOS_COMPARADOS = [
+    'nombre', 'stock_actual', 'stock_minimo', 'categoria', 'ubicacion', 'marca', 'modelo',
+    'estado', 'numero_serie', 'mac', 'codigo_interno', 'codigo_minvu', 'descripcion'
+]
+
+
+def _en_lotes(valores, tamano=TAMANO_LOTE_CONSULTA):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio:inicio + tamano]
+
+
+def _articulos_coincidentes(filas_validas):
+    """
+    Carga, con consultas por conjuntos, los artículos que coinciden con algún campo único
+    de las filas. Devuelve {id: datos} con los nombres de catálogo ya resueltos.
+    """
+    articulos = {}
+    for condicion in _condiciones_unicos(filas_validas):
+        consulta = Articulo.objects.filter(condicion).values(
+            'id', 'nombre', 'stock_actual', 'stock_minimo', 'numero_serie', 'mac',
+            'codigo_interno', 'codigo_minvu', 'descripcion', 'categoria__nombre',
+            'ubicacion__nombre', 'marca__nombre', 'modelo__nombre', 'estado__nombre',
+        )
+        for fila in consulta:
+            articulos[fila['id']] = {
+                'nombre': fila['nombre'],
+                'stock_actual': fila['stock_actual'],
+                'stock_minimo': fila['stock_minimo'],
+                'categoria': fila['categoria__nombre'],
+                'ubicacion': fila['ubicacion__nombre'],
+                'marca': fila['marca__nombre'],
+                'modelo': fila['modelo__nombre'],
+                'estado': fila['estado__nombre'],
+                'numero_serie': fila['numero_serie'],
+                'mac': fila['mac'],
+                'codigo_interno': fila['codigo_interno'],
+                'codigo_minvu': fila['codigo_minvu'],
+                'descripcion': fila['descripcion'],
+            }
+    return articulos
+
+
+def _error_reglas_categoria(datos, categoria):
+    """
+    Replica Articulo.clean para predecir filas que fallarían al guardar.
+    """
+    if categoria:
+        if categoria['requiere_codigo_interno'] and not datos['codigo_interno']:
+            return "El código interno es obligatorio para esta categoría."
+        if categoria['requiere_codigo_minvu'] and not datos['codigo_minvu']:
+            return "El código Minvu es obligatorio para esta categoría."
+        if categoria['requiere_numero_serie'] and not datos['numero_serie']:
+            return "El número de serie es obligatorio para esta categoría."
+        if categoria['requiere_mac'] and not datos['mac']:
+            return "El MAC Address es obligatorio para esta categoría."
+    if datos['categoria'] in ["Torre", "PC"] and not datos['mac']:
+        return "El campo MAC Address es obligatorio para artículos de categoría Torre o PC."
+    return None
+
+
+def _error_campos(valores, fila_num, accion):
+    """
+    Replica el clean_fields de importar_filas (longitudes y formatos) sobre los valores
+    que tendría el artículo.
+    """
+    articulo = Articulo(**{campo: valores[campo] for campo in CAMPOS_COMPARADOS if campo not in CATALOGOS})
+    try:
+        articulo.clean_fields(exclude=list(CATALOGOS))
+    except ValidationError as e:
+        return f"Fila {fila_num}: Error al {accion} el artículo - {str(e)}."
+    return None
+
+
+def previsualizar_filas(filas):
+    """
+    Calcula qué crearía, actualizaría o rechazaría la importación sin escribir en la
+    base de datos. Todas las filas se resuelven con un número acotado de consultas.
+    """
+    filas_validas = []
+    reporte = []
+    for fila_num, fila_cruda in filas:
+        try:
+            filas_validas.append((fila_num, validar_fila(fila_num, limpiar_fila(fila_cruda))))
+        except ErrorFila as e:
+            reporte.append({'fila': fila_num, 'accion': 'rechazar', 'error': str(e)})
+
+    catalogos = {
+        campo: set(nombre.lower() for nombre in modelo.objects.values_list('nombre', flat=True))
+        for campo, modelo in CATALOGOS.items()
+    }
+    reglas_categoria = {
+        c['nombre'].lower(): c for c in Categoria.objects.values(
+            'nombre', 'requiere_codigo_interno', 'requiere_codigo_minvu',
+            'requiere_numero_serie', 'requiere_mac'
+        )
+    }
+    articulos = _articulos_coincidentes(filas_validas)
+
+    # Índice valor único -> id; se actualiza a medida que el archivo crea o modifica artículos
+    indice = {campo: {} for campo in CAMPOS_UNICOS}
+    for articulo_id in sorted(articulos):
+        for campo in CAMPOS_UNICOS:
+            valor = articulos[articulo_id][campo]
+            if valor:
+                indice[campo].setdefault(valor, articulo_id)
+
+    catalogos_nuevos = {campo: {} for campo in CATALOGOS}
+    siguiente_nuevo = 0
+
+    for fila_num, datos in filas_validas:
+        error = _error_reglas_categoria(datos, reglas_categoria.get(datos['categoria'].lower()))
+        if error:
+            reporte.append({'fila': fila_num, 'accion': 'rechazar', 'nombre': datos['nombre'], 'error': f"Fila {fila_num}: {error}"})
+            continue
+
+        error = next(filter(None, (
+            _error_largo_catalogo(campo, datos[campo], fila_num) for campo in CATALOGOS if datos[campo]
+        )), None)
+        coincidencias = [indice[campo][datos[campo]] for campo in CAMPOS_UNICOS if datos[campo] in indice[campo]]
+        # Los artículos existentes (ids enteros) tienen prioridad sobre los creados en este archivo
+        existentes = [c for c in coincidencias if isinstance(c, int)]
+        articulo_id = min(existentes) if existentes else (coincidencias[0] if coincidencias else None)
+
+        if articulo_id is not None:
+            actual = articulos[articulo_id]
+            nuevo = dict(actual)
+            for campo in ['nombre', 'stock_actual', 'stock_minimo']:
+                nuevo[campo] = datos[campo]
+            for campo in CATALOGOS:
+                # Los catálogos existentes conservan su capitalización original
+                nuevo[campo] = datos[campo]
+                if datos[campo] and actual[campo] and datos[campo].lower() == actual[campo].lower():
+                    nuevo[campo] = actual[campo]
+            for campo in CAMPOS_UNICOS + ['descripcion']:
+                if datos[campo]:
+                    nuevo[campo] = datos[campo]
+        else:
+            nuevo = {campo: datos[campo] for campo in CAMPOS_COMPARADOS}
+
+        # Mismas validaciones que la importación real: largo de los catálogos y clean_fields
+        error = error or _error_campos(nuevo, fila_num, "crear" if articulo_id is None else "actualizar")
+        if error:
+            reporte.append({'fila': fila_num, 'accion': 'rechazar', 'nombre': datos['nombre'], 'error': error})
+            continue
+
+        for campo in CATALOGOS:
+            nombre = datos[campo]
+            if nombre and nombre.lower() not in catalogos[campo]:
+                catalogos_nuevos[campo].setdefault(nombre.lower(), nombre)
+
+        if articulo_id is None:
+            siguiente_nuevo += 1
+            clave = f"nuevo-{siguiente_nuevo}"
+            articulos[clave] = nuevo
+            for campo in CAMPOS_UNICOS:
+                if datos[campo]:
+                    indice[campo].setdefault(datos[campo], clave)
+            reporte.append({'fila': fila_num, 'accion': 'crear', 'nombre': datos['nombre']})
+            continue
+
+        cambios = {campo: [actual[campo], nuevo[campo]] for campo in CAMPOS_COMPARADOS if actual[campo] != nuevo[campo]}
+        articulos[articulo_id] = nuevo
+        for campo in CAMPOS_UNICOS:
+            if nuevo[campo]:
+                indice[campo].setdefault(nuevo[campo], articulo_id)
+
+        reporte.append({
+            'fila': fila_num,
+            'accion': 'actualizar' if cambios else 'sin_cambios',
+            'articulo': articulo_id if isinstance(articulo_id, int) else None,
+            'nombre': datos['nombre'],
+            'cambios': cambios,
+        })
+
+    reporte.sort(key=lambda r: r['fila'])
+    resumen = {accion: 0 for accion in ('crear', 'actualizar', 'sin_cambios', 'rechazar')}
+    for fila in reporte:
+        resumen[fila['accion']] += 1
+
+    return {
+        'total_filas': len(reporte),
+        'resumen': resumen,
+        'catalogos_nuevos': {campo: sorted(nombres.values()) for campo, nombres in catalogos_nuevos.items() if nombres},
+        'generado': timezone.now().isoformat(),
+        'reporte': reporte,
+    }
+
+
+def _clave_previsualizacion(hash_contenido):
+    """
+    La previsualización depende del archivo y de los datos contra los que se compara: la
+    clave incluye la huella de los catálogos y la versión de los artículos, así que
+    cualquier cambio posterior obliga a recalcularla.
+    """
+    catalogos = version_catalogos(obtener_catalogos())
+    return f"{PREVIA_CACHE_PREFIJO}{hash_contenido}:{catalogos}:{version_articulos()}"
+
+
+def obtener_previsualizacion(hash_contenido, calcular):
+    """
+    Devuelve la previsualización en caché para este contenido o la calcula con `calcular()`.
+    """
+    clave = _clave_previsualizacion(hash_contenido)
+    previa = cache.get(clave)
+    if previa is not None:
+        logger.info(f"Previsualización de importación servida desde caché ({hash_contenido[:12]}).")
+        return previa, True
+    previa = calcular()
+    cache.set(clave, previa, PREVIA_CACHE_TTL)
+    return previa, False
+
+
+def previsualizacion_en_cache(hash_contenido):
+    return cache.get(_clave_previsualizacion(hash_contenido))
+
+
+def reporte_csv(previa):
+    """
+    Reporte por fila de una previsualización en formato CSV.
+    """
+    salida = io.StringIO()
+    writer = csv.writer(salida)
+    writer.writerow(['fila', 'accion', 'articulo', 'nombre', 'cambios', 'error'])
+    for fila in previa['reporte']:
+        cambios = '; '.join(
+            f"{campo}: {antes!r} -> {despues!r}" for campo, (antes, despues) in fila.get('cambios', {}).items()
+        )
+        writer.writerow([
+            fila['fila'], fila['accion'], fila.get('articulo') or '', fila.get('nombre') or '',
+            cambios, fila.get('error') or ''
+        ])
+    return salida.getvalue()
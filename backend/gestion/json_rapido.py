@@ -0,0 +1,126 @@
+# gestion/json_rapido.py
+
+import json
+
+from rest_framework import relations, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa json de la biblioteca estándar
+    orjson = None
+
+# Filas que se leen por viaje a la base de datos al transmitir un listado
+TAMANO_LOTE_STREAMING = 2000
+
+# Campos cuyo to_representation devuelve el mismo valor que entrega values()
+CAMPOS_IDENTIDAD = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+_SEPARADORES_JS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+if orjson is not None:
+    _OPCIONES_ORJSON = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    _codificador_drf = encoders.JSONEncoder()
+
+
+def codificar(datos):
+    """
+    JSON compacto en bytes, igual al de JSONRenderer con la configuración por defecto de
+    DRF (UTF-8 sin escapar, separadores cortos, U+2028/U+2029 escapados). Fechas, decimales
+    y demás tipos no nativos pasan por el JSONEncoder de DRF.
+    """
+    if orjson is not None:
+        contenido = orjson.dumps(datos, default=_codificador_drf.default, option=_OPCIONES_ORJSON)
+    else:
+        contenido = json.dumps(
+            datos, cls=encoders.JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':')
+        ).encode()
+    for separador, escapado in _SEPARADORES_JS:
+        if separador in contenido:
+            contenido = contenido.replace(separador, escapado)
+    return contenido
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """
+    JSONRenderer que codifica con orjson cuando está instalado. Con indentación (API
+    navegable o 'application/json; indent=4') o con una configuración de JSON distinta a
+    la por defecto usa el renderer de DRF.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            self.ensure_ascii or not self.compact or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return codificar(data)
+
+
+def plan_valores(serializer, modelo):
+    """
+    Traduce los campos de lectura de `serializer` a columnas de values():
+    [(nombre_salida, columna, conversor o None)]. Devuelve None si algún campo no se puede
+    leer directamente de una columna (métodos, anidados, relaciones múltiples...), en cuyo
+    caso hay que usar el serializador.
+    """
+    plan = []
+    for nombre, campo in serializer.fields.items():
+        if campo.write_only:
+            continue
+        if '.' in campo.source or campo.source == '*':
+            return None
+        try:
+            campo_modelo = modelo._meta.get_field(campo.source)
+        except Exception:
+            return None
+        if not campo_modelo.concrete:
+            return None
+
+        if isinstance(campo, relations.PrimaryKeyRelatedField):
+            if campo.pk_field is not None:
+                return None
+            plan.append((nombre, campo_modelo.attname, None))
+        elif isinstance(campo, (serializers.SerializerMethodField, relations.RelatedField, serializers.BaseSerializer)):
+            return None
+        elif isinstance(campo, CAMPOS_IDENTIDAD) and not isinstance(campo, serializers.ChoiceField):
+            plan.append((nombre, campo_modelo.attname, None))
+        else:
+            plan.append((nombre, campo_modelo.attname, campo.to_representation))
+    return plan
+
+
+def filas_valores(queryset, plan, iterar=False):
+    """
+    Dicts listos para serializar, leídos con values() sin instanciar modelos. Como en
+    Serializer.to_representation, un None se entrega tal cual sin pasar por el conversor.
+    """
+    columnas = list(dict.fromkeys(columna for _, columna, _ in plan))
+    filas = queryset.values_list(*columnas)
+    if iterar:
+        filas = filas.iterator(chunk_size=TAMANO_LOTE_STREAMING)
+    posiciones = {columna: posicion for posicion, columna in enumerate(columnas)}
+    indices = [(nombre, posiciones[columna], conversor) for nombre, columna, conversor in plan]
+    for fila in filas:
+        yield {
+            nombre: (None if fila[i] is None else conversor(fila[i])) if conversor else fila[i]
+            for nombre, i, conversor in indices
+        }
+
+
+def transmitir_arreglo(filas, tamano_lote=TAMANO_LOTE_STREAMING):
+    """Genera un arreglo JSON por partes, idéntico a codificar(list(filas))."""
+    yield b'['
+    primero = True
+    lote = []
+    for fila in filas:
+        lote.append(codificar(fila))
+        if len(lote) == tamano_lote:
+            yield (b'' if primero else b',') + b','.join(lote)
+            primero = False
+            lote = []
+    if lote:
+        yield (b'' if primero else b',') + b','.join(lote)
+    yield b']'
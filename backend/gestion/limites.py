@@ -0,0 +1,145 @@
+# gestion/limites.py
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+PERIODOS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def interpretar_tasa(tasa):
+    """
+    '120/min' -> (capacidad, tokens_por_segundo) = (120, 2.0): la cubeta admite ráfagas
+    de hasta 120 peticiones y se rellena de forma continua a 120 por minuto.
+    """
+    if tasa is None:
+        return None
+    cantidad, periodo = tasa.split('/')
+    capacidad = int(cantidad)
+    return capacidad, capacidad / PERIODOS[periodo[0]]
+
+
+def _rellenar(tokens, marca, ahora, capacidad, por_segundo):
+    return min(capacidad, tokens + max(ahora - marca, 0) * por_segundo)
+
+
+class AlmacenLocal:
+    """
+    Cubetas en la memoria del proceso (un dict protegido con un candado), sin serializar
+    nada. Es lo que corresponde con LocMemCache, que también es por proceso. Guarda como
+    máximo `maximo` cubetas; descartar la menos usada equivale a dejarla llena.
+    """
+    def __init__(self, maximo=10000):
+        self.maximo = maximo
+        self._cubetas = OrderedDict()
+        self._candado = threading.Lock()
+
+    def consumir(self, clave, capacidad, por_segundo):
+        """Descuenta un token y devuelve 0, o los segundos que faltan para tener uno."""
+        with self._candado:
+            # El tiempo se toma con el candado: una marca anterior a la guardada contaría dos veces el relleno
+            ahora = time.monotonic()
+            tokens, marca = self._cubetas.get(clave, (capacidad, ahora))
+            tokens = _rellenar(tokens, marca, ahora, capacidad, por_segundo)
+            espera = 0 if tokens >= 1 else (1 - tokens) / por_segundo
+            self._cubetas[clave] = (tokens - 1 if espera == 0 else tokens, ahora)
+            self._cubetas.move_to_end(clave)
+            if len(self._cubetas) > self.maximo:
+                self._cubetas.popitem(last=False)
+        return espera
+
+    def limpiar(self):
+        with self._candado:
+            self._cubetas.clear()
+
+
+class AlmacenCache:
+    """
+    Contadores en la caché configurada (compartida entre workers con Redis o Memcached).
+    Cada cubeta se aproxima con una ventana fija de capacidad / tasa segundos en la que
+    se admiten `capacidad` peticiones; el contador se suma con cache.incr, que es atómico,
+    así que no hace falta candado y cuesta un viaje a la caché por petición. En el borde
+    entre dos ventanas pueden pasar hasta dos ráfagas seguidas. Si la caché falla, la
+    petición se admite: el límite protege a la API, no debe dejarla sin servicio.
+    """
+    prefijo = 'limites:'
+
+    def consumir(self, clave, capacidad, por_segundo):
+        ventana = capacidad / por_segundo
+        ahora = time.time()
+        numero = int(ahora // ventana)
+        clave = f"{self.prefijo}{clave}:{numero}"
+        try:
+            try:
+                usadas = cache.incr(clave)
+            except ValueError:
+                # Primera petición de la ventana; si otro worker la creó antes, se suma a la suya
+                if cache.add(clave, 1, timeout=math.ceil(ventana) + 1):
+                    usadas = 1
+                else:
+                    usadas = cache.incr(clave)
+        except Exception as e:
+            logger.warning(f"No se pudo consultar el límite de peticiones en la caché: {str(e)}")
+            return 0
+        if usadas <= capacidad:
+            return 0
+        return (numero + 1) * ventana - ahora
+
+
+_almacen_local = AlmacenLocal()
+_almacen_cache = AlmacenCache()
+
+
+def almacen_limites():
+    """LIMITES_ALMACEN: 'local', 'cache' o 'auto' (local si la caché es LocMemCache)."""
+    tipo = getattr(settings, 'LIMITES_ALMACEN', 'auto')
+    if tipo == 'auto':
+        tipo = 'local' if settings.CACHES['default']['BACKEND'].endswith('LocMemCache') else 'cache'
+    return _almacen_local if tipo == 'local' else _almacen_cache
+
+
+class CubetaTokensThrottle(BaseThrottle):
+    """
+    Limita con una cubeta de tokens por usuario (o IP si es anónimo) y por clase de
+    endpoint. La clase es el throttle_scope de la vista o acción si lo define
+    ('importacion', 'exportacion'...); si no, 'lectura' o 'escritura' según el método.
+    Las peticiones anónimas usan siempre 'anonimo'. Las tasas vienen de
+    DEFAULT_THROTTLE_RATES y una clase sin tasa no se limita.
+    """
+    def __init__(self):
+        self.espera = None
+
+    def clase_endpoint(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return 'anonimo'
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        if request.method in SAFE_METHODS:
+            # Un listado por streaming es una exportación
+            return 'exportacion' if request.query_params.get('stream') == '1' else 'lectura'
+        return 'escritura'
+
+    def allow_request(self, request, view):
+        clase = self.clase_endpoint(request, view)
+        tasa = interpretar_tasa(api_settings.DEFAULT_THROTTLE_RATES.get(clase))
+        if tasa is None:
+            return True
+        identidad = request.user.pk if request.user and request.user.is_authenticated else self.get_ident(request)
+        self.espera = almacen_limites().consumir(f"{clase}:{identidad}", *tasa)
+        if self.espera:
+            logger.info(f"Límite de peticiones '{clase}' alcanzado por {identidad}.")
+        return self.espera == 0
+
+    def wait(self):
+        return self.espera
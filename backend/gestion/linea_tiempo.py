@@ -0,0 +1,157 @@
+# gestion/linea_tiempo.py
+
+from django.core import signing
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Sum, Value, When, Window
+from django.utils.dateparse import parse_datetime
+
+from .conciliacion import TIPO_SALDO_INICIAL, delta_prestado, delta_stock_destino, delta_stock_origen
+from .models import Movimiento
+
+# Tamaño de página por defecto y máximo de la línea de tiempo
+LIMITE_LINEA_TIEMPO = 100
+LIMITE_MAXIMO_LINEA_TIEMPO = 1000
+
+SAL_CURSOR = 'gestion.linea_tiempo'
+
+CAMPOS_LINEA_TIEMPO = [
+    'id', 'fecha', 'tipo_movimiento', 'cantidad', 'comentario', 'articulo_id', 'articulo_destino_id',
+    'movimiento_revertido_id', 'usuario__username', 'personal__nombre', 'motivo__nombre',
+]
+
+
+class ErrorCursor(Exception):
+    pass
+
+
+def movimientos_articulo(articulo_id, ajustes=None):
+    """
+    Movimientos que afectan al artículo (los propios y las transferencias de estado que lo
+    tienen como destino) con su efecto con signo sobre el stock y lo prestado. `ajustes`
+    ({id: (stock, prestado)}, ver ajustes_saldo_inicial) reemplaza el efecto de esos
+    movimientos.
+    """
+    ajustes = ajustes or {}
+    return (
+        Movimiento.objects
+        .filter(Q(articulo_id=articulo_id) | Q(articulo_destino_id=articulo_id))
+        .annotate(
+            delta_stock=Case(
+                *[When(id=movimiento_id, then=Value(stock)) for movimiento_id, (stock, _) in ajustes.items()],
+                When(articulo_id=articulo_id, then=delta_stock_origen()),
+                default=delta_stock_destino(),
+                output_field=IntegerField(),
+            ),
+            delta_prestado=Case(
+                *[When(id=movimiento_id, then=Value(prestado)) for movimiento_id, (_, prestado) in ajustes.items()],
+                When(articulo_id=articulo_id, then=delta_prestado()),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+        )
+    )
+
+
+def ajustes_saldo_inicial(articulo_id):
+    """
+    Efecto de cada 'Saldo Inicial' del artículo: lo que falta para que el saldo después de
+    él sea el registrado (cantidad y stock_prestado_inicial), como en la conciliación.
+    Así el acumulado de la línea de tiempo parte del saldo inicial y termina en el stock
+    del artículo. Es una consulta por saldo inicial (normalmente uno).
+    """
+    aperturas = (
+        Movimiento.objects.filter(articulo_id=articulo_id, tipo_movimiento=TIPO_SALDO_INICIAL)
+        .order_by('fecha', 'id').values_list('id', 'fecha', 'cantidad', 'stock_prestado_inicial')
+    )
+    ajustes = {}
+    anterior = None
+    stock = prestado = 0
+    for movimiento_id, fecha, cantidad, prestado_inicial in aperturas:
+        tramo = movimientos_articulo(articulo_id).filter(Q(fecha__lt=fecha) | Q(fecha=fecha, id__lt=movimiento_id))
+        if anterior:
+            tramo = tramo.filter(Q(fecha__gt=anterior[0]) | Q(fecha=anterior[0], id__gt=anterior[1]))
+        totales = tramo.order_by().aggregate(stock=Sum('delta_stock'), prestado=Sum('delta_prestado'))
+        stock += totales['stock'] or 0
+        prestado += totales['prestado'] or 0
+        ajustes[movimiento_id] = (cantidad - stock, (prestado_inicial or 0) - prestado)
+        stock, prestado = cantidad, prestado_inicial or 0
+        anterior = (fecha, movimiento_id)
+    return ajustes
+
+
+def codificar_cursor(fila, saldo_stock, saldo_prestado, descendente):
+    return signing.dumps(
+        [fila['fecha'].isoformat(), fila['id'], saldo_stock, saldo_prestado, descendente],
+        salt=SAL_CURSOR, compress=True,
+    )
+
+
+def decodificar_cursor(cursor):
+    try:
+        fecha, movimiento_id, saldo_stock, saldo_prestado, descendente = signing.loads(cursor, salt=SAL_CURSOR)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ErrorCursor("El cursor no es válido.")
+    return parse_datetime(fecha), movimiento_id, saldo_stock, saldo_prestado, descendente
+
+
+def linea_tiempo(articulo_id, cursor=None, limite=LIMITE_LINEA_TIEMPO, descendente=True):
+    """
+    Página de la línea de tiempo de un artículo: cada movimiento con su efecto con signo y
+    el stock/prestado resultante después de él, calculados en SQL con
+    SUM(...) OVER (ORDER BY fecha, id). Devuelve (filas, cursor_siguiente).
+
+    La paginación es por clave (fecha, id) sobre el índice movimiento_articulo_fecha_idx:
+    el cursor lleva el último movimiento entregado y el saldo en ese punto, así cada página
+    solo lee sus propias filas y suma la ventana sobre ellas.
+    """
+    movimientos = movimientos_articulo(articulo_id, ajustes_saldo_inicial(articulo_id))
+
+    if cursor:
+        fecha, movimiento_id, saldo_stock, saldo_prestado, descendente = decodificar_cursor(cursor)
+        if descendente:
+            limite_clave = Q(fecha__lt=fecha) | Q(fecha=fecha, id__lt=movimiento_id)
+        else:
+            limite_clave = Q(fecha__gt=fecha) | Q(fecha=fecha, id__gt=movimiento_id)
+        movimientos = movimientos.filter(limite_clave)
+    elif descendente:
+        # Los más recientes primero: se parte del saldo total y se descuenta hacia atrás
+        totales = movimientos.order_by().aggregate(stock=Sum('delta_stock'), prestado=Sum('delta_prestado'))
+        saldo_stock, saldo_prestado = totales['stock'] or 0, totales['prestado'] or 0
+    else:
+        saldo_stock = saldo_prestado = 0
+
+    orden = [F('fecha').desc(), F('id').desc()] if descendente else [F('fecha').asc(), F('id').asc()]
+    filas = list(
+        movimientos
+        .annotate(
+            acumulado_stock=Window(Sum('delta_stock'), order_by=orden),
+            acumulado_prestado=Window(Sum('delta_prestado'), order_by=orden),
+            anulado=Exists(Movimiento.objects.filter(movimiento_revertido=OuterRef('pk'))),
+        )
+        .order_by(*orden)
+        .values(*CAMPOS_LINEA_TIEMPO, 'delta_stock', 'delta_prestado', 'acumulado_stock',
+                'acumulado_prestado', 'anulado')[:limite + 1]
+    )
+
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    for fila in filas:
+        if descendente:
+            # Saldo después del movimiento = saldo antes de la página menos lo que vino después
+            fila['stock_actual'] = saldo_stock - fila.pop('acumulado_stock') + fila['delta_stock']
+            fila['stock_prestado'] = saldo_prestado - fila.pop('acumulado_prestado') + fila['delta_prestado']
+        else:
+            fila['stock_actual'] = saldo_stock + fila.pop('acumulado_stock')
+            fila['stock_prestado'] = saldo_prestado + fila.pop('acumulado_prestado')
+
+    siguiente = None
+    if hay_mas:
+        ultima = filas[-1]
+        if descendente:
+            siguiente = codificar_cursor(
+                ultima, ultima['stock_actual'] - ultima['delta_stock'],
+                ultima['stock_prestado'] - ultima['delta_prestado'], True,
+            )
+        else:
+            siguiente = codificar_cursor(ultima, ultima['stock_actual'], ultima['stock_prestado'], False)
+    return filas, siguiente
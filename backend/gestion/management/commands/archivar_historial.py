@@ -0,0 +1,82 @@
+# gestion/management/commands/archivar_historial.py
+
+import os
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from gestion.historial import (
+    COLUMNAS, asegurar_particiones, eliminar_mes, escribir_archivo, inicio_mes,
+    leer_archivo, meses_archivados, mes_siguiente,
+)
+from gestion.models import HistorialStock
+
+
+class Command(BaseCommand):
+    help = (
+        "Archiva en backups/historial_stock/ los meses de historial_stock anteriores al período "
+        "de retención (CSV comprimido o Parquet) y los quita de la base de datos. En PostgreSQL "
+        "además crea por adelantado las particiones de los próximos meses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=12, help='Meses completos que se mantienen en la base de datos.')
+        parser.add_argument('--formato', choices=['csv', 'parquet'], default='csv')
+        parser.add_argument('--meses-adelante', type=int, default=3, help='Particiones futuras a crear (PostgreSQL).')
+        parser.add_argument('--simular', action='store_true', help='Solo informa qué meses se archivarían.')
+
+    def handle(self, *args, **options):
+        if options['meses'] < 1:
+            raise CommandError("--meses debe ser al menos 1.")
+        if options['formato'] == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise CommandError("El formato parquet requiere pyarrow.")
+
+        if not options['simular']:
+            for nombre in asegurar_particiones(options['meses_adelante']):
+                self.stdout.write(f"Partición creada: {nombre}")
+
+        hoy = timezone.now().astimezone(dt_timezone.utc)
+        anio, mes = hoy.year, hoy.month
+        for _ in range(options['meses']):
+            anio, mes = (anio - 1, 12) if mes == 1 else (anio, mes - 1)
+        corte = inicio_mes(anio, mes)
+
+        meses = HistorialStock.objects.filter(fecha__lt=corte).datetimes('fecha', 'month', tzinfo=dt_timezone.utc)
+        meses = [(m.year, m.month) for m in meses]
+        if not meses:
+            self.stdout.write(f"No hay historial anterior a {corte:%Y-%m} para archivar.")
+            return
+
+        archivados = meses_archivados()
+        for anio, mes in meses:
+            desde, hasta = inicio_mes(anio, mes), inicio_mes(*mes_siguiente(anio, mes))
+            filas = HistorialStock.objects.filter(fecha__gte=desde, fecha__lt=hasta)
+            if options['simular']:
+                self.stdout.write(f"{anio:04d}-{mes:02d}: {filas.count()} filas se archivarían.")
+                continue
+
+            # Si el mes ya tenía archivo (filas insertadas tarde o una ejecución que se cortó
+            # antes de borrar), se combinan sin duplicar por id.
+            combinadas = {}
+            if (anio, mes) in archivados:
+                combinadas.update((fila['id'], fila) for fila in leer_archivo(archivados[(anio, mes)]))
+            combinadas.update(
+                (fila['id'], fila)
+                for fila in filas.order_by('fecha', 'id').values(*COLUMNAS).iterator(chunk_size=2000)
+            )
+            ruta, total = escribir_archivo(
+                sorted(combinadas.values(), key=lambda f: (f['fecha'], f['id'])), anio, mes, options['formato']
+            )
+            if (anio, mes) in archivados and archivados[(anio, mes)] != ruta:
+                # El mes estaba archivado en el otro formato y ya quedó incluido en el nuevo
+                os.remove(archivados[(anio, mes)])
+
+            # Solo se borra después de que el archivo quedó escrito completo
+            with transaction.atomic():
+                eliminar_mes(anio, mes)
+            self.stdout.write(self.style.SUCCESS(f"{anio:04d}-{mes:02d}: {total} filas archivadas en {ruta}"))
@@ -0,0 +1,55 @@
+# gestion/management/commands/benchmark_autenticacion.py
+
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from gestion.autenticacion import JWTAutenticacionCacheada, cache_usuarios
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el costo de autenticar una petición con un token de acceso: JWTAuthentication "
+        "de simplejwt contra JWTAutenticacionCacheada (microsegundos y consultas por petición)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Usuario dueño del token (por defecto el primero).')
+        parser.add_argument('--peticiones', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.filter(is_active=True).order_by('id')
+        if options['usuario']:
+            usuarios = usuarios.filter(username=options['usuario'])
+        usuario = usuarios.first()
+        if usuario is None:
+            raise CommandError("No hay un usuario activo para generar el token.")
+
+        cabecera = f"Bearer {AccessToken.for_user(usuario)}"
+        fabrica = APIRequestFactory()
+        cache_usuarios.limpiar()
+
+        self.stdout.write(f"{'autenticación':<26} {'µs/petición':>12} {'consultas/petición':>19}")
+        for nombre, clase in (('JWTAuthentication', JWTAuthentication),
+                              ('JWTAutenticacionCacheada', JWTAutenticacionCacheada)):
+            autenticador = clase()
+            peticiones = [Request(fabrica.get('/', HTTP_AUTHORIZATION=cabecera))
+                          for _ in range(options['peticiones'])]
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                for peticion in peticiones:
+                    autenticado, _ = autenticador.authenticate(peticion)
+                duracion = time.perf_counter() - inicio
+            if autenticado.pk != usuario.pk:
+                raise CommandError(f"{nombre} resolvió un usuario distinto al del token.")
+            self.stdout.write(
+                f"{nombre:<26} {duracion / len(peticiones) * 1e6:>12.1f} "
+                f"{len(consultas) / len(peticiones):>19.3f}"
+            )
@@ -0,0 +1,111 @@
+# gestion/management/commands/benchmark_importacion.py
+
+import csv
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from openpyxl import Workbook
+
+from gestion.importacion import filas_desde_archivo, importar_filas, limpiar_fila, validar_fila, ErrorFila
+from gestion.plantillas import ENCABEZADOS_PLANTILLA
+
+FORMATOS = ['xlsx', 'csv', 'parquet']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara filas/s de la importación de artículos por formato (xlsx, csv, parquet). "
+        "Mide la lectura + limpieza por separado y, salvo --solo-lectura, la importación "
+        "completa dentro de una transacción que se revierte al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=20000, help='Filas del archivo generado.')
+        parser.add_argument('--formatos', default=','.join(FORMATOS), help='Formatos a medir, separados por coma.')
+        parser.add_argument('--solo-lectura', action='store_true', help='No mide la escritura en la base de datos.')
+        parser.add_argument('--usuario', help='Usuario al que se asignan los movimientos (por defecto, el primer superusuario).')
+
+    def handle(self, *args, **options):
+        formatos = [f.strip() for f in options['formatos'].split(',') if f.strip()]
+        desconocidos = set(formatos) - set(FORMATOS)
+        if desconocidos:
+            raise CommandError(f"Formatos no soportados: {', '.join(sorted(desconocidos))}.")
+
+        usuario = None
+        if not options['solo_lectura']:
+            if options['usuario']:
+                usuario = User.objects.filter(username=options['usuario']).first()
+            else:
+                usuario = User.objects.filter(is_superuser=True).order_by('id').first()
+            if usuario is None:
+                raise CommandError("No se encontró un usuario para registrar los movimientos de la importación.")
+
+        filas = list(self._generar_filas(options['filas']))
+        self.stdout.write(f"{'formato':<9} {'tamaño KB':>10} {'lectura f/s':>12} {'importación f/s':>16}")
+
+        with tempfile.TemporaryDirectory() as directorio:
+            for formato in formatos:
+                ruta = os.path.join(directorio, f"benchmark.{formato}")
+                try:
+                    getattr(self, f"_escribir_{formato}")(ruta, filas)
+                except ImportError:
+                    self.stdout.write(f"{formato:<9} omitido: falta pyarrow para escribir el archivo.")
+                    continue
+
+                lectura = self._medir_lectura(ruta)
+                importacion = '-' if options['solo_lectura'] else f"{self._medir_importacion(ruta, usuario):.0f}"
+                self.stdout.write(
+                    f"{formato:<9} {os.path.getsize(ruta) / 1024:>10.0f} {lectura:>12.0f} {importacion:>16}"
+                )
+
+    def _generar_filas(self, cantidad):
+        for i in range(cantidad):
+            yield [
+                f"Benchmark {i}", i % 50, 5, 'Tecnología', 'Bodega 1', f"Marca {i % 20}",
+                f"Modelo {i % 40}", 'Bueno', f"BENCH-SN-{i}", None, f"BENCH-CI-{i}", None, 'Fila de benchmark',
+            ]
+
+    def _escribir_xlsx(self, ruta, filas):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(ENCABEZADOS_PLANTILLA)
+        for fila in filas:
+            ws.append(fila)
+        wb.save(ruta)
+
+    def _escribir_csv(self, ruta, filas):
+        with open(ruta, 'w', encoding='utf-8', newline='') as destino:
+            escritor = csv.writer(destino)
+            escritor.writerow(ENCABEZADOS_PLANTILLA)
+            escritor.writerows(filas)
+
+    def _escribir_parquet(self, ruta, filas):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        columnas = list(zip(*filas))
+        tabla = pa.table({nombre: list(valores) for nombre, valores in zip(ENCABEZADOS_PLANTILLA, columnas)})
+        pq.write_table(tabla, ruta)
+
+    def _medir_lectura(self, ruta):
+        inicio = time.perf_counter()
+        total = 0
+        for fila_num, fila in filas_desde_archivo(ruta, ruta):
+            try:
+                validar_fila(fila_num, limpiar_fila(fila))
+            except ErrorFila:
+                pass
+            total += 1
+        return total / (time.perf_counter() - inicio)
+
+    def _medir_importacion(self, ruta, usuario):
+        with transaction.atomic():
+            inicio = time.perf_counter()
+            resultado = importar_filas(filas_desde_archivo(ruta, ruta), usuario)
+            transcurrido = time.perf_counter() - inicio
+            # No dejar rastro del benchmark en la base de datos
+            transaction.set_rollback(True)
+        return (resultado['creados'] + resultado['actualizados']) / transcurrido
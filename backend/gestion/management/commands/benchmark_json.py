@@ -0,0 +1,126 @@
+# gestion/management/commands/benchmark_json.py
+
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from gestion import json_rapido
+from gestion.json_rapido import codificar, filas_valores, plan_valores, transmitir_arreglo
+from gestion.models import Articulo, HistorialStock
+from gestion.serializers import ArticuloSerializer, HistorialStockSerializer
+
+LISTADOS = {
+    'articulos': (Articulo, ArticuloSerializer),
+    'historial': (HistorialStock, HistorialStockSerializer),
+}
+
+# Textos que ejercitan el escape de JSON: comillas, controles, no ASCII y U+2028/U+2029
+# (sin NUL, que PostgreSQL no admite en columnas de texto)
+TEXTOS_BORDE = [
+    'comillas "dobles" y \\ barra', 'tab\tsalto\nretorno\r', 'control \x01\x1f\x7f',
+    'ñandú — “tipográficas” 😀', 'separadores \u2028 y \u2029', '',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el tiempo de CPU del listado con ModelSerializer + JSONRenderer contra el camino "
+        "rápido (values() + orjson o json estándar) sobre las filas de la base de datos. "
+        "Con --verificar comprueba además que los bytes de ambos caminos sean idénticos, "
+        "incluyendo filas con textos de borde creadas en una transacción revertida."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listados', default=','.join(LISTADOS), help='articulos,historial')
+        parser.add_argument('--limite', type=int, default=50000, help='Filas por listado.')
+        parser.add_argument('--repeticiones', type=int, default=3, help='Se informa la mejor medición.')
+        parser.add_argument('--verificar', action='store_true')
+
+    def handle(self, *args, **options):
+        listados = [nombre.strip() for nombre in options['listados'].split(',') if nombre.strip()]
+        desconocidos = set(listados) - set(LISTADOS)
+        if desconocidos:
+            raise CommandError(f"Listados desconocidos: {', '.join(sorted(desconocidos))}.")
+        request = Request(APIRequestFactory().get('/'))
+
+        if options['verificar']:
+            self._verificar(listados, request, options['limite'])
+
+        self.stdout.write(f"{'listado':<10} {'filas':>7} {'drf s':>8} {'rápido s':>9} {'stdlib s':>9} {'x':>6}")
+        for nombre in listados:
+            modelo, serializer_class = LISTADOS[nombre]
+            queryset = modelo.objects.order_by('-id')[:options['limite']]
+            filas = queryset.count()
+
+            drf = self._medir(options['repeticiones'], lambda: self._drf(queryset, serializer_class, request))
+            rapido = self._medir(options['repeticiones'], lambda: self._rapido(queryset, serializer_class, request))
+            with mock.patch.object(json_rapido, 'orjson', None):
+                stdlib = self._medir(options['repeticiones'], lambda: self._rapido(queryset, serializer_class, request))
+            self.stdout.write(
+                f"{nombre:<10} {filas:>7} {drf:>8.3f} {rapido:>9.3f} {stdlib:>9.3f} {drf / rapido:>6.1f}"
+            )
+
+    def _medir(self, repeticiones, funcion):
+        mejor = None
+        for _ in range(repeticiones):
+            inicio = time.process_time()
+            funcion()
+            duracion = time.process_time() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor
+
+    def _drf(self, queryset, serializer_class, request):
+        datos = serializer_class(queryset, many=True, context={'request': request}).data
+        return JSONRenderer().render(datos)
+
+    def _rapido(self, queryset, serializer_class, request):
+        plan = plan_valores(serializer_class(context={'request': request}), queryset.model)
+        return codificar(list(filas_valores(queryset, plan)))
+
+    def _transmitido(self, queryset, serializer_class, request):
+        plan = plan_valores(serializer_class(context={'request': request}), queryset.model)
+        return b''.join(transmitir_arreglo(filas_valores(queryset, plan, iterar=True), tamano_lote=7))
+
+    def _verificar(self, listados, request, limite):
+        usuario = User.objects.order_by('id').first()
+        if usuario is None:
+            raise CommandError("Se necesita al menos un usuario para crear las filas de verificación.")
+
+        with transaction.atomic():
+            self._crear_filas_borde(usuario)
+            for nombre in listados:
+                modelo, serializer_class = LISTADOS[nombre]
+                queryset = modelo.objects.order_by('-id')[:limite]
+                esperado = self._drf(queryset, serializer_class, request)
+                caminos = {'rápido': lambda: self._rapido(queryset, serializer_class, request),
+                           'streaming': lambda: self._transmitido(queryset, serializer_class, request)}
+                for camino, funcion in list(caminos.items()):
+                    with mock.patch.object(json_rapido, 'orjson', None):
+                        caminos[f'{camino} (stdlib)'] = funcion()
+                    caminos[camino] = funcion()
+                for camino, obtenido in caminos.items():
+                    if obtenido != esperado:
+                        raise CommandError(f"{nombre}: la salida del camino {camino} difiere de la del serializador.")
+                self.stdout.write(self.style.SUCCESS(
+                    f"{nombre}: {len(esperado)} bytes idénticos en {', '.join(caminos)}."
+                ))
+            transaction.set_rollback(True)
+
+    def _crear_filas_borde(self, usuario):
+        articulos = Articulo.objects.bulk_create([
+            Articulo(nombre=texto or 'vacío', descripcion=texto, stock_actual=i, codigo_interno=None)
+            for i, texto in enumerate(TEXTOS_BORDE)
+        ])
+        HistorialStock.objects.bulk_create([
+            HistorialStock(
+                articulo=articulo, tipo_movimiento='Entrada', cantidad=1, stock_anterior=0,
+                stock_actual=1, usuario=usuario, comentario=articulo.descripcion,
+            )
+            for articulo in articulos
+        ])
@@ -0,0 +1,63 @@
+# gestion/management/commands/benchmark_serializacion.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from gestion.models import Articulo
+from gestion.serializers import ArticuloSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el tamaño del JSON y el tiempo de serialización del listado de artículos con la "
+        "representación completa, la vista 'compact' y campos dispersos. Los artículos se "
+        "generan en memoria, sin tocar la base de datos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articulos', type=int, default=50000)
+        parser.add_argument('--repeticiones', type=int, default=3, help='Se informa la mejor medición.')
+        parser.add_argument(
+            '--consultas', nargs='+',
+            default=['', 'vista=compact', 'fields=id,nombre', 'fields=id,nombre,stock_actual'],
+            help='Query strings a comparar ("" es la representación completa).'
+        )
+
+    def handle(self, *args, **options):
+        articulos = [
+            Articulo(
+                id=i, nombre=f"Artículo {i}", stock_actual=i % 50, stock_minimo=5,
+                descripcion="Descripción de prueba " * 8, codigo_interno=f"CI-{i:06d}",
+                codigo_minvu=f"MV-{i:06d}", numero_serie=f"NS-{i:08d}", mac=None,
+                categoria_id=1 + i % 10, marca_id=1 + i % 20, modelo_id=1 + i % 40,
+                ubicacion_id=1 + i % 5, estado_id=1,
+            )
+            for i in range(1, options['articulos'] + 1)
+        ]
+        fabrica = APIRequestFactory()
+        renderer = JSONRenderer()
+
+        self.stdout.write(f"{'consulta':<32} {'serializar s':>13} {'render s':>10} {'tamaño KB':>11}")
+        for consulta in options['consultas']:
+            request = Request(fabrica.get(f"/api/articulos/?{consulta}"))
+            mejor_serializacion = mejor_render = None
+            for _ in range(options['repeticiones']):
+                inicio = time.perf_counter()
+                datos = ArticuloSerializer(articulos, many=True, context={'request': request}).data
+                serializacion = time.perf_counter() - inicio
+
+                inicio = time.perf_counter()
+                contenido = renderer.render(datos)
+                render = time.perf_counter() - inicio
+
+                mejor_serializacion = min(serializacion, mejor_serializacion or serializacion)
+                mejor_render = min(render, mejor_render or render)
+
+            self.stdout.write(
+                f"{consulta or '(completo)':<32} {mejor_serializacion:>13.3f} {mejor_render:>10.3f} "
+                f"{len(contenido) / 1024:>11.0f}"
+            )
@@ -0,0 +1,157 @@
+# gestion/management/commands/benchmark_servidor.py
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga que compara req/s del listado de artículos y de la creación de "
+        "movimientos entre los perfiles de gunicorn (sync, gthread, asgi). "
+        "Los movimientos se crean en pares Entrada/Salida de 1 unidad para no alterar el stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8090', help='URL base del servidor.')
+        parser.add_argument(
+            '--perfiles', default='',
+            help='Perfiles a levantar con gunicorn, separados por coma (ej. sync,gthread,asgi). '
+                 'Si se omite, se mide el servidor que ya esté corriendo en --url.'
+        )
+        parser.add_argument('--usuario', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--articulo', type=int, required=True, help='ID del artículo usado para los movimientos.')
+        parser.add_argument('--duracion', type=float, default=10.0, help='Segundos por endpoint.')
+        parser.add_argument('--concurrencia', type=int, default=8, help='Clientes simultáneos.')
+
+    def handle(self, *args, **options):
+        base_url = options['url'].rstrip('/')
+        perfiles = [p.strip() for p in options['perfiles'].split(',') if p.strip()]
+
+        resultados = []
+        if not perfiles:
+            resultados.extend(self._medir_perfil('actual', base_url, options))
+        else:
+            for perfil in perfiles:
+                proceso = self._levantar_gunicorn(perfil, base_url)
+                try:
+                    resultados.extend(self._medir_perfil(perfil, base_url, options))
+                finally:
+                    proceso.terminate()
+                    proceso.wait(timeout=30)
+
+        self.stdout.write(f"{'perfil':<10} {'endpoint':<22} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errores':>8}")
+        for fila in resultados:
+            self.stdout.write(
+                f"{fila['perfil']:<10} {fila['endpoint']:<22} {fila['rps']:>9.1f} "
+                f"{fila['p50']:>9.1f} {fila['p95']:>9.1f} {fila['errores']:>8}"
+            )
+
+    def _levantar_gunicorn(self, perfil, base_url):
+        host, _, puerto = base_url.split('://', 1)[-1].partition(':')
+        entorno = dict(os.environ, GUNICORN_PERFIL=perfil, GUNICORN_BIND=f"{host}:{puerto or 80}")
+        # La prueba de carga usa un solo usuario: sin esto la mediría el límite de peticiones
+        entorno.update(LIMITE_LECTURA='1000000/s', LIMITE_ESCRITURA='1000000/s')
+        proceso = subprocess.Popen(
+            ['gunicorn', '-c', 'gunicorn.conf.py'],
+            cwd=settings.BASE_DIR,
+            env=entorno,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if proceso.poll() is not None:
+                raise CommandError(f"Gunicorn terminó al iniciar el perfil '{perfil}'.")
+            try:
+                with socket.create_connection((host, int(puerto or 80)), timeout=1):
+                    return proceso
+            except OSError:
+                time.sleep(0.2)
+        proceso.terminate()
+        raise CommandError(f"Gunicorn no respondió a tiempo con el perfil '{perfil}'.")
+
+    def _medir_perfil(self, perfil, base_url, options):
+        token = self._obtener_token(base_url, options['usuario'], options['password'])
+        articulo = options['articulo']
+
+        def listar(_):
+            return self._solicitud(f"{base_url}/api/articulos/", token)
+
+        def mover(iteracion):
+            tipo = 'Entrada' if iteracion % 2 == 0 else 'Salida'
+            cuerpo = {'articulo': articulo, 'tipo_movimiento': tipo, 'cantidad': 1,
+                      'comentario': 'benchmark_servidor'}
+            return self._solicitud(f"{base_url}/api/movimientos/", token, cuerpo)
+
+        return [
+            dict(perfil=perfil, endpoint='GET /api/articulos/', **self._carga(listar, options)),
+            dict(perfil=perfil, endpoint='POST /api/movimientos/', **self._carga(mover, options)),
+        ]
+
+    def _carga(self, funcion, options):
+        latencias = []
+        errores = [0]
+        candado = threading.Lock()
+        fin = time.monotonic() + options['duracion']
+
+        def cliente():
+            iteracion = 0
+            while time.monotonic() < fin:
+                inicio = time.perf_counter()
+                ok = funcion(iteracion)
+                transcurrido = (time.perf_counter() - inicio) * 1000
+                with candado:
+                    if ok:
+                        latencias.append(transcurrido)
+                    else:
+                        errores[0] += 1
+                iteracion += 1
+
+        hilos = [threading.Thread(target=cliente) for _ in range(options['concurrencia'])]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        cuantiles = statistics.quantiles(latencias, n=20) if len(latencias) >= 2 else [0] * 19
+        return {
+            'rps': len(latencias) / options['duracion'],
+            'p50': statistics.median(latencias) if latencias else 0,
+            'p95': cuantiles[18],
+            'errores': errores[0],
+        }
+
+    def _obtener_token(self, base_url, usuario, password):
+        datos = json.dumps({'username': usuario, 'password': password}).encode()
+        solicitud = urllib.request.Request(
+            f"{base_url}/api/token/", data=datos, headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(solicitud, timeout=10) as respuesta:
+                return json.loads(respuesta.read())['access']
+        except urllib.error.URLError as e:
+            raise CommandError(f"No se pudo obtener el token: {e}")
+
+    def _solicitud(self, url, token, cuerpo=None):
+        cabeceras = {'Authorization': f"Bearer {token}"}
+        datos = None
+        if cuerpo is not None:
+            datos = json.dumps(cuerpo).encode()
+            cabeceras['Content-Type'] = 'application/json'
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=datos, headers=cabeceras), timeout=30) as r:
+                r.read()
+                return 200 <= r.status < 300
+        except (urllib.error.URLError, OSError):
+            return False
@@ -0,0 +1,94 @@
+# gestion/management/commands/benchmark_tokens.py
+
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from gestion.mantenimiento_tokens import purgar_tokens_vencidos
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia de renovar un token (rotación + lista negra) con las tablas de "
+        "token_blacklist casi vacías, con millones de tokens históricos y después de la purga. "
+        "Todo ocurre en una transacción que se revierte al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=1000000, help='Tokens históricos vencidos a insertar.')
+        parser.add_argument('--bloqueados', type=float, default=0.5, help='Fracción de ellos en la lista negra.')
+        parser.add_argument('--renovaciones', type=int, default=300)
+        parser.add_argument('--lote-insercion', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        usuario = User.objects.filter(is_active=True).order_by('id').first()
+        if usuario is None:
+            raise CommandError("No hay un usuario activo para generar tokens.")
+
+        self.stdout.write(f"{'escenario':<22} {'emitidos':>10} {'mediana µs':>11} {'p95 µs':>9} {'consultas':>10}")
+        with transaction.atomic():
+            self._medir("tablas actuales", usuario, options['renovaciones'])
+
+            inicio = time.perf_counter()
+            self._insertar_historicos(options['tokens'], options['bloqueados'], options['lote_insercion'])
+            self.stdout.write(f"  {options['tokens']} tokens históricos insertados en {time.perf_counter() - inicio:.1f} s")
+            self._medir("con históricos", usuario, options['renovaciones'])
+
+            inicio = time.perf_counter()
+            emitidos, bloqueados = purgar_tokens_vencidos()
+            self.stdout.write(
+                f"  purga: {emitidos} emitidos y {bloqueados} bloqueados en {time.perf_counter() - inicio:.1f} s"
+            )
+            self._medir("después de la purga", usuario, options['renovaciones'])
+            transaction.set_rollback(True)
+
+    def _insertar_historicos(self, total, fraccion_bloqueados, tamano_lote):
+        ahora = timezone.now()
+        cada_bloqueado = round(1 / fraccion_bloqueados) if fraccion_bloqueados > 0 else 0
+        for desde in range(0, total, tamano_lote):
+            emitidos = OutstandingToken.objects.bulk_create([
+                OutstandingToken(
+                    jti=uuid.uuid4().hex, token='', created_at=ahora - timedelta(days=8, minutes=i),
+                    expires_at=ahora - timedelta(days=1, minutes=i),
+                )
+                for i in range(desde, min(desde + tamano_lote, total))
+            ])
+            if cada_bloqueado:
+                BlacklistedToken.objects.bulk_create([
+                    BlacklistedToken(token_id=emitido.id) for emitido in emitidos[::cada_bloqueado]
+                ])
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {OutstandingToken._meta.db_table}")
+                cursor.execute(f"ANALYZE {BlacklistedToken._meta.db_table}")
+
+    def _medir(self, escenario, usuario, renovaciones):
+        refresco = str(RefreshToken.for_user(usuario))
+        duraciones = []
+        consultas = []
+
+        def contar(ejecutar, sql, params, many, context):
+            consultas.append(sql)
+            return ejecutar(sql, params, many, context)
+
+        with connection.execute_wrapper(contar):
+            for _ in range(renovaciones):
+                inicio = time.perf_counter()
+                serializer = TokenRefreshSerializer(data={'refresh': refresco})
+                serializer.is_valid(raise_exception=True)
+                refresco = serializer.validated_data['refresh']
+                duraciones.append((time.perf_counter() - inicio) * 1e6)
+        duraciones.sort()
+        self.stdout.write(
+            f"{escenario:<22} {OutstandingToken.objects.count():>10} {statistics.median(duraciones):>11.0f} "
+            f"{duraciones[int(len(duraciones) * 0.95)]:>9.0f} {len(consultas) / renovaciones:>10.1f}"
+        )
@@ -0,0 +1,63 @@
+# gestion/management/commands/conciliar_stock.py
+
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.conciliacion import TAMANO_LOTE_CONCILIACION, detectar_discrepancias, reparar_discrepancias
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el stock y las unidades prestadas de cada artículo con el registro de "
+        "movimientos y los préstamos abiertos; con --reparar corrige las diferencias por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reparar', action='store_true', help='Corrige las discrepancias encontradas.')
+        parser.add_argument('--usuario', help='Usuario a cuyo nombre queda la corrección (requerido con --reparar).')
+        parser.add_argument('--articulos', type=int, nargs='+', help='Limita la revisión a estos ids.')
+        parser.add_argument('--limite', type=int, default=50, help='Discrepancias a mostrar en detalle.')
+        parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE_CONCILIACION)
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options['reparar']:
+            if not options['usuario']:
+                raise CommandError("--reparar requiere --usuario.")
+            try:
+                usuario = User.objects.get(username=options['usuario'])
+            except User.DoesNotExist:
+                raise CommandError(f"No existe el usuario '{options['usuario']}'.")
+
+        inicio = time.perf_counter()
+        total = 0
+        reparables = []
+        for discrepancia in detectar_discrepancias(options['articulos']):
+            total += 1
+            if discrepancia['reparable']:
+                reparables.append(discrepancia['articulo'])
+            if total <= options['limite']:
+                self.stdout.write(
+                    f"Artículo {discrepancia['articulo']} ({discrepancia['nombre']}): "
+                    f"stock {discrepancia['stock_actual']} -> {discrepancia['stock_esperado']}, "
+                    f"prestado {discrepancia['stock_prestado']} -> {discrepancia['stock_prestado_esperado']}"
+                    + ("" if discrepancia['reparable'] else " [saldo negativo, no reparable]")
+                )
+        if total > options['limite']:
+            self.stdout.write(f"... y {total - options['limite']} más.")
+        self.stdout.write(f"{total} discrepancia(s) encontradas en {time.perf_counter() - inicio:.2f} s.")
+
+        if not options['reparar'] or not reparables:
+            return
+
+        inicio = time.perf_counter()
+        corregidos, omitidos = reparar_discrepancias(reparables, usuario, options['tamano_lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{corregidos} artículo(s) corregido(s) en {time.perf_counter() - inicio:.2f} s."
+        ))
+        if omitidos:
+            self.stdout.write(self.style.WARNING(
+                f"Sin corregir por saldo negativo: {', '.join(map(str, omitidos))}"
+            ))
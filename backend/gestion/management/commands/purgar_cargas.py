@@ -0,0 +1,19 @@
+# gestion/management/commands/purgar_cargas.py
+
+from django.core.management.base import BaseCommand
+
+from gestion.cargas import purgar_cargas_abandonadas
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las subidas por fragmentos abandonadas (sin importar y sin cambios hace más de "
+        "CARGA_VIGENCIA_HORAS) con sus archivos, y los archivos de CARGAS_DIR sin carga."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=None, help='Por defecto CARGA_VIGENCIA_HORAS.')
+
+    def handle(self, *args, **options):
+        cargas, archivos = purgar_cargas_abandonadas(options['horas'])
+        self.stdout.write(self.style.SUCCESS(f"{cargas} cargas abandonadas y {archivos} archivos sin carga borrados."))
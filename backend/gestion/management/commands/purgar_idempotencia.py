@@ -0,0 +1,16 @@
+# gestion/management/commands/purgar_idempotencia.py
+
+from django.core.management.base import BaseCommand
+
+from gestion.idempotencia import purgar_claves_vencidas
+
+
+class Command(BaseCommand):
+    help = "Borra en lotes las claves de idempotencia vencidas (IDEMPOTENCIA_TTL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-lote', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        borradas = purgar_claves_vencidas(options['tamano_lote'])
+        self.stdout.write(self.style.SUCCESS(f"{borradas} claves de idempotencia vencidas borradas."))
@@ -0,0 +1,48 @@
+# gestion/management/commands/purgar_tokens.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.mantenimiento_tokens import estadisticas_tokens, purgar_tokens_vencidos
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra en lotes los tokens de refresco vencidos de token_blacklist (emitidos y lista "
+        "negra) e informa el tamaño de ambas tablas antes y después. Pensado para cron; "
+        "también puede correr dentro de gunicorn con PURGA_TOKENS_INTERVALO."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-lote', type=int, default=5000)
+        parser.add_argument('--max-lotes', type=int, default=None, help='Detenerse tras esta cantidad de lotes.')
+        parser.add_argument('--margen', type=int, default=None,
+                            help='Segundos que se conserva un token después de vencer (PURGA_TOKENS_MARGEN).')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre lotes.')
+        parser.add_argument('--simular', action='store_true', help='Solo informa el estado de las tablas.')
+
+    def handle(self, *args, **options):
+        if options['tamano_lote'] < 1:
+            raise CommandError("--tamano-lote debe ser al menos 1.")
+
+        self._informar("Antes", estadisticas_tokens(options['margen']))
+        if options['simular']:
+            return
+
+        emitidos, bloqueados = purgar_tokens_vencidos(
+            tamano_lote=options['tamano_lote'], max_lotes=options['max_lotes'],
+            margen=options['margen'], pausa=options['pausa'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Borrados {emitidos} tokens emitidos y {bloqueados} de la lista negra."
+        ))
+        self._informar("Después", estadisticas_tokens(options['margen']))
+
+    def _informar(self, momento, estadisticas):
+        bytes_tablas = estadisticas['bytes']
+        for nombre in ('emitidos', 'bloqueados'):
+            tamano = bytes_tablas[nombre]
+            tamano = f"{tamano / 1024 / 1024:.1f} MB" if tamano is not None else "tamaño no disponible"
+            self.stdout.write(
+                f"{momento} - {nombre}: {estadisticas[nombre]} filas, "
+                f"{estadisticas[nombre + '_vencidos']} vencidas, {tamano}"
+            )
@@ -0,0 +1,138 @@
+# gestion/mantenimiento_tokens.py
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+logger = logging.getLogger(__name__)
+
+TABLAS_TOKENS = {
+    'emitidos': OutstandingToken,
+    'bloqueados': BlacklistedToken,
+}
+
+# Evita que varios workers purguen a la vez cuando la caché es compartida
+CLAVE_CANDADO_PURGA = 'mantenimiento_tokens:purga'
+
+_programador = None
+
+
+def corte_vencimiento(margen=None):
+    """Los tokens con expires_at anterior a esto ya no pueden usarse y se pueden borrar."""
+    if margen is None:
+        margen = getattr(settings, 'PURGA_TOKENS_MARGEN', 0)
+    return timezone.now() - timedelta(seconds=margen)
+
+
+def tamano_tabla(modelo):
+    """Bytes que ocupa la tabla con sus índices, o None si la base de datos no lo informa."""
+    tabla = modelo._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_total_relation_size(to_regclass(%s))", [tabla])
+            return cursor.fetchone()[0]
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name = %s "
+                    "OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                    [tabla, tabla]
+                )
+            except Exception:
+                # SQLite compilado sin SQLITE_ENABLE_DBSTAT_VTAB
+                return None
+            return cursor.fetchone()[0]
+    return None
+
+
+def estadisticas_tokens(margen=None):
+    """Filas de cada tabla, cuántas están vencidas y su tamaño en disco."""
+    corte = corte_vencimiento(margen)
+    return {
+        'emitidos': OutstandingToken.objects.count(),
+        'emitidos_vencidos': OutstandingToken.objects.filter(expires_at__lt=corte).count(),
+        'bloqueados': BlacklistedToken.objects.count(),
+        'bloqueados_vencidos': BlacklistedToken.objects.filter(token__expires_at__lt=corte).count(),
+        'bytes': {nombre: tamano_tabla(modelo) for nombre, modelo in TABLAS_TOKENS.items()},
+    }
+
+
+def purgar_tokens_vencidos(tamano_lote=5000, max_lotes=None, margen=None, pausa=0):
+    """
+    Borra los tokens vencidos (y su entrada en la lista negra) en lotes de `tamano_lote`
+    ids, cada uno en su propia transacción, para no bloquear las tablas mientras se
+    renuevan tokens. Un token vencido ya es rechazado por su firma, así que quitarlo de la
+    lista negra no cambia lo que se acepta. Devuelve (emitidos, bloqueados) borrados.
+    """
+    corte = corte_vencimiento(margen)
+    emitidos = bloqueados = lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lt=corte)
+            .order_by('expires_at').values_list('id', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            # La lista negra se borra en cascada con un DELETE ... WHERE token_id IN (...)
+            _, por_modelo = OutstandingToken.objects.filter(id__in=ids).delete()
+        emitidos += por_modelo.get(OutstandingToken._meta.label, 0)
+        bloqueados += por_modelo.get(BlacklistedToken._meta.label, 0)
+        lotes += 1
+        if pausa:
+            time.sleep(pausa)
+
+    if emitidos:
+        logger.info(f"Purga de tokens: {emitidos} emitidos y {bloqueados} bloqueados borrados en {lotes} lotes.")
+    return emitidos, bloqueados
+
+
+def _purga_programada(intervalo):
+    # cache.add solo tiene éxito en un worker por intervalo si la caché es compartida
+    if not cache.add(CLAVE_CANDADO_PURGA, True, timeout=max(intervalo - 1, 1)):
+        return
+    try:
+        purgar_tokens_vencidos(tamano_lote=settings.PURGA_TOKENS_TAMANO_LOTE, pausa=0.05)
+    except Exception as e:
+        logger.error(f"Error en la purga programada de tokens: {str(e)}")
+    finally:
+        connection.close()
+
+
+def iniciar_purga_periodica(intervalo=None):
+    """
+    Inicia un hilo de fondo que purga los tokens vencidos cada `intervalo` segundos
+    (PURGA_TOKENS_INTERVALO). Con 0 no hace nada: en ese caso se puede programar el
+    comando purgar_tokens con cron. Gunicorn lo llama desde post_worker_init.
+    """
+    global _programador
+    if intervalo is None:
+        intervalo = getattr(settings, 'PURGA_TOKENS_INTERVALO', 0)
+    if intervalo <= 0 or _programador is not None:
+        return None
+
+    detener = threading.Event()
+
+    def ciclo():
+        while not detener.wait(intervalo):
+            _purga_programada(intervalo)
+
+    _programador = threading.Thread(target=ciclo, name='purga-tokens', daemon=True)
+    _programador.detener = detener
+    _programador.start()
+    logger.info(f"Purga periódica de tokens cada {intervalo} segundos.")
+    return _programador
+
+
+def detener_purga_periodica():
+    global _programador
+    if _programador is not None:
+        _programador.detener.set()
+        _programador = None
@@ -0,0 +1,187 @@
+# gestion/middleware.py
+
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from .replicas import registrar_escritura, replica_configurada
+from .telemetria import registrar_respuesta
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él solo se negocia gzip
+    brotli = None
+
+# Relleno aleatorio del encabezado gzip contra BREACH (igual que GZipMiddleware)
+MAXIMO_BYTES_ALEATORIOS = 100
+
+TIPOS_COMPRIMIBLES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+
+_ACEPTA_CODIFICACION = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?')
+
+
+def codificaciones_aceptadas(cabecera):
+    """{codificacion: q} a partir de Accept-Encoding; q=0 significa 'no aceptada'."""
+    aceptadas = {}
+    for parte in cabecera.split(','):
+        coincidencia = _ACEPTA_CODIFICACION.match(parte)
+        if not coincidencia or not coincidencia.group(1):
+            continue
+        try:
+            calidad = float(coincidencia.group(2)) if coincidencia.group(2) else 1.0
+        except ValueError:
+            continue
+        aceptadas[coincidencia.group(1).lower()] = calidad
+    return aceptadas
+
+
+def elegir_codificacion(cabecera):
+    aceptadas = codificaciones_aceptadas(cabecera)
+    comodin = aceptadas.get('*', 0)
+    if brotli is not None and aceptadas.get('br', comodin) > 0:
+        return 'br'
+    if aceptadas.get('gzip', comodin) > 0:
+        return 'gzip'
+    return None
+
+
+def _comprimir_brotli(contenido):
+    return brotli.compress(contenido, quality=settings.COMPRESION_BROTLI_CALIDAD)
+
+
+def _secuencia_brotli(secuencia):
+    compresor = brotli.Compressor(quality=settings.COMPRESION_BROTLI_CALIDAD)
+    for parte in secuencia:
+        salida = compresor.process(parte) + compresor.flush()
+        if salida:
+            yield salida
+    yield compresor.finish()
+
+
+class CompresionAPIMiddleware(MiddlewareMixin):
+    """
+    Comprime con brotli (si está instalado) o gzip, según Accept-Encoding, las respuestas
+    de la API (COMPRESION_API_PREFIJOS) que superan COMPRESION_API_UMBRAL bytes. Las
+    respuestas por streaming se comprimen parte por parte. Los endpoints de tokens
+    (COMPRESION_API_EXCLUIDOS) no se comprimen: llevan secretos y serían vulnerables a
+    BREACH. También registra el tamaño de cada respuesta por endpoint (ver telemetria.py).
+    """
+    def process_response(self, request, response):
+        ruta = request.path_info
+        if not ruta.startswith(tuple(settings.COMPRESION_API_PREFIJOS)):
+            return response
+        endpoint = self._endpoint(request)
+        excluida = ruta.startswith(tuple(settings.COMPRESION_API_EXCLUIDOS))
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codificacion = None
+        if not excluida and not response.has_header('Content-Encoding') and self._comprimible(response):
+            codificacion = elegir_codificacion(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+        if response.streaming:
+            self._envolver_streaming(response, endpoint, codificacion)
+            return response
+
+        tamano = len(response.content)
+        if codificacion and tamano >= settings.COMPRESION_API_UMBRAL:
+            if codificacion == 'br':
+                comprimido = _comprimir_brotli(response.content)
+            else:
+                comprimido = compress_string(response.content, max_random_bytes=MAXIMO_BYTES_ALEATORIOS)
+            if len(comprimido) < tamano:
+                response.content = comprimido
+                response.headers['Content-Length'] = str(len(comprimido))
+                self._marcar(response, codificacion)
+            else:
+                codificacion = None
+        else:
+            codificacion = None
+
+        registrar_respuesta(endpoint, tamano, len(response.content), codificacion)
+        return response
+
+    def _endpoint(self, request):
+        coincidencia = getattr(request, 'resolver_match', None)
+        # Las rutas que no existen se agrupan: cada URL distinta sería un endpoint más en memoria
+        nombre = coincidencia.view_name if coincidencia else '(sin ruta)'
+        return f"{request.method} {nombre}"
+
+    def _comprimible(self, response):
+        return response.get('Content-Type', '').startswith(TIPOS_COMPRIMIBLES)
+
+    def _marcar(self, response, codificacion):
+        response.headers['Content-Encoding'] = codificacion
+        # El ETag fuerte deja de valer para el cuerpo comprimido
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+
+    def _envolver_streaming(self, response, endpoint, codificacion):
+        """
+        Cuenta los bytes (antes y después de comprimir) a medida que se envían y los
+        registra al terminar. Un streaming siempre se comprime: su tamaño no se conoce.
+        """
+        totales = {'original': 0, 'enviado': 0}
+
+        def contar_original(parte):
+            totales['original'] += len(parte)
+            return parte
+
+        def contar_enviado(parte):
+            totales['enviado'] += len(parte)
+            return parte
+
+        if codificacion:
+            response.headers.pop('Content-Length', None)
+            self._marcar(response, codificacion)
+
+        if response.is_async:
+            original = response.streaming_content
+
+            async def envolver():
+                compresor = brotli.Compressor(quality=settings.COMPRESION_BROTLI_CALIDAD) if codificacion == 'br' else None
+                async for parte in original:
+                    parte = contar_original(parte)
+                    if codificacion == 'br':
+                        parte = compresor.process(parte) + compresor.flush()
+                    elif codificacion == 'gzip':
+                        parte = compress_string(parte, max_random_bytes=MAXIMO_BYTES_ALEATORIOS)
+                    if parte:
+                        yield contar_enviado(parte)
+                if compresor is not None:
+                    yield contar_enviado(compresor.finish())
+                registrar_respuesta(endpoint, totales['original'], totales['enviado'], codificacion)
+
+            response.streaming_content = envolver()
+            return
+
+        secuencia = (contar_original(parte) for parte in response.streaming_content)
+        if codificacion == 'br':
+            secuencia = _secuencia_brotli(secuencia)
+        elif codificacion == 'gzip':
+            secuencia = compress_sequence(secuencia, max_random_bytes=MAXIMO_BYTES_ALEATORIOS)
+
+        def envolver():
+            for parte in secuencia:
+                yield contar_enviado(parte)
+            registrar_respuesta(endpoint, totales['original'], totales['enviado'], codificacion)
+
+        response.streaming_content = envolver()
+
+
+class AdherenciaReplicaMiddleware(MiddlewareMixin):
+    """
+    Después de una escritura exitosa de un usuario autenticado, sus lecturas vuelven al
+    primario durante REPLICA_ADHERENCIA_SEGUNDOS para que vea sus propios cambios aunque la
+    réplica vaya atrasada. DRF deja en request.user el usuario autenticado por JWT.
+    """
+    def process_response(self, request, response):
+        if not replica_configurada() or request.method in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            return response
+        usuario = getattr(request, 'user', None)
+        if response.status_code < 400 and usuario is not None and usuario.is_authenticated:
+            registrar_escritura(usuario.pk)
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:57
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_alter_articulo_codigo_interno_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaArchivo',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('tamano_total', models.PositiveBigIntegerField()),
+                ('bytes_recibidos', models.PositiveBigIntegerField(default=0)),
+                ('estado', models.CharField(choices=[('En Progreso', 'En Progreso'), ('Completada', 'Completada'), ('Importando', 'Importando'), ('Importada', 'Importada')], default='En Progreso', max_length=20)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cargas_archivo', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'carga_archivo',
+            },
+        ),
+    ]
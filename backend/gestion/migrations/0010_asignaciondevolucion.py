@@ -0,0 +1,71 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def registrar_devoluciones_existentes(apps, schema_editor):
+    # Las devoluciones anteriores cubrían un único préstamo: el de prestamo_relacionado
+    Movimiento = apps.get_model('gestion', 'Movimiento')
+    HistorialPrestamo = apps.get_model('gestion', 'HistorialPrestamo')
+    AsignacionDevolucion = apps.get_model('gestion', 'AsignacionDevolucion')
+
+    prestamo_por_movimiento = dict(
+        HistorialPrestamo.objects.filter(movimiento_prestamo__isnull=False)
+        .values_list('movimiento_prestamo_id', 'id')
+    )
+    devoluciones = Movimiento.objects.filter(
+        tipo_movimiento='Regresado', prestamo_relacionado__isnull=False
+    ).values_list('id', 'prestamo_relacionado_id', 'cantidad')
+
+    AsignacionDevolucion.objects.bulk_create(
+        [
+            AsignacionDevolucion(
+                movimiento_devolucion_id=movimiento_id,
+                prestamo_id=prestamo_por_movimiento[prestamo_movimiento_id],
+                cantidad=cantidad,
+            )
+            for movimiento_id, prestamo_movimiento_id, cantidad in devoluciones.iterator()
+            if prestamo_movimiento_id in prestamo_por_movimiento
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_cargaarchivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AsignacionDevolucion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+            ],
+            options={
+                'db_table': 'asignacion_devolucion',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='historialprestamo',
+            index=models.Index(condition=models.Q(('cantidad_restante__gt', 0)), fields=['articulo', 'personal', 'fecha_prestamo', 'id'], name='prestamo_abierto_idx'),
+        ),
+        migrations.AddField(
+            model_name='asignaciondevolucion',
+            name='movimiento_devolucion',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='asignaciones_devolucion', to='gestion.movimiento'),
+        ),
+        migrations.AddField(
+            model_name='asignaciondevolucion',
+            name='prestamo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='asignaciones', to='gestion.historialprestamo'),
+        ),
+        migrations.AddConstraint(
+            model_name='asignaciondevolucion',
+            constraint=models.UniqueConstraint(fields=('movimiento_devolucion', 'prestamo'), name='asignacion_unica'),
+        ),
+        migrations.RunPython(registrar_devoluciones_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_asignaciondevolucion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimiento',
+            name='articulo_destino',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_destino', to='gestion.articulo'),
+        ),
+        migrations.AddField(
+            model_name='movimiento',
+            name='estado_anterior',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_anteriores', to='gestion.estadoarticulo'),
+        ),
+        migrations.AddField(
+            model_name='movimiento',
+            name='movimiento_revertido',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='anulacion', to='gestion.movimiento'),
+        ),
+        migrations.AlterField(
+            model_name='historialstock',
+            name='tipo_movimiento',
+            field=models.CharField(choices=[('Entrada', 'Entrada'), ('Salida', 'Salida'), ('Nuevo Articulo', 'Nuevo Articulo'), ('Cambio de Estado', 'Cambio de Estado'), ('Prestamo', 'Prestamo'), ('Regresado', 'Regresado'), ('Cambio de Estado por Unidad', 'Cambio de Estado por Unidad'), ('Anulacion', 'Anulacion')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='tipo_movimiento',
+            field=models.CharField(choices=[('Entrada', 'Entrada'), ('Salida', 'Salida'), ('Nuevo Articulo', 'Nuevo Articulo'), ('Cambio de Estado', 'Cambio de Estado'), ('Cambio de Estado por Unidad', 'Cambio de Estado por Unidad'), ('Prestamo', 'Prestamo'), ('Regresado', 'Regresado'), ('Anulacion', 'Anulacion')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_movimiento_reversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='articulo',
+            index=models.Index(fields=['nombre', 'categoria', 'marca', 'modelo', 'ubicacion', 'estado'], name='articulo_identidad_idx'),
+        ),
+    ]
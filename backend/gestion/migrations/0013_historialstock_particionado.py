@@ -0,0 +1,138 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:07
+
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+# El SQL de esta migración queda fijo aquí: no depende de gestion/historial.py, que
+# puede cambiar después sin alterar lo que hace la migración.
+TABLA = 'historial_stock'
+
+
+def _mes_siguiente(anio, mes):
+    return (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def _inicio_mes(anio, mes):
+    return datetime(anio, mes, 1, tzinfo=dt_timezone.utc)
+
+
+def _esta_particionada(cursor, tabla):
+    cursor.execute("SELECT c.relkind = 'p' FROM pg_class c WHERE c.oid = to_regclass(%s)", [tabla])
+    fila = cursor.fetchone()
+    return bool(fila and fila[0])
+
+
+def _crear_particion(cursor, tabla, anio, mes):
+    """Partición mensual de `tabla`; mueve a ella las filas del mes que estaban en la partición por defecto."""
+    nombre = f"{tabla}_p{anio:04d}_{mes:02d}"
+    desde = _inicio_mes(anio, mes)
+    hasta = _inicio_mes(*_mes_siguiente(anio, mes))
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [nombre])
+    if cursor.fetchone()[0]:
+        return
+
+    cursor.execute(f"ALTER TABLE {tabla} DETACH PARTITION {tabla}_default")
+    cursor.execute(
+        f"CREATE TABLE {nombre} PARTITION OF {tabla} FOR VALUES FROM (%s) TO (%s)",
+        [desde, hasta]
+    )
+    cursor.execute(
+        f"WITH movidas AS (DELETE FROM {tabla}_default WHERE fecha >= %s AND fecha < %s RETURNING *) "
+        f"INSERT INTO {nombre} SELECT * FROM movidas",
+        [desde, hasta]
+    )
+    cursor.execute(f"ALTER TABLE {tabla} ATTACH PARTITION {tabla}_default DEFAULT")
+
+
+def particionar(conexion, tabla=TABLA):
+    """
+    Convierte `tabla` en una tabla particionada por rango mensual de `fecha`, conservando
+    filas, índices y claves foráneas. La clave primaria pasa a ser (id, fecha) porque
+    PostgreSQL exige que incluya la columna de partición.
+    """
+    with conexion.cursor() as cursor:
+        if _esta_particionada(cursor, tabla):
+            return
+
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE tablename = %s AND indexname NOT IN ("
+            "  SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u'))",
+            [tabla, tabla]
+        )
+        indices = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [tabla]
+        )
+        foraneas = cursor.fetchall()
+        cursor.execute(f"SELECT min(fecha), max(fecha) FROM {tabla}")
+        minima, maxima = cursor.fetchone()
+
+        # Liberar los nombres de índices y restricciones antes de recrearlos en la nueva tabla
+        cursor.execute(f"ALTER TABLE {tabla} RENAME TO {tabla}_anterior")
+        for nombre, _ in indices:
+            cursor.execute(f'DROP INDEX "{nombre}"')
+        for nombre, _ in foraneas:
+            cursor.execute(f'ALTER TABLE {tabla}_anterior DROP CONSTRAINT "{nombre}"')
+        cursor.execute(f"ALTER TABLE {tabla}_anterior DROP CONSTRAINT IF EXISTS {tabla}_pkey")
+
+        cursor.execute(
+            f"CREATE TABLE {tabla} (LIKE {tabla}_anterior INCLUDING DEFAULTS INCLUDING IDENTITY) "
+            f"PARTITION BY RANGE (fecha)"
+        )
+        cursor.execute(f"ALTER TABLE {tabla} ADD CONSTRAINT {tabla}_pkey PRIMARY KEY (id, fecha)")
+        cursor.execute(f"CREATE TABLE {tabla}_default PARTITION OF {tabla} DEFAULT")
+
+        hoy = datetime.now(dt_timezone.utc)
+        anio, mes = (minima.year, minima.month) if minima else (hoy.year, hoy.month)
+        ultimo = max((maxima.year, maxima.month) if maxima else (0, 0), (hoy.year, hoy.month))
+        while (anio, mes) <= ultimo:
+            _crear_particion(cursor, tabla, anio, mes)
+            anio, mes = _mes_siguiente(anio, mes)
+
+        cursor.execute(f"INSERT INTO {tabla} SELECT * FROM {tabla}_anterior")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT max(id) FROM {tabla}), 0) + 1, false)",
+            [tabla]
+        )
+        cursor.execute(f"DROP TABLE {tabla}_anterior")
+
+        for _, definicion in indices:
+            cursor.execute(definicion)
+        for nombre, definicion in foraneas:
+            cursor.execute(f'ALTER TABLE {tabla} ADD CONSTRAINT "{nombre}" {definicion}')
+
+    logger.info(f"{tabla} convertido en tabla particionada por mes.")
+
+
+def particionar_historial(apps, schema_editor):
+    # Solo en PostgreSQL; en otros motores historial_stock sigue siendo una tabla simple
+    if schema_editor.connection.vendor == 'postgresql':
+        particionar(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_articulo_identidad_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialstock',
+            index=models.Index(fields=['articulo', 'fecha'], name='historial_articulo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialstock',
+            index=models.Index(fields=['fecha'], name='historial_fecha_idx'),
+        ),
+        migrations.RunPython(particionar_historial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0013_historialstock_particionado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historialstock',
+            name='tipo_movimiento',
+            field=models.CharField(choices=[('Entrada', 'Entrada'), ('Salida', 'Salida'), ('Nuevo Articulo', 'Nuevo Articulo'), ('Cambio de Estado', 'Cambio de Estado'), ('Prestamo', 'Prestamo'), ('Regresado', 'Regresado'), ('Cambio de Estado por Unidad', 'Cambio de Estado por Unidad'), ('Anulacion', 'Anulacion'), ('Conciliacion', 'Conciliacion')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0014_historialstock_conciliacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimiento',
+            index=models.Index(fields=['articulo', 'fecha', 'id'], name='movimiento_articulo_fecha_idx'),
+        ),
+    ]
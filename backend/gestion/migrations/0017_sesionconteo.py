@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0016_historialstock_edicion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SesionConteo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255)),
+                ('estado', models.CharField(choices=[('Abierta', 'Abierta'), ('Confirmada', 'Confirmada'), ('Cancelada', 'Cancelada')], default='Abierta', max_length=20)),
+                ('fecha_inicio', models.DateTimeField(auto_now_add=True)),
+                ('fecha_cierre', models.DateTimeField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='gestion.categoria')),
+                ('ubicacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='gestion.ubicacion')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sesiones_conteo', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'sesion_conteo',
+            },
+        ),
+        migrations.CreateModel(
+            name='LineaConteo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_inicial', models.IntegerField()),
+                ('cantidad_contada', models.PositiveIntegerField(blank=True, null=True)),
+                ('fecha_conteo', models.DateTimeField(blank=True, null=True)),
+                ('articulo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas_conteo', to='gestion.articulo')),
+                ('sesion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='gestion.sesionconteo')),
+            ],
+            options={
+                'db_table': 'linea_conteo',
+                'constraints': [models.UniqueConstraint(fields=('sesion', 'articulo'), name='linea_conteo_unica')],
+            },
+        ),
+    ]
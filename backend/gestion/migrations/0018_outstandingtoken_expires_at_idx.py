@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0017_sesionconteo'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        # token_blacklist no indexa expires_at; sin este índice cada lote de la purga de
+        # tokens vencidos (gestion/mantenimiento_tokens.py) recorre toda la tabla.
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS outstandingtoken_expires_at_idx "
+                "ON token_blacklist_outstandingtoken (expires_at)",
+            reverse_sql="DROP INDEX IF EXISTS outstandingtoken_expires_at_idx",
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:36
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0018_outstandingtoken_expires_at_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=255)),
+                ('endpoint', models.CharField(max_length=255)),
+                ('hash_solicitud', models.CharField(max_length=64)),
+                ('estado', models.CharField(choices=[('En proceso', 'En proceso'), ('Completada', 'Completada')], default='En proceso', max_length=20)),
+                ('codigo_estado', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('respuesta', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_vencimiento', models.DateTimeField(db_index=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claves_idempotencia', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'clave_idempotencia',
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'clave'), name='clave_idempotencia_unica')],
+            },
+        ),
+    ]
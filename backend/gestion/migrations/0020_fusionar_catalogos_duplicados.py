@@ -0,0 +1,120 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:45
+
+import logging
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+CATALOGOS = ['Motivo', 'Categoria', 'Marca', 'Modelo', 'Ubicacion', 'EstadoArticulo']
+
+# Campos de Articulo que son únicos junto con el estado (unique_together)
+UNICOS_POR_ESTADO = ['codigo_interno', 'codigo_minvu', 'numero_serie', 'mac']
+
+TAMANO_LOTE = 500
+
+
+def _grupos_duplicados(modelo):
+    """[(id conservado, [ids duplicados])] por nombre sin distinguir mayúsculas; se conserva el más antiguo."""
+    grupos = {}
+    for pk, nombre in modelo.objects.order_by('id').values_list('id', 'nombre'):
+        grupos.setdefault(nombre.lower(), []).append(pk)
+    return [(ids[0], ids[1:]) for ids in grupos.values() if len(ids) > 1]
+
+
+def _separar_estados_en_conflicto(Articulo, EstadoArticulo, grupos):
+    """
+    Un estado duplicado no se puede fusionar si alguno de sus artículos repite un código
+    (o serie/MAC) de otro artículo del estado conservado: violaría unique_together. Esos
+    duplicados se renombran con su id en lugar de fusionarse.
+    """
+    fusionables = []
+    for conservado, duplicados in grupos:
+        ocupados = {campo: set() for campo in UNICOS_POR_ESTADO}
+        por_estado = {}
+        for fila in Articulo.objects.filter(estado_id__in=[conservado, *duplicados]).values('estado_id', *UNICOS_POR_ESTADO):
+            por_estado.setdefault(fila['estado_id'], []).append(fila)
+
+        aceptados = []
+        for estado_id in [conservado, *duplicados]:
+            valores = {
+                campo: {fila[campo] for fila in por_estado.get(estado_id, []) if fila[campo]}
+                for campo in UNICOS_POR_ESTADO
+            }
+            if estado_id != conservado and any(valores[campo] & ocupados[campo] for campo in UNICOS_POR_ESTADO):
+                estado = EstadoArticulo.objects.get(pk=estado_id)
+                estado.nombre = f"{estado.nombre[:90]} ({estado.pk})"
+                estado.save(update_fields=['nombre'])
+                logger.warning(
+                    f"Estado de artículo {estado.pk} no fusionado (códigos repetidos con el estado "
+                    f"{conservado}); se renombró a '{estado.nombre}'."
+                )
+                continue
+            for campo in UNICOS_POR_ESTADO:
+                ocupados[campo] |= valores[campo]
+            if estado_id != conservado:
+                aceptados.append(estado_id)
+        if aceptados:
+            fusionables.append((conservado, aceptados))
+    return fusionables
+
+
+def _reasignar(modelo, reemplazos):
+    """Apunta al registro conservado todas las claves foráneas hacia los duplicados, con un UPDATE por lote."""
+    pares = list(reemplazos.items())
+    for relacion in modelo._meta.related_objects:
+        if not relacion.one_to_many:
+            continue
+        campo = relacion.field.name
+        for inicio in range(0, len(pares), TAMANO_LOTE):
+            lote = pares[inicio:inicio + TAMANO_LOTE]
+            relacion.related_model._base_manager.filter(**{f'{campo}__in': [viejo for viejo, _ in lote]}).update(**{
+                campo: models.Case(
+                    *[models.When(**{campo: viejo}, then=models.Value(nuevo)) for viejo, nuevo in lote],
+                    output_field=models.IntegerField(),
+                )
+            })
+
+
+def fusionar_duplicados(apps, schema_editor):
+    Articulo = apps.get_model('gestion', 'Articulo')
+    for nombre_modelo in CATALOGOS:
+        modelo = apps.get_model('gestion', nombre_modelo)
+        grupos = _grupos_duplicados(modelo)
+        if nombre_modelo == 'EstadoArticulo':
+            grupos = _separar_estados_en_conflicto(Articulo, modelo, grupos)
+        if not grupos:
+            continue
+
+        reemplazos = {duplicado: conservado for conservado, duplicados in grupos for duplicado in duplicados}
+        # Conserva la descripción de un duplicado si el registro conservado no tiene
+        for conservado, duplicados in grupos:
+            registro = modelo.objects.get(pk=conservado)
+            if not registro.descripcion:
+                descripcion = (
+                    modelo.objects.filter(pk__in=duplicados).exclude(descripcion__isnull=True).exclude(descripcion='')
+                    .order_by('id').values_list('descripcion', flat=True).first()
+                )
+                if descripcion:
+                    registro.descripcion = descripcion
+                    registro.save(update_fields=['descripcion'])
+
+        _reasignar(modelo, reemplazos)
+        ids = list(reemplazos)
+        for inicio in range(0, len(ids), TAMANO_LOTE):
+            modelo.objects.filter(pk__in=ids[inicio:inicio + TAMANO_LOTE]).delete()
+        logger.warning(f"{nombre_modelo}: {len(ids)} nombres duplicados (sin distinguir mayúsculas) fusionados.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0019_claveidempotencia'),
+    ]
+
+    operations = [
+        # Los índices únicos por LOWER(nombre) de 0021 no se pueden crear mientras existan
+        # nombres que solo difieren en mayúsculas. Va en una migración aparte: en PostgreSQL
+        # no se puede alterar una tabla con verificaciones de claves foráneas pendientes.
+        migrations.RunPython(fusionar_duplicados, migrations.RunPython.noop),
+    ]
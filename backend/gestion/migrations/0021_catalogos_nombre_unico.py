@@ -0,0 +1,68 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:46
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0020_fusionar_catalogos_duplicados'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categoria',
+            name='nombre',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='estadoarticulo',
+            name='nombre',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='marca',
+            name='nombre',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='modelo',
+            name='nombre',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='motivo',
+            name='nombre',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='ubicacion',
+            name='nombre',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='categoria',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('nombre'), name='categoria_nombre_unico', violation_error_message='Ya existe un registro con este nombre (sin distinguir mayúsculas).'),
+        ),
+        migrations.AddConstraint(
+            model_name='estadoarticulo',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('nombre'), name='estado_articulo_nombre_unico', violation_error_message='Ya existe un registro con este nombre (sin distinguir mayúsculas).'),
+        ),
+        migrations.AddConstraint(
+            model_name='marca',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('nombre'), name='marca_nombre_unico', violation_error_message='Ya existe un registro con este nombre (sin distinguir mayúsculas).'),
+        ),
+        migrations.AddConstraint(
+            model_name='modelo',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('nombre'), name='modelo_nombre_unico', violation_error_message='Ya existe un registro con este nombre (sin distinguir mayúsculas).'),
+        ),
+        migrations.AddConstraint(
+            model_name='motivo',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('nombre'), name='motivo_nombre_unico', violation_error_message='Ya existe un registro con este nombre (sin distinguir mayúsculas).'),
+        ),
+        migrations.AddConstraint(
+            model_name='ubicacion',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('nombre'), name='ubicacion_nombre_unico', violation_error_message='Ya existe un registro con este nombre (sin distinguir mayúsculas).'),
+        ),
+    ]
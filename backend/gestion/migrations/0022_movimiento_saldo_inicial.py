@@ -0,0 +1,87 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:56
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+COMENTARIO_SALDO_INICIAL = "Saldo inicial: stock del artículo al abrir el registro de movimientos."
+
+TAMANO_LOTE = 2000
+
+
+def registrar_saldos_iniciales(apps, schema_editor):
+    """
+    Un movimiento 'Saldo Inicial' por artículo con su stock disponible y prestado actuales.
+    Los artículos cargados con la importación antigua, el actualizar_stock anterior o
+    préstamos creados directamente no tienen movimientos que expliquen su stock; sin este
+    saldo la conciliación los llevaría a cero. Desde aquí la conciliación solo suma los
+    movimientos posteriores al saldo inicial de cada artículo.
+    """
+    Articulo = apps.get_model('gestion', 'Articulo')
+    Movimiento = apps.get_model('gestion', 'Movimiento')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    if not Articulo.objects.exists():
+        return
+    usuario = (
+        User.objects.filter(is_superuser=True).order_by('id').first()
+        or User.objects.order_by('id').first()
+    )
+    if usuario is None:
+        logger.warning("No hay usuarios a quien asignar los saldos iniciales; no se registraron.")
+        return
+
+    ahora = timezone.now()
+    lote = []
+    total = 0
+    articulos = Articulo.objects.order_by('id').values('id', 'stock_actual', 'stock_prestado', 'ubicacion_id')
+    for articulo in articulos.iterator(chunk_size=TAMANO_LOTE):
+        lote.append(Movimiento(
+            articulo_id=articulo['id'],
+            tipo_movimiento='Saldo Inicial',
+            cantidad=max(articulo['stock_actual'], 0),
+            stock_prestado_inicial=articulo['stock_prestado'],
+            fecha=ahora,
+            usuario_id=usuario.pk,
+            ubicacion_id=articulo['ubicacion_id'],
+            comentario=COMENTARIO_SALDO_INICIAL,
+        ))
+        if len(lote) >= TAMANO_LOTE:
+            Movimiento.objects.bulk_create(lote)
+            total += len(lote)
+            lote = []
+    Movimiento.objects.bulk_create(lote)
+    total += len(lote)
+    logger.warning(f"Saldo inicial registrado para {total} artículos.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0021_catalogos_nombre_unico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimiento',
+            name='stock_prestado_inicial',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='tipo_movimiento',
+            field=models.CharField(choices=[('Entrada', 'Entrada'), ('Salida', 'Salida'), ('Nuevo Articulo', 'Nuevo Articulo'), ('Cambio de Estado', 'Cambio de Estado'), ('Cambio de Estado por Unidad', 'Cambio de Estado por Unidad'), ('Prestamo', 'Prestamo'), ('Regresado', 'Regresado'), ('Anulacion', 'Anulacion'), ('Saldo Inicial', 'Saldo Inicial')], max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='movimiento',
+            index=models.Index(condition=models.Q(('tipo_movimiento', 'Saldo Inicial')), fields=['articulo', 'id'], name='movimiento_saldo_inicial_idx'),
+        ),
+        # Después de los cambios de esquema: en PostgreSQL no se puede alterar una tabla con
+        # verificaciones de claves foráneas pendientes
+        migrations.RunPython(registrar_saldos_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0022_movimiento_saldo_inicial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movimiento',
+            name='movimiento_revertido',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='anulacion', to='gestion.movimiento'),
+        ),
+    ]
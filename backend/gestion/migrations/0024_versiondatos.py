@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-19 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0023_movimiento_revertido_cascade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionDatos',
+            fields=[
+                ('clave', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('valor', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'version_datos',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0024_versiondatos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargaarchivo',
+            name='recibiendo_hasta',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,79 +1,127 @@
 # gestion_bodega/models.py
 
+import logging
+import uuid
+
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 
+logger = logging.getLogger(__name__)
+
+class CatalogoQuerySet(models.QuerySet):
+    """
+    Búsquedas por nombre sin distinguir mayúsculas. Comparan LOWER(nombre), que es la
+    expresión del índice único de cada catálogo, en lugar de iexact (UPPER en PostgreSQL),
+    que no puede usar ese índice.
+    """
+    def por_nombre(self, nombre):
+        return self.alias(nombre_minusculas=Lower('nombre')).filter(nombre_minusculas=Lower(models.Value(nombre)))
+
+    def por_nombres(self, nombres):
+        return self.alias(nombre_minusculas=Lower('nombre')).filter(
+            nombre_minusculas__in=[Lower(models.Value(nombre)) for nombre in nombres]
+        )
+
+
+def nombre_unico(tabla):
+    return models.UniqueConstraint(
+        Lower('nombre'),
+        name=f'{tabla}_nombre_unico',
+        violation_error_message="Ya existe un registro con este nombre (sin distinguir mayúsculas).",
+    )
+
+
 class Motivo(models.Model):
-    nombre = models.CharField(max_length=100, unique=True)
+    nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         db_table = 'motivo'
+        constraints = [nombre_unico('motivo')]
 
     def __str__(self):
         return self.nombre
 
 
 class Categoria(models.Model):
-    nombre = models.CharField(max_length=100, unique=True)
+    nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
     requiere_codigo_interno = models.BooleanField(default=False)
     requiere_codigo_minvu = models.BooleanField(default=False)
     requiere_numero_serie = models.BooleanField(default=False)
     requiere_mac = models.BooleanField(default=False)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         db_table = 'categoria'
+        constraints = [nombre_unico('categoria')]
 
     def __str__(self):
         return self.nombre
 
 
 class Marca(models.Model):
-    nombre = models.CharField(max_length=100, unique=True)
+    nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         db_table = 'marca'
+        constraints = [nombre_unico('marca')]
 
     def __str__(self):
         return self.nombre
 
 
 class Modelo(models.Model):
-    nombre = models.CharField(max_length=100, unique=True)
+    nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
     marca = models.ForeignKey(Marca, on_delete=models.SET_NULL, null=True, blank=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         db_table = 'modelo'
+        constraints = [nombre_unico('modelo')]
 
     def __str__(self):
         return self.nombre
 
 
 class Ubicacion(models.Model):
-    nombre = models.CharField(max_length=100, unique=True)
+    nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         db_table = 'ubicacion'
+        constraints = [nombre_unico('ubicacion')]
 
     def __str__(self):
         return self.nombre
 
 
 class EstadoArticulo(models.Model):
-    nombre = models.CharField(max_length=100, unique=True)  # Ej: "Bueno", "Malo", "Baja", etc.
+    nombre = models.CharField(max_length=100)  # Ej: "Bueno", "Malo", "Baja", etc.
     descripcion = models.TextField(blank=True, null=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         db_table = 'estado_articulo'
+        constraints = [nombre_unico('estado_articulo')]
 
     def __str__(self):
         return self.nombre
@@ -117,6 +165,13 @@ class Articulo(models.Model):
             ('estado', 'numero_serie'),
             ('estado', 'mac'),
         ]
+        indexes = [
+            # Búsqueda del mismo artículo en otro estado (transferencias de estado)
+            models.Index(
+                fields=['nombre', 'categoria', 'marca', 'modelo', 'ubicacion', 'estado'],
+                name='articulo_identidad_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -147,6 +202,16 @@ class Articulo(models.Model):
         super().save(*args, **kwargs)
 
 
+class HistorialStockQuerySet(models.QuerySet):
+    # El historial es un registro de solo inserción: las correcciones se hacen con
+    # movimientos compensatorios y el archivo de meses antiguos va por gestion/historial.py.
+    def update(self, **kwargs):
+        raise ValidationError("El historial de stock es de solo inserción; no se puede modificar.")
+
+    def delete(self):
+        raise ValidationError("El historial de stock es de solo inserción; no se puede eliminar.")
+
+
 class HistorialStock(models.Model):
     TIPO_MOVIMIENTO = [
         ('Entrada', 'Entrada'),
@@ -156,6 +221,9 @@ class HistorialStock(models.Model):
         ('Prestamo', 'Prestamo'),    # Agregado
         ('Regresado', 'Regresado'),  # Agregado
         ('Cambio de Estado por Unidad', 'Cambio de Estado por Unidad'),  # Nueva opción
+        ('Anulacion', 'Anulacion'),
+        ('Conciliacion', 'Conciliacion'),  # Corrección del stock según los movimientos (gestion/conciliacion.py)
+        ('Edicion', 'Edicion'),  # Cambio de datos sin efecto en el stock (gestion/edicion_masiva.py)
     ]
 
     articulo = models.ForeignKey(Articulo, on_delete=models.CASCADE)
@@ -169,12 +237,26 @@ class HistorialStock(models.Model):
     motivo = models.ForeignKey(Motivo, on_delete=models.SET_NULL, null=True, blank=True)
     ubicacion = models.ForeignKey(Ubicacion, on_delete=models.SET_NULL, null=True, blank=True)
 
+    objects = HistorialStockQuerySet.as_manager()
+
     class Meta:
         db_table = 'historial_stock'
+        indexes = [
+            models.Index(fields=['articulo', 'fecha'], name='historial_articulo_fecha_idx'),
+            models.Index(fields=['fecha'], name='historial_fecha_idx'),
+        ]
 
     def __str__(self):
         return f'Historial {self.articulo.nombre} - {self.tipo_movimiento} el {self.fecha}'
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("El historial de stock es de solo inserción; no se puede modificar.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("El historial de stock es de solo inserción; no se puede eliminar.")
+
 
 class HistorialPrestamo(models.Model):
     articulo = models.ForeignKey(Articulo, on_delete=models.CASCADE)
@@ -192,10 +274,43 @@ class HistorialPrestamo(models.Model):
         blank=True
     )
 
+    class Meta:
+        indexes = [
+            # Préstamos abiertos de una persona para un artículo, en orden FIFO
+            models.Index(
+                fields=['articulo', 'personal', 'fecha_prestamo', 'id'],
+                condition=models.Q(cantidad_restante__gt=0),
+                name='prestamo_abierto_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Préstamo de {self.articulo.nombre} a {self.personal.nombre} - Restante: {self.cantidad_restante}"
 
 
+class AsignacionDevolucion(models.Model):
+    """
+    Parte de una devolución imputada a un préstamo. Una devolución puede repartirse entre
+    varios préstamos abiertos (FIFO), con una fila por cada préstamo afectado.
+    """
+    movimiento_devolucion = models.ForeignKey(
+        'Movimiento',
+        on_delete=models.CASCADE,
+        related_name='asignaciones_devolucion'
+    )
+    prestamo = models.ForeignKey(HistorialPrestamo, on_delete=models.CASCADE, related_name='asignaciones')
+    cantidad = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = 'asignacion_devolucion'
+        constraints = [
+            models.UniqueConstraint(fields=['movimiento_devolucion', 'prestamo'], name='asignacion_unica'),
+        ]
+
+    def __str__(self):
+        return f"Devolución {self.movimiento_devolucion_id} -> préstamo {self.prestamo_id} ({self.cantidad})"
+
+
 class Movimiento(models.Model):
     TIPO_MOVIMIENTO = [
         ('Entrada', 'Entrada'),
@@ -205,6 +320,8 @@ class Movimiento(models.Model):
         ('Cambio de Estado por Unidad', 'Cambio de Estado por Unidad'),  # Nueva opción
         ('Prestamo', 'Prestamo'),
         ('Regresado', 'Regresado'),
+        ('Anulacion', 'Anulacion'),  # Movimiento compensatorio de otro (ver gestion/reversiones.py)
+        ('Saldo Inicial', 'Saldo Inicial'),  # Stock del artículo al empezar su registro de movimientos
     ]
 
     articulo = models.ForeignKey(Articulo, on_delete=models.CASCADE, related_name='movimientos')
@@ -230,10 +347,45 @@ class Movimiento(models.Model):
         blank=True,
         related_name='movimientos_recibidos'
     )
+    # Datos necesarios para revertir el movimiento sin tener que deducirlos
+    estado_anterior = models.ForeignKey(
+        EstadoArticulo,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_anteriores'
+    )
+    articulo_destino = models.ForeignKey(
+        Articulo,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_destino'
+    )
+    movimiento_revertido = models.OneToOneField(
+        'self',
+        # La anulación sin su original dejaría un efecto sin compensar en el registro
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='anulacion'
+    )
+    # Solo en 'Saldo Inicial': unidades prestadas del artículo en ese momento (cantidad es el disponible)
+    stock_prestado_inicial = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         db_table = 'movimiento'
         ordering = ['-fecha']
+        indexes = [
+            # Línea de tiempo por artículo con paginación por (fecha, id)
+            models.Index(fields=['articulo', 'fecha', 'id'], name='movimiento_articulo_fecha_idx'),
+            # Último saldo inicial de cada artículo (gestion/conciliacion.py)
+            models.Index(
+                fields=['articulo', 'id'],
+                condition=models.Q(tipo_movimiento='Saldo Inicial'),
+                name='movimiento_saldo_inicial_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.tipo_movimiento} - {self.articulo.nombre} ({self.cantidad})"
@@ -287,6 +439,11 @@ class Movimiento(models.Model):
                 raise ValidationError("El personal es obligatorio para una devolución.")
 
     def save(self, *args, **kwargs):
+        if self.tipo_movimiento == 'Cambio de Estado por Unidad' and self._state.adding:
+            # Afecta a dos artículos; se registra con gestion.transferencias.transferir_estado
+            raise ValidationError("Las transferencias de estado por unidad se registran con transferir_estado.")
+        if self.tipo_movimiento == 'Saldo Inicial':
+            raise ValidationError("El saldo inicial solo lo registra la migración que abre el registro de movimientos.")
         self.clean()  # Ejecuta las validaciones antes de guardar.
 
         articulo = self.articulo
@@ -309,34 +466,9 @@ class Movimiento(models.Model):
             if articulo.stock_prestado == 0:
                 articulo.prestado = False
 
-        elif self.tipo_movimiento == 'Cambio de Estado por Unidad':
-            # Disminuir stock del estado actual
-            articulo.stock_actual -= self.cantidad
-
-            # Obtener o crear el artículo en el nuevo estado
-            articulo_nuevo_estado, created = Articulo.objects.get_or_create(
-                nombre=articulo.nombre,
-                categoria=articulo.categoria,
-                marca=articulo.marca,
-                modelo=articulo.modelo,
-                ubicacion=articulo.ubicacion,
-                estado=self.estado_nuevo,
-                defaults={
-                    'stock_actual': self.cantidad,
-                    'stock_minimo': articulo.stock_minimo,
-                    'descripcion': articulo.descripcion,
-                    'codigo_interno': articulo.codigo_interno,
-                    'codigo_minvu': articulo.codigo_minvu,
-                    'numero_serie': articulo.numero_serie,
-                    'mac': articulo.mac,
-                }
-            )
-            if not created:
-                articulo_nuevo_estado.stock_actual += self.cantidad
-                articulo_nuevo_estado.save()
-
         elif self.tipo_movimiento == 'Cambio de Estado':
             # Actualizar el estado del artículo
+            self.estado_anterior = articulo.estado
             articulo.estado = self.estado_nuevo
             articulo.save()
 
@@ -358,6 +490,129 @@ class Movimiento(models.Model):
         super().save(*args, **kwargs)
 
 
+class CargaArchivo(models.Model):
+    """
+    Subida por fragmentos de un archivo de importación. El contenido se escribe en disco
+    a medida que llega, por lo que una subida interrumpida se retoma desde bytes_recibidos.
+    """
+    ESTADOS = [
+        ('En Progreso', 'En Progreso'),
+        ('Completada', 'Completada'),
+        ('Importando', 'Importando'),
+        ('Importada', 'Importada'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    nombre_archivo = models.CharField(max_length=255)
+    tamano_total = models.PositiveBigIntegerField()
+    bytes_recibidos = models.PositiveBigIntegerField(default=0)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='En Progreso')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cargas_archivo')
+    resultado = models.JSONField(null=True, blank=True)
+    # Mientras se escribe un fragmento (ver gestion/cargas.py); vence si el worker muere
+    recibiendo_hasta = models.DateTimeField(null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'carga_archivo'
+
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.bytes_recibidos}/{self.tamano_total})"
+
+
+class SesionConteo(models.Model):
+    """
+    Toma de inventario físico. Al abrirla se guarda el stock de cada artículo incluido;
+    los conteos se comparan contra esa foto y al confirmarla las diferencias se registran
+    como movimientos (ver gestion/conteos.py).
+    """
+    ESTADOS = [
+        ('Abierta', 'Abierta'),
+        ('Confirmada', 'Confirmada'),
+        ('Cancelada', 'Cancelada'),
+    ]
+
+    nombre = models.CharField(max_length=255)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='Abierta')
+    ubicacion = models.ForeignKey(Ubicacion, on_delete=models.SET_NULL, null=True, blank=True)
+    categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sesiones_conteo')
+    fecha_inicio = models.DateTimeField(auto_now_add=True)
+    fecha_cierre = models.DateTimeField(null=True, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'sesion_conteo'
+
+    def __str__(self):
+        return f"{self.nombre} ({self.estado})"
+
+
+class LineaConteo(models.Model):
+    sesion = models.ForeignKey(SesionConteo, on_delete=models.CASCADE, related_name='lineas')
+    articulo = models.ForeignKey(Articulo, on_delete=models.CASCADE, related_name='lineas_conteo')
+    stock_inicial = models.IntegerField()  # stock_actual al abrir la sesión
+    cantidad_contada = models.PositiveIntegerField(null=True, blank=True)
+    fecha_conteo = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'linea_conteo'
+        constraints = [
+            models.UniqueConstraint(fields=['sesion', 'articulo'], name='linea_conteo_unica'),
+        ]
+
+    def __str__(self):
+        return f"Conteo {self.sesion_id} - artículo {self.articulo_id}: {self.cantidad_contada}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Resultado de una solicitud enviada con la cabecera Idempotency-Key. Un reintento con
+    la misma clave recibe la respuesta guardada sin volver a ejecutar la escritura
+    (ver gestion/idempotencia.py). Vence a las IDEMPOTENCIA_TTL horas.
+    """
+    ESTADOS = [
+        ('En proceso', 'En proceso'),
+        ('Completada', 'Completada'),
+    ]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='claves_idempotencia')
+    clave = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=255)
+    hash_solicitud = models.CharField(max_length=64)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='En proceso')
+    codigo_estado = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_vencimiento = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'clave_idempotencia'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='clave_idempotencia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.clave} ({self.endpoint}, {self.estado})"
+
+
+class VersionDatos(models.Model):
+    """
+    Contador que sube con cada escritura confirmada sobre un conjunto de datos ('articulos').
+    Las cachés derivadas (totales por catálogo, previsualizaciones de importación) lo usan
+    en su clave; al estar en la base de datos todos los workers ven el mismo valor.
+    """
+    clave = models.CharField(max_length=50, primary_key=True)
+    valor = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'version_datos'
+
+    def __str__(self):
+        return f"{self.clave}: {self.valor}"
+
+
 class Task(models.Model):
     title = models.CharField(max_length=255)
     task_type = models.CharField(max_length=100, blank=True, null=True)  # Campo opcional
@@ -410,5 +665,5 @@ def notificar_cambio_estado_por_unidad(sender, instance, **kwargs):
     if instance.tipo_movimiento == 'Cambio de Estado por Unidad':
         # Aquí puedes implementar la lógica de notificación
         # Por ejemplo, enviar un correo electrónico, una señal a otro servicio, etc.
-        # Para este ejemplo, simplemente imprimiremos un mensaje en la consola
-        print(f"Notificación: Se realizará un cambio de estado por unidad para el artículo '{instance.articulo.nombre}'.")
+        # Por ahora solo queda en el log
+        logger.info(f"Notificación: Se realizará un cambio de estado por unidad para el artículo '{instance.articulo.nombre}'.")
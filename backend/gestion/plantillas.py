@@ -0,0 +1,182 @@
+# gestion/plantillas.py
+
+import hashlib
+import io
+import json
+import threading
+
+from django.db.models import CharField, Value
+from openpyxl import Workbook
+from openpyxl.styles import Font, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.datavalidation import DataValidation
+
+from .models import Categoria, Ubicacion, Marca, Modelo, EstadoArticulo
+
+# Cambiar este número cuando cambie el formato de la plantilla para invalidar los ETag emitidos.
+VERSION_FORMATO = 2
+
+ENCABEZADOS_PLANTILLA = [
+    'nombre',
+    'stock_actual',
+    'stock_minimo',
+    'categoria',
+    'ubicacion',
+    'marca',
+    'modelo',
+    'estado',
+    'numero_serie',
+    'mac',
+    'codigo_interno',
+    'codigo_minvu',
+    'descripcion'
+]
+
+ANCHOS_COLUMNAS = [20, 15, 15, 15, 15, 15, 15, 15, 20, 17, 15, 15, 25]
+
+FILA_EJEMPLO = [
+    'Ejemplo Artículo',
+    10,  # stock_actual
+    5,   # stock_minimo
+    'Tecnología',
+    'Bodega 1',
+    'Marca Ejemplo',
+    'Modelo Ejemplo',
+    'Bueno',
+    'SN123456',
+    '00:1A:2B:3C:4D:5E',
+    'CI78910',
+    'CM11213',
+    'Descripción del artículo.'
+]
+
+# Columnas de la plantilla que se validan con listas desplegables y el catálogo que las alimenta.
+CATALOGOS_PLANTILLA = [
+    ('categoria', Categoria),
+    ('ubicacion', Ubicacion),
+    ('marca', Marca),
+    ('modelo', Modelo),
+    ('estado', EstadoArticulo),
+]
+
+# Filas de datos (sin encabezado) que reciben la validación.
+FILAS_VALIDADAS = 5000
+
+_plantilla_cache = {'version': None, 'contenido': None}
+_plantilla_lock = threading.Lock()
+
+
+def obtener_catalogos():
+    """
+    Devuelve los nombres de cada catálogo usando una sola consulta (UNION ALL).
+    """
+    consultas = [
+        modelo.objects.annotate(
+            catalogo=Value(campo, output_field=CharField())
+        ).values_list('catalogo', 'nombre')
+        for campo, modelo in CATALOGOS_PLANTILLA
+    ]
+    catalogos = {campo: [] for campo, _ in CATALOGOS_PLANTILLA}
+    for campo, nombre in consultas[0].union(*consultas[1:], all=True):
+        catalogos[campo].append(nombre)
+    for nombres in catalogos.values():
+        nombres.sort(key=str.lower)
+    return catalogos
+
+
+def version_catalogos(catalogos):
+    """
+    Huella de los catálogos: cambia solo si se crea, renombra o elimina algún nombre.
+    """
+    contenido = json.dumps([VERSION_FORMATO, catalogos], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+
+def construir_plantilla(catalogos):
+    """
+    Construye la plantilla de importación con encabezados, fila de ejemplo y listas
+    desplegables alimentadas desde una hoja oculta con los catálogos actuales.
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Plantilla_Articulos"
+
+    # Definir estilos
+    bold_font = Font(bold=True)
+    center_alignment = Alignment(horizontal='center', vertical='center')
+    thin_border = Border(
+        left=Side(style='thin', color='000000'),
+        right=Side(style='thin', color='000000'),
+        top=Side(style='thin', color='000000'),
+        bottom=Side(style='thin', color='000000')
+    )
+
+    # Escribir encabezados con estilos
+    for col_num, header in enumerate(ENCABEZADOS_PLANTILLA, 1):
+        cell = ws.cell(row=1, column=col_num, value=header)
+        cell.font = bold_font
+        cell.alignment = center_alignment
+        cell.border = thin_border
+
+    # Ajustar ancho de columnas
+    for i, width in enumerate(ANCHOS_COLUMNAS, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+
+    # Agregar una fila de ejemplo
+    ws.append(FILA_EJEMPLO)
+    for cell in ws[2]:
+        cell.alignment = Alignment(horizontal='left', vertical='center')
+        cell.border = thin_border
+
+    # Hoja oculta con los catálogos; las validaciones apuntan a sus rangos porque
+    # las listas en línea de Excel están limitadas a 255 caracteres.
+    ws_catalogos = wb.create_sheet("Catalogos")
+    ws_catalogos.sheet_state = 'hidden'
+
+    for col_catalogo, (campo, _) in enumerate(CATALOGOS_PLANTILLA, 1):
+        nombres = catalogos.get(campo, [])
+        ws_catalogos.cell(row=1, column=col_catalogo, value=campo)
+        for fila, nombre in enumerate(nombres, 2):
+            ws_catalogos.cell(row=fila, column=col_catalogo, value=nombre)
+
+        if not nombres:
+            continue
+
+        letra_catalogo = get_column_letter(col_catalogo)
+        letra_plantilla = get_column_letter(ENCABEZADOS_PLANTILLA.index(campo) + 1)
+        # Aviso (no bloqueo): los nombres nuevos siguen siendo válidos y se crean al importar.
+        validacion = DataValidation(
+            type='list',
+            formula1=f"Catalogos!${letra_catalogo}$2:${letra_catalogo}${len(nombres) + 1}",
+            allow_blank=True,
+            showErrorMessage=True,
+            errorStyle='warning',
+            errorTitle='Valor fuera del catálogo',
+            error=f"El valor no existe en el catálogo de {campo}; se creará al importar.",
+        )
+        validacion.add(f"{letra_plantilla}2:{letra_plantilla}{FILAS_VALIDADAS + 1}")
+        ws.add_data_validation(validacion)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def obtener_plantilla():
+    """
+    Devuelve (contenido, etag) de la plantilla. El libro se construye una vez por proceso
+    y por versión de catálogos; mientras los catálogos no cambien se sirve desde memoria.
+    """
+    catalogos = obtener_catalogos()
+    version = version_catalogos(catalogos)
+
+    with _plantilla_lock:
+        if _plantilla_cache['version'] == version:
+            return _plantilla_cache['contenido'], version
+
+    contenido = construir_plantilla(catalogos)
+
+    with _plantilla_lock:
+        _plantilla_cache['version'] = version
+        _plantilla_cache['contenido'] = contenido
+    return contenido, version
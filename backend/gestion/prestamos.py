@@ -0,0 +1,73 @@
+# gestion/prestamos.py
+
+import logging
+
+from .models import AsignacionDevolucion, HistorialPrestamo
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorDevolucion(Exception):
+    pass
+
+
+def prestamos_abiertos(articulo, personal):
+    """
+    Préstamos con saldo de una persona para un artículo, bloqueados y en orden FIFO.
+    Usa el índice parcial prestamo_abierto_idx.
+    """
+    return list(
+        HistorialPrestamo.objects.select_for_update()
+        .filter(articulo=articulo, personal=personal, cantidad_restante__gt=0)
+        .order_by('fecha_prestamo', 'id')
+    )
+
+
+def planificar_devolucion(articulo, personal, cantidad):
+    """
+    Reparte `cantidad` entre los préstamos abiertos, del más antiguo al más reciente.
+    Devuelve [(prestamo, cantidad_asignada), ...]; debe llamarse dentro de una transacción.
+    """
+    prestamos = prestamos_abiertos(articulo, personal)
+    pendiente_total = sum(p.cantidad_restante for p in prestamos)
+    if pendiente_total < cantidad:
+        raise ErrorDevolucion(
+            f"La cantidad a devolver ({cantidad}) excede lo prestado a esta persona ({pendiente_total})."
+        )
+
+    plan = []
+    restante = cantidad
+    for prestamo in prestamos:
+        if restante == 0:
+            break
+        asignada = min(prestamo.cantidad_restante, restante)
+        plan.append((prestamo, asignada))
+        restante -= asignada
+    return plan
+
+
+def aplicar_devolucion(plan, movimiento_devolucion, fecha_devolucion):
+    """
+    Descuenta el saldo de los préstamos del plan y registra las asignaciones.
+    Son dos consultas (un UPDATE y un INSERT) sin importar cuántos préstamos cubra.
+    """
+    prestamos = []
+    asignaciones = []
+    for prestamo, asignada in plan:
+        prestamo.cantidad_restante -= asignada
+        if prestamo.cantidad_restante == 0:
+            prestamo.fecha_devolucion = fecha_devolucion
+        prestamos.append(prestamo)
+        asignaciones.append(AsignacionDevolucion(
+            movimiento_devolucion=movimiento_devolucion,
+            prestamo=prestamo,
+            cantidad=asignada,
+        ))
+
+    HistorialPrestamo.objects.bulk_update(prestamos, ['cantidad_restante', 'fecha_devolucion'])
+    AsignacionDevolucion.objects.bulk_create(asignaciones)
+    logger.info(
+        f"Devolución {movimiento_devolucion.id} repartida en {len(asignaciones)} préstamo(s)."
+    )
+    return asignaciones
+
@@ -0,0 +1,103 @@
+# gestion/replicas.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+ALIAS_REPLICA = 'replica'
+
+# Solo las lecturas hechas dentro de leyendo_de_replica() van a la réplica
+_usar_replica = ContextVar('usar_replica', default=False)
+
+# Momento (time.monotonic) hasta el que la réplica se considera caída en este proceso
+_replica_caida_hasta = 0.0
+_candado = threading.Lock()
+
+
+def replica_configurada():
+    return ALIAS_REPLICA in settings.DATABASES
+
+
+def replica_disponible():
+    """
+    True si hay réplica y responde. Si falla, el proceso vuelve al primario durante
+    REPLICA_REINTENTO_SEGUNDOS antes de intentar de nuevo.
+    """
+    if not replica_configurada() or time.monotonic() < _replica_caida_hasta:
+        return False
+    try:
+        connections[ALIAS_REPLICA].ensure_connection()
+    except DatabaseError as e:
+        marcar_replica_caida(e)
+        return False
+    return True
+
+
+def marcar_replica_caida(error):
+    global _replica_caida_hasta
+    with _candado:
+        _replica_caida_hasta = time.monotonic() + settings.REPLICA_REINTENTO_SEGUNDOS
+    logger.warning(
+        f"Réplica de lectura no disponible, se usa el primario por "
+        f"{settings.REPLICA_REINTENTO_SEGUNDOS} segundos: {str(error)}"
+    )
+
+
+def _clave_escritura(usuario_id):
+    return f'replica:escritura:{usuario_id}'
+
+
+def registrar_escritura(usuario_id):
+    """Las lecturas de este usuario van al primario hasta que la réplica haya alcanzado su escritura."""
+    cache.set(_clave_escritura(usuario_id), True, timeout=settings.REPLICA_ADHERENCIA_SEGUNDOS)
+
+
+def escribio_recientemente(usuario_id):
+    return cache.get(_clave_escritura(usuario_id)) is not None
+
+
+def leyendo_de_replica_activo():
+    return _usar_replica.get()
+
+
+def usar_primario():
+    """Dentro de leyendo_de_replica(), manda el resto de las lecturas al primario."""
+    _usar_replica.set(False)
+
+
+@contextmanager
+def leyendo_de_replica(activar=True):
+    token = _usar_replica.set(activar)
+    try:
+        yield
+    finally:
+        _usar_replica.reset(token)
+
+
+class RouterReplica:
+    """
+    Envía a la réplica las lecturas hechas dentro de leyendo_de_replica(); todo lo demás,
+    incluidas todas las escrituras, va a 'default'.
+    """
+    def db_for_read(self, model, **hints):
+        if _usar_replica.get() and replica_configurada():
+            return ALIAS_REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explícito: un objeto leído de la réplica se guarda igual en el primario
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, ALIAS_REPLICA}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
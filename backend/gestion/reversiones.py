@@ -0,0 +1,238 @@
+# gestion/reversiones.py
+
+import logging
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Articulo, AsignacionDevolucion, HistorialPrestamo, HistorialStock, Movimiento
+from .totales_catalogos import registrar_cambio_articulos
+
+logger = logging.getLogger(__name__)
+
+# Máximo de movimientos que se aceptan en una anulación por lote
+MAXIMO_LOTE_ANULACION = 500
+
+# Campos de Articulo únicos junto con el estado (unique_together)
+CAMPOS_UNICOS_ESTADO = ['codigo_interno', 'codigo_minvu', 'numero_serie', 'mac']
+
+
+class ErrorReversion(Exception):
+    pass
+
+
+def revertir_movimientos(ids, usuario, comentario=None):
+    """
+    Anula los movimientos indicados registrando, para cada uno, un movimiento 'Anulacion'
+    que compensa su efecto (stock, préstamos o estado) y su entrada en HistorialStock.
+    El original se conserva y queda enlazado por movimiento_revertido.
+
+    Todo el lote se aplica en una transacción: si un movimiento no se puede anular no se
+    anula ninguno. El número de consultas es constante, sin importar el tamaño del lote.
+    Devuelve la lista de movimientos de anulación creados.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ErrorReversion("No se indicaron movimientos para anular.")
+    if len(ids) > MAXIMO_LOTE_ANULACION:
+        raise ErrorReversion(f"Se pueden anular hasta {MAXIMO_LOTE_ANULACION} movimientos por lote.")
+
+    with transaction.atomic():
+        # Del más reciente al más antiguo: una devolución se revierte antes que su préstamo
+        originales = list(
+            Movimiento.objects.select_for_update().filter(id__in=ids).order_by('-fecha', '-id')
+        )
+        faltantes = set(ids) - {m.id for m in originales}
+        if faltantes:
+            raise ErrorReversion(f"No existen los movimientos: {', '.join(map(str, sorted(faltantes)))}.")
+
+        anulados = set(
+            Movimiento.objects.filter(movimiento_revertido_id__in=ids)
+            .values_list('movimiento_revertido_id', flat=True)
+        )
+        if anulados:
+            raise ErrorReversion(f"Los movimientos {', '.join(map(str, sorted(anulados)))} ya fueron anulados.")
+
+        ids_articulos = {m.articulo_id for m in originales} | {
+            m.articulo_destino_id for m in originales if m.articulo_destino_id
+        }
+        articulos = Articulo.objects.select_for_update().order_by('id').in_bulk(ids_articulos)
+        estados_iniciales = {pk: articulo.estado_id for pk, articulo in articulos.items()}
+
+        # Préstamos afectados, indexados por id para que un mismo préstamo tocado por
+        # varios movimientos del lote se actualice sobre el mismo objeto.
+        prestamos = {}
+        asignaciones = {}
+        ids_devoluciones = [m.id for m in originales if m.tipo_movimiento == 'Regresado']
+        for asignacion in (
+            AsignacionDevolucion.objects.select_for_update().select_related('prestamo')
+            .filter(movimiento_devolucion_id__in=ids_devoluciones)
+        ):
+            prestamo = prestamos.setdefault(asignacion.prestamo_id, asignacion.prestamo)
+            asignaciones.setdefault(asignacion.movimiento_devolucion_id, []).append((prestamo, asignacion.cantidad))
+
+        prestamo_por_movimiento = {}
+        ids_prestamos = [m.id for m in originales if m.tipo_movimiento == 'Prestamo']
+        for prestamo in HistorialPrestamo.objects.select_for_update().filter(movimiento_prestamo_id__in=ids_prestamos):
+            prestamo = prestamos.setdefault(prestamo.id, prestamo)
+            prestamo_por_movimiento[prestamo.movimiento_prestamo_id] = prestamo
+
+        ahora = timezone.now()
+        anulaciones = []
+        historial = []
+        for original in originales:
+            cambios = _compensar(original, articulos, asignaciones, prestamo_por_movimiento, ahora)
+            anulaciones.append(Movimiento(
+                articulo_id=original.articulo_id,
+                tipo_movimiento='Anulacion',
+                cantidad=original.cantidad,
+                fecha=ahora,
+                usuario=usuario,
+                ubicacion_id=original.ubicacion_id,
+                comentario=comentario or f"Anulación del movimiento {original.id} ({original.tipo_movimiento}).",
+                motivo_id=original.motivo_id,
+                personal_id=original.personal_id,
+                estado_nuevo_id=original.estado_anterior_id if original.tipo_movimiento == 'Cambio de Estado' else None,
+                articulo_destino_id=original.articulo_destino_id,
+                movimiento_revertido=original,
+            ))
+            for articulo, stock_anterior in cambios:
+                historial.append(HistorialStock(
+                    articulo=articulo,
+                    tipo_movimiento='Anulacion',
+                    cantidad=original.cantidad,
+                    stock_anterior=stock_anterior,
+                    stock_actual=articulo.stock_actual,
+                    usuario=usuario,
+                    comentario=f"Anulación del movimiento {original.id} ({original.tipo_movimiento}).",
+                    motivo_id=original.motivo_id,
+                    ubicacion_id=original.ubicacion_id,
+                ))
+
+        _verificar_codigos_en_estado([
+            articulo for articulo in articulos.values() if articulo.estado_id != estados_iniciales[articulo.pk]
+        ])
+        Articulo.objects.bulk_update(
+            articulos.values(), ['stock_actual', 'stock_prestado', 'prestado', 'estado']
+        )
+        registrar_cambio_articulos()
+        if prestamos:
+            HistorialPrestamo.objects.bulk_update(prestamos.values(), ['cantidad_restante', 'fecha_devolucion'])
+        if ids_devoluciones:
+            AsignacionDevolucion.objects.filter(movimiento_devolucion_id__in=ids_devoluciones).delete()
+        anulaciones = Movimiento.objects.bulk_create(anulaciones)
+        HistorialStock.objects.bulk_create(historial)
+
+    logger.info(f"Movimientos anulados por {usuario}: {', '.join(str(m.id) for m in originales)}")
+    return anulaciones
+
+
+def _compensar(original, articulos, asignaciones, prestamo_por_movimiento, ahora):
+    """
+    Aplica en memoria el efecto inverso de `original`. Devuelve [(articulo, stock_anterior)]
+    por cada artículo afectado, para registrar el historial.
+    """
+    tipo = original.tipo_movimiento
+    cantidad = original.cantidad
+    articulo = articulos[original.articulo_id]
+    stock_anterior = articulo.stock_actual
+
+    if tipo == 'Anulacion':
+        raise ErrorReversion(f"El movimiento {original.id} es una anulación y no se puede revertir.")
+    if tipo == 'Saldo Inicial':
+        raise ErrorReversion(f"El movimiento {original.id} es un saldo inicial y no se puede revertir.")
+
+    if tipo in ('Entrada', 'Nuevo Articulo'):
+        if articulo.stock_actual < cantidad:
+            raise ErrorReversion(
+                f"No hay stock suficiente en '{articulo.nombre}' para anular el movimiento {original.id}."
+            )
+        articulo.stock_actual -= cantidad
+
+    elif tipo == 'Salida':
+        articulo.stock_actual += cantidad
+
+    elif tipo == 'Prestamo':
+        prestamo = prestamo_por_movimiento.get(original.id)
+        if prestamo is None:
+            raise ErrorReversion(f"El préstamo {original.id} no tiene historial de préstamo asociado.")
+        if prestamo.cantidad_restante != prestamo.cantidad:
+            raise ErrorReversion(
+                f"El préstamo {original.id} tiene devoluciones registradas; anúlalas primero."
+            )
+        prestamo.cantidad_restante = 0
+        prestamo.fecha_devolucion = ahora
+        articulo.stock_actual += cantidad
+        articulo.stock_prestado -= cantidad
+        articulo.prestado = articulo.stock_prestado > 0
+
+    elif tipo == 'Regresado':
+        if articulo.stock_actual < cantidad:
+            raise ErrorReversion(
+                f"No hay stock suficiente en '{articulo.nombre}' para anular la devolución {original.id}."
+            )
+        for prestamo, asignada in asignaciones.get(original.id, []):
+            prestamo.cantidad_restante += asignada
+            prestamo.fecha_devolucion = None
+        articulo.stock_actual -= cantidad
+        articulo.stock_prestado += cantidad
+        articulo.prestado = True
+
+    elif tipo == 'Cambio de Estado':
+        if original.estado_anterior_id is None:
+            raise ErrorReversion(f"El movimiento {original.id} no registró el estado anterior del artículo.")
+        if articulo.estado_id != original.estado_nuevo_id:
+            raise ErrorReversion(
+                f"'{articulo.nombre}' cambió de estado después del movimiento {original.id}; "
+                "anula primero los cambios de estado posteriores."
+            )
+        articulo.estado_id = original.estado_anterior_id
+
+    elif tipo == 'Cambio de Estado por Unidad':
+        destino = articulos.get(original.articulo_destino_id)
+        if destino is None:
+            raise ErrorReversion(f"El movimiento {original.id} no registró el artículo de destino.")
+        if destino.stock_actual < cantidad:
+            raise ErrorReversion(
+                f"No hay stock suficiente en '{destino.nombre}' para anular el movimiento {original.id}."
+            )
+        stock_destino = destino.stock_actual
+        destino.stock_actual -= cantidad
+        articulo.stock_actual += cantidad
+        return [(articulo, stock_anterior), (destino, stock_destino)]
+
+    return [(articulo, stock_anterior)]
+
+
+def _verificar_codigos_en_estado(articulos):
+    """
+    Los artículos que vuelven a su estado anterior no pueden repetir un código, número de
+    serie o MAC de otro artículo de ese estado (unique_together). Una sola consulta.
+    """
+    condicion = Q()
+    vistos = {}
+    for articulo in articulos:
+        if articulo.estado_id is None:
+            continue
+        for campo in CAMPOS_UNICOS_ESTADO:
+            valor = getattr(articulo, campo)
+            if not valor:
+                continue
+            otro = vistos.setdefault((articulo.estado_id, campo, valor), articulo)
+            if otro is not articulo:
+                raise ErrorReversion(
+                    f"'{articulo.nombre}' y '{otro.nombre}' quedarían en el mismo estado con el mismo {campo} ({valor})."
+                )
+            condicion |= Q(estado_id=articulo.estado_id, **{campo: valor})
+    if not condicion:
+        return
+    choque = (
+        Articulo.objects.filter(condicion).exclude(id__in=[articulo.pk for articulo in articulos])
+        .values_list('nombre', flat=True).first()
+    )
+    if choque is not None:
+        raise ErrorReversion(
+            f"No se puede devolver el artículo a su estado anterior: '{choque}' ya tiene en ese estado "
+            "el mismo código, número de serie o MAC."
+        )
@@ -1,5 +1,7 @@
 # gestion_bodega/serializers.py
 
+import logging
+
 from rest_framework import serializers
 from django.db import transaction
 from django.contrib.auth.models import User
@@ -18,8 +20,16 @@ from .models import (
     Movimiento,
     HistorialStock,
     Personal,
-    HistorialPrestamo
+    HistorialPrestamo,
+    CargaArchivo,
+    SesionConteo,
+    LineaConteo
 )
+from .prestamos import ErrorDevolucion, planificar_devolucion, aplicar_devolucion
+from .transferencias import ErrorTransferencia, transferir_estado
+from .totales_catalogos import TOTALES_VACIOS
+
+logger = logging.getLogger(__name__)
 
 # **Usuario**
 class UsuarioSerializer(serializers.ModelSerializer):
@@ -28,8 +38,37 @@ class UsuarioSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 
+# **Catálogos**
+class NombreCatalogoMixin:
+    """
+    Rechaza un nombre que ya existe en el catálogo con otras mayúsculas ("Bodega 1" /
+    "bodega 1"). La consulta usa el índice único LOWER(nombre) del modelo.
+    """
+    def validate_nombre(self, valor):
+        existentes = self.Meta.model.objects.por_nombre(valor)
+        if self.instance is not None:
+            existentes = existentes.exclude(pk=self.instance.pk)
+        existente = existentes.values_list('nombre', flat=True).first()
+        if existente is not None:
+            raise serializers.ValidationError(f"Ya existe '{existente}' (los nombres no distinguen mayúsculas).")
+        return valor
+
+
+class TotalesCatalogoMixin:
+    """
+    Con ?con_totales=1 la vista pasa en el contexto 'totales' ({id: totales}, ver
+    gestion/totales_catalogos.py) y cada registro incluye total_articulos y total_unidades.
+    """
+    def to_representation(self, instancia):
+        datos = super().to_representation(instancia)
+        totales = self.context.get('totales')
+        if totales is not None:
+            datos.update(totales.get(instancia.pk, TOTALES_VACIOS))
+        return datos
+
+
 # **Categoría**
-class CategoriaSerializer(serializers.ModelSerializer):
+class CategoriaSerializer(TotalesCatalogoMixin, NombreCatalogoMixin, serializers.ModelSerializer):
     class Meta:
         model = Categoria
         fields = [
@@ -44,35 +83,35 @@ class CategoriaSerializer(serializers.ModelSerializer):
 
 
 # **Marca**
-class MarcaSerializer(serializers.ModelSerializer):
+class MarcaSerializer(TotalesCatalogoMixin, NombreCatalogoMixin, serializers.ModelSerializer):
     class Meta:
         model = Marca
         fields = ['id', 'nombre', 'descripcion']
 
 
 # **Modelo**
-class ModeloSerializer(serializers.ModelSerializer):
+class ModeloSerializer(TotalesCatalogoMixin, NombreCatalogoMixin, serializers.ModelSerializer):
     class Meta:
         model = Modelo
         fields = ['id', 'nombre', 'descripcion', 'marca']
 
 
 # **Ubicación**
-class UbicacionSerializer(serializers.ModelSerializer):
+class UbicacionSerializer(TotalesCatalogoMixin, NombreCatalogoMixin, serializers.ModelSerializer):
     class Meta:
         model = Ubicacion
         fields = ['id', 'nombre', 'descripcion']
 
 
 # **Estado del Artículo**
-class EstadoArticuloSerializer(serializers.ModelSerializer):
+class EstadoArticuloSerializer(TotalesCatalogoMixin, NombreCatalogoMixin, serializers.ModelSerializer):
     class Meta:
         model = EstadoArticulo
         fields = ['id', 'nombre', 'descripcion', 'fecha_creacion']
 
 
 # **Motivo**
-class MotivoSerializer(serializers.ModelSerializer):
+class MotivoSerializer(NombreCatalogoMixin, serializers.ModelSerializer):
     class Meta:
         model = Motivo
         fields = ['id', 'nombre', 'descripcion']
@@ -105,8 +144,63 @@ class PersonalSimpleSerializer(serializers.ModelSerializer):
 # -------------------------------------------------------------------
 
 
+# -------------------------------------------------------------------
+# Campos dispersos: ?fields=id,nombre o ?vista=compact en las lecturas
+# -------------------------------------------------------------------
+def campos_solicitados(request, vistas):
+    """
+    Campos pedidos en la consulta de una lectura (GET), o None para la representación
+    completa. `vistas` asocia nombres de vista a listas de campos.
+    """
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    vista = request.query_params.get('vista')
+    if vista:
+        if vista not in vistas:
+            raise serializers.ValidationError({'vista': f"Vista desconocida: {vista}."})
+        return list(vistas[vista])
+    campos = request.query_params.get('fields')
+    if campos:
+        return [campo.strip() for campo in campos.split(',') if campo.strip()]
+    return None
+
+
+class CamposDispersosMixin:
+    """
+    Deja en el serializador solo los campos pedidos con ?fields= o ?vista= (ver VISTAS).
+    La vista debe acotar también la consulta (CamposDispersosViewMixin en views.py).
+    """
+    VISTAS = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = campos_solicitados(self.context.get('request'), self.VISTAS)
+        if campos is None:
+            return
+        legibles = {nombre for nombre, campo in self.fields.items() if not campo.write_only}
+        desconocidos = set(campos) - legibles
+        if desconocidos:
+            raise serializers.ValidationError({'fields': f"Campos desconocidos: {', '.join(sorted(desconocidos))}."})
+        for nombre in set(self.fields) - set(campos):
+            self.fields.pop(nombre)
+
+    @classmethod
+    def campos_modelo(cls, campos):
+        """Campos del modelo que hay que leer para serializar `campos` (para only())."""
+        declarados = cls().fields
+        return [
+            declarados[campo].source for campo in campos
+            if not declarados[campo].write_only and '.' not in declarados[campo].source
+        ]
+
+
 # **Artículo**
-class ArticuloSerializer(serializers.ModelSerializer):
+class ArticuloSerializer(CamposDispersosMixin, serializers.ModelSerializer):
+    # Representaciones reducidas con nombre (?vista=compact para selectores)
+    VISTAS = {
+        'compact': ['id', 'nombre', 'codigo_interno', 'stock_actual'],
+    }
+
     # Se hace un "write_only" de la cantidad para manejar movimientos de stock
     cantidad = serializers.IntegerField(write_only=True, required=True, min_value=0)
     stock_actual = serializers.IntegerField(read_only=True)
@@ -153,13 +247,12 @@ class ArticuloSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        # Ajustar stock y registrar movimiento si cantidad > 0
-        if cantidad > 0:
-            stock_anterior = instance.stock_actual
-            instance.stock_actual += cantidad
-            instance.save()
+        instance.save()
 
-            movimiento = Movimiento.objects.create(
+        # Registrar la entrada de stock si cantidad > 0; Movimiento.save ajusta el stock
+        # y escribe la fila de HistorialStock.
+        if cantidad > 0:
+            Movimiento.objects.create(
                 articulo=instance,
                 tipo_movimiento="Entrada",
                 cantidad=cantidad,
@@ -170,20 +263,6 @@ class ArticuloSerializer(serializers.ModelSerializer):
                 personal=None
             )
 
-            HistorialStock.objects.create(
-                articulo=instance,
-                tipo_movimiento=movimiento.tipo_movimiento,
-                cantidad=movimiento.cantidad,
-                stock_anterior=stock_anterior,
-                stock_actual=instance.stock_actual,
-                usuario=usuario,
-                comentario=movimiento.comentario,
-                ubicacion=movimiento.ubicacion,
-                motivo=movimiento.motivo
-            )
-        else:
-            instance.save()
-
         return instance
 
 
@@ -225,11 +304,16 @@ class MovimientoSerializer(serializers.ModelSerializer):
     )
     # Manejo de fecha_devolucion desde el frontend
     fecha_devolucion = serializers.CharField(write_only=True, required=False, allow_blank=True)
+    # Anotado por MovimientoViewSet; indica si el movimiento tiene una anulación
+    anulado = serializers.BooleanField(read_only=True, default=False)
 
     class Meta:
         model = Movimiento
         fields = '__all__'
-        read_only_fields = ['id', 'fecha',  'usuario', 'prestamo_relacionado']
+        read_only_fields = [
+            'id', 'fecha',  'usuario', 'prestamo_relacionado',
+            'estado_anterior', 'articulo_destino', 'movimiento_revertido'
+        ]
 
     def validate(self, data):
         tipo_movimiento = data.get('tipo_movimiento')
@@ -240,6 +324,14 @@ class MovimientoSerializer(serializers.ModelSerializer):
         # Eliminamos la obligación de 'motivo' en cualquier tipo de movimiento
         # Solo mantenemos la obligatoriedad de 'personal' para 'Prestamo' si es necesario
 
+        if tipo_movimiento == 'Anulacion':
+            raise serializers.ValidationError(
+                "Las anulaciones se registran con la acción de anular un movimiento."
+            )
+
+        if tipo_movimiento == 'Saldo Inicial':
+            raise serializers.ValidationError("El saldo inicial de un artículo no se registra como movimiento.")
+
         if tipo_movimiento == 'Prestamo' and not personal:
             raise serializers.ValidationError(
                 "El personal es obligatorio para movimientos de tipo Prestamo."
@@ -305,18 +397,25 @@ class MovimientoSerializer(serializers.ModelSerializer):
                 return movimiento_prestamo
 
         elif tipo_movimiento == 'Regresado':
-            with transaction.atomic():
-                # Buscar HistorialPrestamo correspondiente
-                historial_prestamo = HistorialPrestamo.objects.filter(
-                    articulo=articulo,
-                    personal=personal,
-                    cantidad_restante__gte=cantidad
-                ).order_by('fecha_prestamo').first()
-
-                if not historial_prestamo:
+            # Parseamos la fecha_devolucion para no perder ese dato,
+            # pero NO actualizamos stock aquí para evitar la duplicación.
+            fecha_dev_dt = None
+            if fecha_devolucion_str:
+                try:
+                    fecha_dev_dt = datetime.fromisoformat(fecha_devolucion_str)
+                except ValueError:
                     raise serializers.ValidationError(
-                        "No se encontró un historial de préstamo correspondiente para esta devolución."
+                        "El formato de 'fecha_devolucion' no es válido. Usa 'YYYY-MM-DD HH:mm:ss' o ISO 8601."
                     )
+            else:
+                fecha_dev_dt = timezone.now()
+
+            with transaction.atomic():
+                # Repartir la devolución entre los préstamos abiertos (FIFO), bloqueándolos
+                try:
+                    plan = planificar_devolucion(articulo, personal, cantidad)
+                except ErrorDevolucion as e:
+                    raise serializers.ValidationError(str(e))
 
                 movimiento_regresado = Movimiento.objects.create(
                     usuario=user,
@@ -325,50 +424,31 @@ class MovimientoSerializer(serializers.ModelSerializer):
                     cantidad=cantidad,
                     personal=personal,
                     motivo=motivo,
-                    prestamo_relacionado=historial_prestamo.movimiento_prestamo,
+                    # Se mantiene el vínculo con el préstamo más antiguo cubierto
+                    prestamo_relacionado_id=plan[0][0].movimiento_prestamo_id,
                     ubicacion=articulo.ubicacion
                 )
 
-                # Parseamos la fecha_devolucion para no perder ese dato,
-                # pero NO actualizamos stock aquí para evitar la duplicación.
-                fecha_dev_dt = None
-                if fecha_devolucion_str:
-                    try:
-                        fecha_dev_dt = datetime.fromisoformat(fecha_devolucion_str)
-                    except ValueError:
-                        raise serializers.ValidationError(
-                            "El formato de 'fecha_devolucion' no es válido. Usa 'YYYY-MM-DD HH:mm:ss' o ISO 8601."
-                        )
-                else:
-                    fecha_dev_dt = timezone.now()
-
-                # Actualizar HistorialPrestamo
-                historial_prestamo.cantidad_restante -= cantidad
-                if historial_prestamo.cantidad_restante == 0:
-                    historial_prestamo.fecha_devolucion = fecha_dev_dt
-                historial_prestamo.save()
+                aplicar_devolucion(plan, movimiento_regresado, fecha_dev_dt)
 
                 return movimiento_regresado
 
         elif tipo_movimiento == 'Cambio de Estado por Unidad':
-            with transaction.atomic():
-                # Enviar notificación antes de realizar la modificación
-                print(f"Notificación: Se realizará un cambio de estado por unidad para el artículo '{articulo.nombre}'.")
-
-                # Crear el movimiento
-                movimiento_cambio_estado = Movimiento.objects.create(
-                    usuario=user,
-                    articulo=articulo,
-                    tipo_movimiento='Cambio de Estado por Unidad',
-                    cantidad=cantidad,
-                    estado_nuevo=estado_nuevo,
-                    comentario=validated_data.get('comentario', ''),
-                    ubicacion=articulo.ubicacion,
+            # Enviar notificación antes de realizar la modificación
+            logger.info(f"Notificación: Se realizará un cambio de estado por unidad para el artículo '{articulo.nombre}'.")
+
+            try:
+                movimiento_cambio_estado, = transferir_estado(
+                    [(articulo.id, cantidad)],
+                    estado_nuevo,
+                    user,
+                    comentario=validated_data.get('comentario') or None,
                     motivo=motivo,
-                    personal=None  # Asumiendo que no es necesario en este tipo de movimiento
                 )
+            except ErrorTransferencia as e:
+                raise serializers.ValidationError(str(e))
 
-                return movimiento_cambio_estado
+            return movimiento_cambio_estado
 
         else:
             # Manejar otros tipos de movimientos (Entrada, Salida, Cambio de Estado, etc.)
@@ -379,6 +459,41 @@ class MovimientoSerializer(serializers.ModelSerializer):
             return movimiento
 
 
+# **CargaArchivo**
+class CargaArchivoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CargaArchivo
+        fields = [
+            'id', 'nombre_archivo', 'tamano_total', 'bytes_recibidos', 'estado',
+            'resultado', 'fecha_creacion', 'fecha_actualizacion'
+        ]
+        read_only_fields = fields
+
+
+# **SesionConteo**
+class SesionConteoSerializer(serializers.ModelSerializer):
+    total_lineas = serializers.IntegerField(read_only=True, default=None)
+    lineas_contadas = serializers.IntegerField(read_only=True, default=None)
+
+    class Meta:
+        model = SesionConteo
+        fields = [
+            'id', 'nombre', 'estado', 'ubicacion', 'categoria', 'usuario', 'fecha_inicio',
+            'fecha_cierre', 'resultado', 'total_lineas', 'lineas_contadas'
+        ]
+        read_only_fields = ['estado', 'usuario', 'fecha_inicio', 'fecha_cierre', 'resultado']
+
+
+class LineaConteoSerializer(serializers.ModelSerializer):
+    nombre = serializers.CharField(source='articulo.nombre', read_only=True)
+    diferencia = serializers.IntegerField(read_only=True, default=None)
+
+    class Meta:
+        model = LineaConteo
+        fields = ['articulo', 'nombre', 'stock_inicial', 'cantidad_contada', 'diferencia', 'fecha_conteo']
+        read_only_fields = fields
+
+
 # **UserSerializer** (para registrar usuarios vía API)
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
@@ -0,0 +1,40 @@
+# gestion/signals.py
+
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .autenticacion import cache_usuarios
+from .models import Articulo
+from .totales_catalogos import registrar_cambio_articulos
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_usuario_cacheado(sender, instance, **kwargs):
+    """Un usuario modificado, desactivado o eliminado se vuelve a leer en su próxima petición."""
+    cache_usuarios.invalidar(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidar_permisos_cacheados(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        cache_usuarios.invalidar(instance.pk)
+    elif pk_set is None:
+        # post_clear desde un grupo o permiso: no se sabe a qué usuarios afectó
+        cache_usuarios.limpiar()
+    else:
+        # Cambios desde un grupo o permiso: pk_set son usuarios
+        for pk in pk_set:
+            cache_usuarios.invalidar(pk)
+
+
+@receiver(post_save, sender=Articulo)
+@receiver(post_delete, sender=Articulo)
+def invalidar_totales_catalogos(sender, instance, **kwargs):
+    # Las escrituras masivas (bulk_*, update) no emiten señales: llaman a
+    # registrar_cambio_articulos() directamente
+    registrar_cambio_articulos()
@@ -0,0 +1,168 @@
+# gestion/sincronizacion_personal.py
+
+import logging
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .importacion import ErrorImportacion, filas_desde_archivo
+from .models import HistorialPrestamo, Movimiento, Personal
+
+logger = logging.getLogger(__name__)
+
+# Encabezados aceptados (sin distinguir mayúsculas) -> campo de Personal
+MAPEO_COLUMNAS_PERSONAL = {
+    'nombre': 'nombre',
+    'nombre completo': 'nombre',
+    'seccion': 'seccion',
+    'sección': 'seccion',
+    'correo': 'correo_institucional',
+    'correo institucional': 'correo_institucional',
+    'correo_institucional': 'correo_institucional',
+    'email': 'correo_institucional',
+}
+CAMPOS_REQUERIDOS_PERSONAL = ['nombre', 'correo_institucional']
+CAMPOS_ACTUALIZABLES = ['nombre', 'seccion']
+
+LARGO_NOMBRE = Personal._meta.get_field('nombre').max_length
+LARGO_SECCION = Personal._meta.get_field('seccion').max_length
+
+TAMANO_LOTE_PERSONAL = 1000
+
+
+def mapear_encabezados_personal(encabezados):
+    columnas = [str(c).strip() if c is not None else '' for c in encabezados]
+    columnas = [MAPEO_COLUMNAS_PERSONAL.get(c.lower(), c) for c in columnas]
+    faltantes = [col for col in CAMPOS_REQUERIDOS_PERSONAL if col not in columnas]
+    if faltantes:
+        raise ErrorImportacion(
+            f"Faltan columnas obligatorias: {', '.join(faltantes)}.",
+            {"ejemplo_formato": {"nombre": "Ana Pérez", "seccion": "Informática", "correo_institucional": "ana.perez@ejemplo.cl"}}
+        )
+    return columnas
+
+
+def _texto(valor):
+    # `valor != valor` descarta NaN de Parquet/pandas
+    if valor is None or valor != valor:
+        return ''
+    return str(valor).strip()
+
+
+def leer_personal(filas):
+    """
+    Valida las filas del archivo y devuelve ({correo_normalizado: datos}, errores, vistos).
+    `vistos` incluye los correos de filas con error, para no darlos por ausentes.
+    """
+    personas, errores, vistos = {}, [], set()
+    for fila_num, fila in filas:
+        correo = _texto(fila.get('correo_institucional')).lower()
+        nombre = _texto(fila.get('nombre'))
+        seccion = _texto(fila.get('seccion')) or None
+        try:
+            validate_email(correo)
+        except ValidationError:
+            errores.append(f"Fila {fila_num}: correo_institucional '{correo}' no es válido.")
+            continue
+        vistos.add(correo)
+        if correo in personas:
+            errores.append(f"Fila {fila_num}: el correo {correo} está repetido en el archivo (fila {personas[correo]['fila']}).")
+        elif not nombre:
+            errores.append(f"Fila {fila_num}: el nombre es obligatorio.")
+        elif len(nombre) > LARGO_NOMBRE or (seccion and len(seccion) > LARGO_SECCION):
+            errores.append(f"Fila {fila_num}: el nombre o la sección superan el largo permitido.")
+        else:
+            personas[correo] = {'fila': fila_num, 'nombre': nombre, 'seccion': seccion}
+    return personas, errores, vistos
+
+
+def _existentes():
+    """{correo en minúsculas: (id, correo guardado, nombre, seccion)} en una sola consulta."""
+    existentes = {}
+    filas = Personal.objects.order_by('id').values_list('id', 'correo_institucional', 'nombre', 'seccion')
+    for fila in filas.iterator(chunk_size=5000):
+        existentes.setdefault(fila[1].lower(), fila)
+    return existentes
+
+
+def sincronizar_personal(origen, nombre_archivo, dry_run=False, continue_on_errors=True, eliminar_ausentes=False):
+    """
+    Sincroniza el directorio de personal con un CSV/XLSX completo. Las personas se
+    identifican por correo_institucional sin distinguir mayúsculas: las nuevas se crean,
+    las que cambiaron de nombre o sección se actualizan (un solo bulk_create con
+    update_conflicts por lote) y las que no están en el archivo se informan.
+    Con eliminar_ausentes se borran solo las ausentes sin préstamos ni movimientos: borrar
+    una con registros eliminaría en cascada su historial.
+    """
+    personas, errores, vistos = leer_personal(
+        filas_desde_archivo(origen, nombre_archivo, mapear=mapear_encabezados_personal)
+    )
+    existentes = _existentes()
+
+    nuevos, cambios, filas_escritura = [], [], []
+    for correo, datos in personas.items():
+        actual = existentes.get(correo)
+        if actual is None:
+            nuevos.append(correo)
+        else:
+            diferencias = {
+                campo: [anterior, datos[campo]]
+                for campo, anterior in zip(CAMPOS_ACTUALIZABLES, actual[2:])
+                if anterior != datos[campo]
+            }
+            if not diferencias:
+                continue
+            cambios.append({'correo_institucional': actual[1], 'cambios': diferencias})
+            # El correo guardado (con sus mayúsculas) es el que choca con la restricción única
+            correo = actual[1]
+        filas_escritura.append(Personal(correo_institucional=correo, nombre=datos['nombre'], seccion=datos['seccion']))
+
+    # Una sola consulta para todo el personal: una lista de ids ausentes podría superar el
+    # límite de parámetros de SQLite
+    con_registros = set(
+        Personal.objects.filter(
+            Exists(HistorialPrestamo.objects.filter(personal=OuterRef('pk')))
+            | Exists(Movimiento.objects.filter(personal=OuterRef('pk')))
+        ).values_list('id', flat=True)
+    ) if len(existentes) > len(vistos & existentes.keys()) else set()
+    ausentes = [
+        {'id': fila[0], 'correo_institucional': fila[1], 'nombre': fila[2], 'con_registros': fila[0] in con_registros}
+        for correo, fila in existentes.items() if correo not in vistos
+    ]
+
+    resultado = {
+        'creados': len(nuevos),
+        'actualizados': len(cambios),
+        'sin_cambios': len(personas) - len(nuevos) - len(cambios),
+        'ausentes': len(ausentes),
+        'eliminados': 0,
+        'omitidos': len(errores),
+        'dry_run': dry_run,
+        'detalle': {'creados': nuevos, 'actualizados': cambios, 'ausentes': ausentes},
+        'errores': errores,
+    }
+    if dry_run or (errores and not continue_on_errors):
+        return resultado
+
+    with transaction.atomic():
+        for inicio in range(0, len(filas_escritura), TAMANO_LOTE_PERSONAL):
+            Personal.objects.bulk_create(
+                filas_escritura[inicio:inicio + TAMANO_LOTE_PERSONAL],
+                update_conflicts=True,
+                unique_fields=['correo_institucional'],
+                update_fields=CAMPOS_ACTUALIZABLES,
+            )
+        if eliminar_ausentes:
+            eliminables = [a['id'] for a in ausentes if not a['con_registros']]
+            for inicio in range(0, len(eliminables), TAMANO_LOTE_PERSONAL):
+                resultado['eliminados'] += Personal.objects.filter(
+                    id__in=eliminables[inicio:inicio + TAMANO_LOTE_PERSONAL]
+                ).delete()[0]
+
+    logger.info(
+        f"Sincronización de personal: {resultado['creados']} creados, {resultado['actualizados']} actualizados, "
+        f"{resultado['ausentes']} ausentes, {resultado['eliminados']} eliminados, {resultado['omitidos']} omitidos."
+    )
+    return resultado
@@ -0,0 +1,64 @@
+# gestion/telemetria.py
+
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Totales por endpoint en la memoria del proceso: registrar una respuesta no consulta la
+# caché. Cada worker lleva los suyos; las respuestas sobre el presupuesto quedan en el log.
+_metricas = {}
+_candado = threading.Lock()
+
+
+def presupuesto_respuesta():
+    return getattr(settings, 'PRESUPUESTO_RESPUESTA_API', 1024 * 1024)
+
+
+def registrar_respuesta(endpoint, tamano, tamano_enviado, codificacion):
+    """
+    Acumula por endpoint cuántas respuestas hubo, los bytes antes y después de comprimir y
+    la mayor respuesta. Las que superan PRESUPUESTO_RESPUESTA_API quedan en el log.
+    """
+    presupuesto = presupuesto_respuesta()
+    if tamano > presupuesto:
+        logger.warning(
+            f"Respuesta sobre el presupuesto en {endpoint}: {tamano} bytes "
+            f"({tamano_enviado} enviados, {codificacion or 'sin comprimir'}; presupuesto {presupuesto})."
+        )
+
+    with _candado:
+        metricas = _metricas.get(endpoint)
+        if metricas is None:
+            metricas = _metricas[endpoint] = {
+                'respuestas': 0, 'bytes': 0, 'bytes_enviados': 0, 'maximo': 0, 'sobre_presupuesto': 0,
+            }
+        metricas['respuestas'] += 1
+        metricas['bytes'] += tamano
+        metricas['bytes_enviados'] += tamano_enviado
+        metricas['maximo'] = max(metricas['maximo'], tamano)
+        metricas['sobre_presupuesto'] += tamano > presupuesto
+
+
+def resumen_respuestas():
+    """Métricas por endpoint de este proceso, de la respuesta promedio más grande a la más chica."""
+    with _candado:
+        copia = {endpoint: dict(metricas) for endpoint, metricas in _metricas.items()}
+    resumen = []
+    for endpoint, metricas in copia.items():
+        resumen.append({
+            'endpoint': endpoint,
+            **metricas,
+            'promedio': metricas['bytes'] // metricas['respuestas'],
+            'compresion': round(metricas['bytes_enviados'] / metricas['bytes'], 3) if metricas['bytes'] else None,
+        })
+    resumen.sort(key=lambda m: m['promedio'], reverse=True)
+    return {'presupuesto': presupuesto_respuesta(), 'proceso': os.getpid(), 'endpoints': resumen}
+
+
+def reiniciar_telemetria():
+    with _candado:
+        _metricas.clear()
@@ -0,0 +1,1053 @@
+# gestion/tests.py
+
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models.signals import pre_save
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from . import historial, json_rapido, replicas
+from .cargas import ErrorCarga, crear_carga, purgar_cargas_abandonadas, recibir_fragmento, ruta_carga
+from .conciliacion import conciliar
+from .conteos import ErrorConteo, abrir_sesion, cancelar_sesion, confirmar_sesion, registrar_conteos
+from .linea_tiempo import linea_tiempo
+from .idempotencia import idempotente
+from .json_rapido import codificar, filas_valores, plan_valores, transmitir_arreglo
+from .limites import AlmacenCache, AlmacenLocal, _almacen_local
+from .models import (
+    Articulo, AsignacionDevolucion, CargaArchivo, Categoria, ClaveIdempotencia, EstadoArticulo, HistorialPrestamo,
+    HistorialStock, Motivo, Movimiento, Personal, Ubicacion, VersionDatos,
+)
+from .reversiones import ErrorReversion, revertir_movimientos
+from .serializers import ArticuloSerializer, HistorialStockSerializer
+from .telemetria import registrar_respuesta, reiniciar_telemetria, resumen_respuestas
+from .totales_catalogos import totales_por_catalogo
+from .views import MovimientoViewSet
+
+particionar = import_module('gestion.migrations.0013_historialstock_particionado').particionar
+registrar_devoluciones_existentes = import_module('gestion.migrations.0010_asignaciondevolucion').registrar_devoluciones_existentes
+registrar_saldos_iniciales = import_module('gestion.migrations.0022_movimiento_saldo_inicial').registrar_saldos_iniciales
+
+
+class ConciliacionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+
+    def test_articulo_sin_movimientos_no_se_repara(self):
+        # Stock cargado fuera del registro (importación antigua): sin saldo inicial no hay con qué compararlo
+        articulo = Articulo.objects.create(nombre='Monitor', stock_actual=40)
+
+        resumen = conciliar(ids=[articulo.id], reparar=True, usuario=self.usuario)
+
+        self.assertEqual(resumen['no_reparables'], 1)
+        self.assertEqual(resumen['corregidos'], 0)
+        articulo.refresh_from_db()
+        self.assertEqual(articulo.stock_actual, 40)
+
+    def test_saldo_inicial_conserva_el_stock_sin_movimientos(self):
+        articulo = Articulo.objects.create(nombre='Teclado', stock_actual=40, stock_prestado=3, prestado=True)
+        # Un movimiento anterior que no coincide con el stock: el saldo inicial lo reemplaza
+        Movimiento.objects.bulk_create([Movimiento(articulo=articulo, tipo_movimiento='Entrada', cantidad=100, usuario=self.usuario)])
+
+        registrar_saldos_iniciales(apps, None)
+        resumen = conciliar(ids=[articulo.id], reparar=True, usuario=self.usuario)
+
+        self.assertEqual(resumen['total_discrepancias'], 0)
+        articulo.refresh_from_db()
+        self.assertEqual((articulo.stock_actual, articulo.stock_prestado), (40, 3))
+
+    def test_repara_desde_el_saldo_inicial_y_los_movimientos_posteriores(self):
+        articulo = Articulo.objects.create(nombre='Mouse', stock_actual=40)
+        registrar_saldos_iniciales(apps, None)
+        Movimiento.objects.create(articulo=articulo, tipo_movimiento='Salida', cantidad=5, usuario=self.usuario)
+        Articulo.objects.filter(pk=articulo.pk).update(stock_actual=0)
+
+        resumen = conciliar(ids=[articulo.id], reparar=True, usuario=self.usuario)
+
+        self.assertEqual(resumen['corregidos'], 1)
+        articulo.refresh_from_db()
+        self.assertEqual(articulo.stock_actual, 35)
+
+    def test_repara_articulo_con_registro_completo(self):
+        articulo = Articulo.objects.create(nombre='Cable', stock_actual=0)
+        Movimiento.objects.create(articulo=articulo, tipo_movimiento='Entrada', cantidad=10, usuario=self.usuario)
+        Articulo.objects.filter(pk=articulo.pk).update(stock_actual=25)
+
+        resumen = conciliar(ids=[articulo.id], reparar=True, usuario=self.usuario)
+
+        self.assertEqual(resumen['corregidos'], 1)
+        articulo.refresh_from_db()
+        self.assertEqual(articulo.stock_actual, 10)
+
+
+class ReversionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cls.bueno = EstadoArticulo.objects.create(nombre='Bueno')
+        cls.malo = EstadoArticulo.objects.create(nombre='Malo')
+        cls.baja = EstadoArticulo.objects.create(nombre='Baja')
+
+    def cambiar_estado(self, articulo, estado):
+        return Movimiento.objects.create(
+            articulo=articulo, tipo_movimiento='Cambio de Estado', cantidad=0, usuario=self.usuario,
+            comentario='Revisión', estado_nuevo=estado,
+        )
+
+    def test_eliminar_articulo_y_usuario_con_movimientos_anulados(self):
+        cliente = APIClient(SERVER_NAME='localhost')
+        cliente.force_authenticate(self.usuario)
+        otro = User.objects.create_user('bodeguero', 'bodeguero@ejemplo.cl', 'clave')
+        articulo = Articulo.objects.create(nombre='Silla', stock_actual=0)
+        entrada = Movimiento.objects.create(articulo=articulo, tipo_movimiento='Entrada', cantidad=3, usuario=otro)
+        revertir_movimientos([entrada.id], self.usuario)
+
+        otro.delete()
+        self.assertFalse(Movimiento.objects.filter(articulo=articulo).exists())
+
+        Movimiento.objects.create(articulo=articulo, tipo_movimiento='Entrada', cantidad=3, usuario=self.usuario)
+        revertir_movimientos([articulo.movimientos.get().id], self.usuario)
+        respuesta = cliente.delete(f'/api/articulos/{articulo.id}/')
+        self.assertEqual(respuesta.status_code, 204)
+
+    def test_cambio_de_estado_con_cambios_posteriores_no_se_revierte(self):
+        articulo = Articulo.objects.create(nombre='Notebook', estado=self.bueno)
+        primero = self.cambiar_estado(articulo, self.malo)
+        self.cambiar_estado(articulo, self.baja)
+
+        with self.assertRaises(ErrorReversion):
+            revertir_movimientos([primero.id], self.usuario)
+        articulo.refresh_from_db()
+        self.assertEqual(articulo.estado, self.baja)
+
+    def test_cambio_de_estado_que_repetiria_un_codigo_no_se_revierte(self):
+        articulo = Articulo.objects.create(nombre='Notebook', estado=self.bueno, numero_serie='SN-1')
+        cambio = self.cambiar_estado(articulo, self.malo)
+        Articulo.objects.create(nombre='Notebook', estado=self.bueno, numero_serie='SN-1')
+
+        cliente = APIClient(SERVER_NAME='localhost')
+        cliente.force_authenticate(self.usuario)
+        respuesta = cliente.post(f'/api/movimientos/{cambio.id}/anular/', {}, format='json')
+
+        self.assertEqual(respuesta.status_code, 400)
+        articulo.refresh_from_db()
+        self.assertEqual(articulo.estado, self.malo)
+
+    def test_revierte_un_cambio_hecho_desde_cambiar_estado_articulo(self):
+        articulo = Articulo.objects.create(nombre='Notebook', estado=self.bueno)
+        cliente = APIClient(SERVER_NAME='localhost')
+        cliente.force_authenticate(self.usuario)
+
+        respuesta = cliente.put(f'/api/cambiar-estado-articulo/{articulo.id}/', {'estado_nuevo': self.malo.id}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        cambio = Movimiento.objects.get(articulo=articulo, tipo_movimiento='Cambio de Estado')
+        self.assertEqual((cambio.estado_anterior, cambio.estado_nuevo), (self.bueno, self.malo))
+        articulo.refresh_from_db()
+        self.assertEqual(articulo.estado, self.malo)
+
+        revertir_movimientos([cambio.id], self.usuario)
+
+        articulo.refresh_from_db()
+        self.assertEqual(articulo.estado, self.bueno)
+
+    def test_cambio_de_estado_por_unidad_se_notifica_en_el_log(self):
+        articulo = Articulo.objects.create(nombre='Notebook', estado=self.bueno)
+        movimiento = Movimiento(articulo=articulo, tipo_movimiento='Cambio de Estado por Unidad', usuario=self.usuario)
+
+        with self.assertLogs('gestion.models', 'INFO') as registro:
+            pre_save.send(sender=Movimiento, instance=movimiento)
+        self.assertIn("'Notebook'", registro.output[0])
+
+    def test_revierte_el_ultimo_cambio_de_estado(self):
+        articulo = Articulo.objects.create(nombre='Notebook', estado=self.bueno, numero_serie='SN-2')
+        cambio = self.cambiar_estado(articulo, self.malo)
+
+        revertir_movimientos([cambio.id], self.usuario)
+
+        articulo.refresh_from_db()
+        self.assertEqual(articulo.estado, self.bueno)
+
+
+# La réplica de las pruebas es el mismo 'default': lo que se verifica es si la consulta
+# corre dentro de leyendo_de_replica()
+@mock.patch.object(replicas, 'ALIAS_REPLICA', 'default')
+class LecturaReplicaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        Articulo.objects.bulk_create([Articulo(nombre=f'Artículo {i}', stock_actual=i) for i in range(3)])
+
+    def setUp(self):
+        self.cliente = APIClient(SERVER_NAME='localhost')
+        self.cliente.force_authenticate(self.usuario)
+        self.addCleanup(setattr, replicas, '_replica_caida_hasta', 0.0)
+
+    def consultas_de_articulos(self, fallar_en_replica=False):
+        """Registra, por cada consulta a la tabla de artículos, si se hizo leyendo de la réplica."""
+        registro = []
+
+        def interceptar(ejecutar, sql, params, many, context):
+            if 'FROM "articulo"' in sql:
+                en_replica = replicas.leyendo_de_replica_activo()
+                registro.append(en_replica)
+                if fallar_en_replica and en_replica:
+                    raise OperationalError('réplica caída')
+            return ejecutar(sql, params, many, context)
+        return registro, connection.execute_wrapper(interceptar)
+
+    def test_listado_transmitido_lee_de_la_replica(self):
+        registro, interceptor = self.consultas_de_articulos()
+        with interceptor:
+            respuesta = self.cliente.get('/api/articulos/?stream=1')
+            cuerpo = b''.join(respuesta.streaming_content)
+
+        self.assertEqual(registro, [True])
+        self.assertEqual(cuerpo, self.cliente.get('/api/articulos/').content)
+
+    def test_listado_transmitido_repite_en_el_primario_si_la_replica_falla(self):
+        registro, interceptor = self.consultas_de_articulos(fallar_en_replica=True)
+        with interceptor:
+            respuesta = self.cliente.get('/api/articulos/?stream=1')
+            cuerpo = b''.join(respuesta.streaming_content)
+
+        self.assertEqual(registro, [True, False])
+        self.assertEqual(len(json.loads(cuerpo)), 3)
+
+    @override_settings(DATABASE_REPLICA_URL='postgres://replica/bodega')
+    def test_replica_requiere_cache_compartida(self):
+        errores = [error.id for error in run_checks()]
+        self.assertIn('gestion.E001', errores)
+
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}):
+            self.assertNotIn('gestion.E001', [error.id for error in run_checks()])
+
+
+class LimitesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cls.otro = User.objects.create_superuser('bodeguero', 'bodeguero@ejemplo.cl', 'clave')
+
+    def setUp(self):
+        cache.clear()
+        _almacen_local.limpiar()
+
+    def cargar(self, almacen, capacidad, por_segundo, hilos=8, duracion=0.5):
+        """Varios hilos consumen de la misma cubeta durante `duracion` segundos; devuelve (admitidas, segundos)."""
+        admitidas = [0] * hilos
+        inicio = time.monotonic()
+        fin = inicio + duracion
+
+        def cliente(indice):
+            while time.monotonic() < fin:
+                if almacen.consumir('carga', capacidad, por_segundo) == 0:
+                    admitidas[indice] += 1
+
+        trabajadores = [threading.Thread(target=cliente, args=(i,)) for i in range(hilos)]
+        for trabajador in trabajadores:
+            trabajador.start()
+        for trabajador in trabajadores:
+            trabajador.join()
+        return sum(admitidas), time.monotonic() - inicio
+
+    def test_cubeta_local_no_admite_de_mas_con_hilos_concurrentes(self):
+        admitidas, segundos = self.cargar(AlmacenLocal(), 50, 100.0)
+
+        self.assertGreaterEqual(admitidas, 50)
+        self.assertLessEqual(admitidas, 50 + 100 * segundos + 1)
+
+    def test_cubeta_en_cache_no_admite_de_mas_con_hilos_concurrentes(self):
+        admitidas, segundos = self.cargar(AlmacenCache(), 50, 100.0)
+
+        # Ventana fija: en el borde entre dos ventanas pasan dos ráfagas completas
+        self.assertGreaterEqual(admitidas, 50)
+        self.assertLessEqual(admitidas, 2 * 50 + 100 * segundos)
+
+    def test_cubetas_de_claves_distintas_son_independientes(self):
+        for almacen in (AlmacenLocal(), AlmacenCache()):
+            with self.subTest(almacen=type(almacen).__name__):
+                for _ in range(5):
+                    almacen.consumir('llena', 5, 0.1)
+                self.assertGreater(almacen.consumir('llena', 5, 0.1), 0)
+                self.assertEqual(almacen.consumir('vacia', 5, 0.1), 0)
+
+    def test_cubeta_en_cache_admite_si_la_cache_falla(self):
+        with mock.patch.object(cache, 'incr', side_effect=ConnectionError('caché caída')):
+            self.assertEqual(AlmacenCache().consumir('sin-cache', 1, 1.0), 0)
+
+    def test_api_responde_429_con_retry_after_por_usuario_y_clase(self):
+        tasas = dict(api_settings.DEFAULT_THROTTLE_RATES, lectura='3/min')
+        configuracion = dict(api_settings.user_settings, DEFAULT_THROTTLE_RATES=tasas)
+        for almacen in ('local', 'cache'):
+            with self.subTest(almacen=almacen), override_settings(REST_FRAMEWORK=configuracion, LIMITES_ALMACEN=almacen):
+                cache.clear()
+                _almacen_local.limpiar()
+                cliente = APIClient(SERVER_NAME='localhost')
+                cliente.force_authenticate(self.usuario)
+
+                codigos = [cliente.get('/api/categorias/').status_code for _ in range(3)]
+                limitada = cliente.get('/api/categorias/')
+                self.assertEqual(codigos, [200, 200, 200])
+                self.assertEqual(limitada.status_code, 429)
+                self.assertTrue(0 < int(limitada.headers['Retry-After']) <= 60)
+
+                # Las escrituras y los demás usuarios tienen sus propias cubetas
+                self.assertEqual(cliente.patch('/api/categorias/0/', {}, format='json').status_code, 404)
+                otro = APIClient(SERVER_NAME='localhost')
+                otro.force_authenticate(self.otro)
+                self.assertEqual(otro.get('/api/categorias/').status_code, 200)
+
+
+class JSONRapidoTests(TestCase):
+    # Textos que ejercitan el escape de JSON: comillas, controles, no ASCII y U+2028/U+2029
+    # (sin NUL, que PostgreSQL no admite en columnas de texto)
+    TEXTOS_BORDE = [
+        'comillas "dobles" y \\ barra', 'tab\tsalto\nretorno\r', 'control \x01\x1f\x7f',
+        'ñandú — “tipográficas” 😀', 'separadores \u2028 y \u2029', '',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        articulos = Articulo.objects.bulk_create([
+            Articulo(nombre=texto or 'vacío', descripcion=texto, stock_actual=i)
+            for i, texto in enumerate(cls.TEXTOS_BORDE)
+        ])
+        HistorialStock.objects.bulk_create([
+            HistorialStock(
+                articulo=articulo, tipo_movimiento='Entrada', cantidad=1, stock_anterior=0,
+                stock_actual=1, usuario=usuario, comentario=articulo.descripcion,
+            )
+            for articulo in articulos
+        ])
+
+    def assertSalidaIdentica(self, queryset, serializer_class):
+        request = Request(APIRequestFactory().get('/'))
+        esperado = JSONRenderer().render(serializer_class(queryset, many=True, context={'request': request}).data)
+        plan = plan_valores(serializer_class(context={'request': request}), queryset.model)
+        self.assertIsNotNone(plan)
+
+        for biblioteca in ('orjson', 'stdlib'):
+            with self.subTest(biblioteca=biblioteca), mock.patch.object(
+                json_rapido, 'orjson', None if biblioteca == 'stdlib' else json_rapido.orjson
+            ):
+                self.assertEqual(codificar(list(filas_valores(queryset, plan))), esperado)
+                transmitido = transmitir_arreglo(filas_valores(queryset, plan, iterar=True), tamano_lote=4)
+                self.assertEqual(b''.join(transmitido), esperado)
+
+    def test_listado_de_articulos_igual_al_serializador(self):
+        self.assertSalidaIdentica(Articulo.objects.order_by('-id'), ArticuloSerializer)
+
+    def test_listado_de_historial_igual_al_serializador(self):
+        self.assertSalidaIdentica(HistorialStock.objects.order_by('-id'), HistorialStockSerializer)
+
+    def test_listado_vacio_transmitido(self):
+        self.assertEqual(b''.join(transmitir_arreglo(iter(()))), b'[]')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Las particiones solo existen en PostgreSQL')
+class ParticionHistorialTests(TestCase):
+    def consultar(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def test_historial_queda_particionado_por_mes(self):
+        self.assertEqual(self.consultar("SELECT relkind FROM pg_class WHERE relname = 'historial_stock'"), [('p',)])
+        self.assertTrue(self.consultar("SELECT 1 FROM pg_class WHERE relname = 'historial_stock_default'"))
+
+    def test_particionar_conserva_filas_indices_y_foraneas(self):
+        # Tabla de prueba con la forma de historial_stock antes de 0013; se descarta al revertir la prueba
+        articulo = Articulo.objects.create(nombre='Monitor')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE historial_prueba ("
+                "  id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,"
+                "  articulo_id bigint NOT NULL CONSTRAINT historial_prueba_articulo_fk REFERENCES articulo (id),"
+                "  cantidad integer NOT NULL, fecha timestamp with time zone NOT NULL)"
+            )
+            cursor.execute("CREATE INDEX historial_prueba_fecha_idx ON historial_prueba (fecha)")
+            cursor.execute(
+                "INSERT INTO historial_prueba (articulo_id, cantidad, fecha) VALUES "
+                "(%s, 1, '2024-01-15'), (%s, 2, '2024-01-31 23:59'), (%s, 3, '2024-03-01')",
+                [articulo.id] * 3
+            )
+            # PostgreSQL no altera tablas con verificaciones de claves foráneas pendientes
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        particionar(connection, 'historial_prueba')
+
+        self.assertEqual(self.consultar("SELECT relkind FROM pg_class WHERE relname = 'historial_prueba'"), [('p',)])
+        self.assertEqual(
+            self.consultar("SELECT tableoid::regclass::text, cantidad FROM historial_prueba ORDER BY id"),
+            [('historial_prueba_p2024_01', 1), ('historial_prueba_p2024_01', 2), ('historial_prueba_p2024_03', 3)],
+        )
+        self.assertEqual(
+            self.consultar("SELECT count(*) FROM historial_prueba_p2024_02"), [(0,)],
+        )
+        self.assertTrue(self.consultar("SELECT 1 FROM pg_indexes WHERE indexname = 'historial_prueba_fecha_idx'"))
+        self.assertTrue(self.consultar(
+            "SELECT 1 FROM pg_constraint WHERE conname = 'historial_prueba_articulo_fk' "
+            "AND conrelid = 'historial_prueba'::regclass"
+        ))
+        self.assertEqual(
+            self.consultar(
+                "SELECT array_agg(a.attname ORDER BY a.attname) FROM pg_constraint c "
+                "JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey) "
+                "WHERE c.conname = 'historial_prueba_pkey'"
+            ),
+            [(['fecha', 'id'],)],
+        )
+        # Las filas nuevas siguen numerándose después de las copiadas
+        self.assertEqual(
+            self.consultar(
+                "INSERT INTO historial_prueba (articulo_id, cantidad, fecha) VALUES (%s, 4, now()) RETURNING id",
+                [articulo.id]
+            ),
+            [(4,)],
+        )
+
+
+class TotalesCatalogoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Computación')
+        # Sin señal: la subida de versión quedaría pendiente en la transacción de la clase,
+        # que nunca se confirma, y ocultaría las de cada prueba
+        Articulo.objects.bulk_create([Articulo(nombre='Monitor', categoria=cls.categoria, stock_actual=4)])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_totales_se_sirven_desde_cache_mientras_no_cambie_la_version(self):
+        self.assertEqual(totales_por_catalogo('categoria')[self.categoria.id]['total_unidades'], 4)
+        # Solo se consulta la versión
+        with self.assertNumQueries(1):
+            totales_por_catalogo('categoria')
+
+    def test_escritura_confirmada_sube_la_version_en_la_base_de_datos(self):
+        totales_por_catalogo('categoria')
+        with self.captureOnCommitCallbacks(execute=True):
+            Articulo.objects.create(nombre='Teclado', categoria=self.categoria, stock_actual=6)
+
+        self.assertEqual(totales_por_catalogo('categoria')[self.categoria.id], {'total_articulos': 2, 'total_unidades': 10})
+
+    def test_una_sola_subida_de_version_por_transaccion(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for nombre in ['Teclado', 'Mouse', 'Parlante']:
+                Articulo.objects.create(nombre=nombre, categoria=self.categoria, stock_actual=1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(VersionDatos.objects.get(clave='articulos').valor, 1)
+
+    def test_savepoint_revertido_no_impide_la_subida_de_version(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Articulo.objects.create(nombre='Teclado', categoria=self.categoria, stock_actual=1)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            Articulo.objects.create(nombre='Mouse', categoria=self.categoria, stock_actual=1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(VersionDatos.objects.get(clave='articulos').valor, 1)
+
+    def test_version_subida_por_otro_worker_invalida_la_cache_local(self):
+        totales_por_catalogo('categoria')
+        # Otro proceso escribe: su caché no es esta, pero la versión está en la base de datos
+        Articulo.objects.filter(categoria=self.categoria).update(stock_actual=9)
+        VersionDatos.objects.update_or_create(clave='articulos', defaults={'valor': 99})
+
+        self.assertEqual(totales_por_catalogo('categoria')[self.categoria.id]['total_unidades'], 9)
+
+
+class PrevisualizacionImportacionTests(TestCase):
+    CSV = 'nombre,stock_actual,stock_minimo,categoria,ubicacion,codigo_interno\nMonitor,5,1,Computación,Bodega,MON-1\n'.encode()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cls.categoria = Categoria.objects.create(nombre='Computación')
+        Ubicacion.objects.create(nombre='Bodega')
+
+    def setUp(self):
+        cache.clear()
+        self.cliente = APIClient(SERVER_NAME='localhost')
+        self.cliente.force_authenticate(self.usuario)
+
+    def previsualizar(self):
+        archivo = SimpleUploadedFile('articulos.csv', self.CSV, content_type='text/csv')
+        respuesta = self.cliente.post('/api/articulos/importar/', {'file': archivo, 'dry_run': 'true'}, format='multipart')
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_mismo_archivo_sin_cambios_usa_la_cache(self):
+        self.assertFalse(self.previsualizar()['desde_cache'])
+        self.assertTrue(self.previsualizar()['desde_cache'])
+
+    def test_cambio_de_articulos_recalcula_la_previsualizacion(self):
+        self.assertEqual(self.previsualizar()['resumen']['crear'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Articulo.objects.create(nombre='Monitor', categoria=self.categoria, stock_actual=2, codigo_interno='MON-1')
+
+        previa = self.previsualizar()
+        self.assertFalse(previa['desde_cache'])
+        self.assertEqual((previa['resumen']['crear'], previa['resumen']['actualizar']), (0, 1))
+
+    def test_cambio_de_catalogos_recalcula_la_previsualizacion(self):
+        self.assertEqual(self.previsualizar()['catalogos_nuevos'], {})
+        Categoria.objects.filter(pk=self.categoria.pk).update(nombre='Informática')
+
+        previa = self.previsualizar()
+        self.assertFalse(previa['desde_cache'])
+        self.assertEqual(previa['catalogos_nuevos'], {'categoria': ['Computación']})
+
+    def test_rechaza_las_filas_que_la_importacion_rechazaria_por_largo(self):
+        self.CSV = (
+            'nombre,stock_actual,stock_minimo,categoria,ubicacion,codigo_interno\n'
+            f'{"M" * 300},5,1,Computación,Bodega,MON-1\n'
+            f'Teclado,5,1,{"C" * 150},Bodega,TEC-1\n'
+        ).encode()
+        previa = self.previsualizar()
+        self.assertEqual((previa['resumen']['crear'], previa['resumen']['rechazar']), (0, 2))
+        self.assertEqual(previa['catalogos_nuevos'], {})
+
+        archivo = SimpleUploadedFile('articulos.csv', self.CSV, content_type='text/csv')
+        respuesta = self.cliente.post('/api/articulos/importar/', {'file': archivo}, format='multipart')
+        self.assertEqual((respuesta.json()['creados'], len(respuesta.json()['errores'])), (0, 2))
+
+
+class CargaArchivoTests(TransactionTestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(CARGAS_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        self.cliente = APIClient(SERVER_NAME='localhost')
+        self.cliente.force_authenticate(self.usuario)
+
+    def enviar(self, carga, contenido, inicio):
+        return self.cliente.generic(
+            'PUT', f'/api/cargas/{carga.id}/fragmento/', contenido, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {inicio}-{inicio + len(contenido) - 1}/{carga.tamano_total}',
+        )
+
+    def test_fragmentos_completan_el_archivo(self):
+        carga = crear_carga(self.usuario, 'articulos.csv', 10)
+
+        self.assertEqual(self.enviar(carga, b'12345', 0).status_code, 200)
+        self.assertEqual(self.enviar(carga, b'12345', 0).status_code, 409)
+        respuesta = self.enviar(carga, b'67890', 5)
+
+        self.assertEqual(respuesta.status_code, 200)
+        carga.refresh_from_db()
+        self.assertEqual((carga.estado, carga.bytes_recibidos, carga.recibiendo_hasta), ('Completada', 10, None))
+        with open(ruta_carga(carga), 'rb') as archivo:
+            self.assertEqual(archivo.read(), b'1234567890')
+
+    def test_el_cuerpo_se_escribe_fuera_de_una_transaccion(self):
+        carga = crear_carga(self.usuario, 'articulos.csv', 4)
+        prueba = self
+
+        class Cuerpo(io.BytesIO):
+            def read(self, *args):
+                prueba.assertFalse(connection.in_atomic_block)
+                # Mientras llega el cuerpo, otra petición a la misma carga no puede escribir
+                with prueba.assertRaises(ErrorCarga) as contexto:
+                    recibir_fragmento(carga.id, prueba.usuario, io.BytesIO(b'zz'), 0, 2)
+                prueba.assertEqual(contexto.exception.codigo, 409)
+                return super().read(*args)
+
+        recibir_fragmento(carga.id, self.usuario, Cuerpo(b'abcd'), 0, 4)
+
+        carga.refresh_from_db()
+        self.assertEqual((carga.estado, carga.bytes_recibidos), ('Completada', 4))
+
+    def test_reserva_vencida_se_puede_retomar(self):
+        carga = crear_carga(self.usuario, 'articulos.csv', 4)
+        CargaArchivo.objects.filter(pk=carga.pk).update(recibiendo_hasta=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.enviar(carga, b'abcd', 0).status_code, 200)
+
+    def test_purga_cargas_abandonadas_y_archivos_sin_carga(self):
+        antigua = crear_carga(self.usuario, 'antigua.csv', 4)
+        reciente = crear_carga(self.usuario, 'reciente.csv', 4)
+        importada = crear_carga(self.usuario, 'importada.xlsx', 4)
+        hace_tres_dias = timezone.now() - timedelta(days=3)
+        CargaArchivo.objects.filter(pk=antigua.pk).update(fecha_actualizacion=hace_tres_dias)
+        CargaArchivo.objects.filter(pk=importada.pk).update(estado='Importada', fecha_actualizacion=hace_tres_dias)
+        huerfano = os.path.join(os.path.dirname(ruta_carga(antigua)), 'sin-carga.csv')
+        open(huerfano, 'wb').close()
+        os.utime(huerfano, (hace_tres_dias.timestamp(),) * 2)
+
+        self.assertEqual(purgar_cargas_abandonadas(horas=48), (1, 1))
+
+        self.assertEqual(set(CargaArchivo.objects.values_list('pk', flat=True)), {reciente.pk, importada.pk})
+        self.assertFalse(os.path.exists(ruta_carga(antigua)))
+        self.assertFalse(os.path.exists(huerfano))
+        self.assertTrue(os.path.exists(ruta_carga(reciente)))
+
+
+class TelemetriaTests(TestCase):
+    def setUp(self):
+        reiniciar_telemetria()
+        self.addCleanup(reiniciar_telemetria)
+
+    def test_registros_concurrentes_no_pierden_muestras_ni_usan_la_cache(self):
+        def registrar():
+            for _ in range(500):
+                registrar_respuesta('GET articulos-list', 100, 40, 'gzip')
+
+        with mock.patch.object(cache, 'get') as leer, mock.patch.object(cache, 'set') as guardar:
+            hilos = [threading.Thread(target=registrar) for _ in range(8)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        self.assertFalse(leer.called or guardar.called)
+
+        [metricas] = resumen_respuestas()['endpoints']
+        self.assertEqual((metricas['respuestas'], metricas['bytes'], metricas['compresion']), (4000, 400000, 0.4))
+
+    @override_settings(PRESUPUESTO_RESPUESTA_API=10)
+    def test_respuesta_sobre_el_presupuesto_queda_en_el_log(self):
+        with self.assertLogs('gestion.telemetria', 'WARNING'):
+            registrar_respuesta('GET articulos-list', 11, 11, None)
+        self.assertEqual(resumen_respuestas()['endpoints'][0]['sobre_presupuesto'], 1)
+
+    def test_rutas_inexistentes_se_agrupan(self):
+        usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cliente = APIClient(SERVER_NAME='localhost')
+        cliente.force_authenticate(usuario)
+        for ruta in ('/api/no-existe/1/', '/api/no-existe/2/'):
+            cliente.get(ruta)
+
+        endpoints = {m['endpoint']: m['respuestas'] for m in cliente.get('/api/telemetria-respuestas/').json()['endpoints']}
+        self.assertEqual(endpoints['GET (sin ruta)'], 2)
+
+
+class PrestamoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cls.ana = Personal.objects.create(nombre='Ana', correo_institucional='ana@ejemplo.cl')
+        cls.bruno = Personal.objects.create(nombre='Bruno', correo_institucional='bruno@ejemplo.cl')
+        cls.motivo = Motivo.objects.create(nombre='Clases')
+
+    def setUp(self):
+        self.cliente = APIClient(SERVER_NAME='localhost')
+        self.cliente.force_authenticate(self.usuario)
+        self.articulo = Articulo.objects.create(nombre='Proyector', stock_actual=10)
+
+    def movimiento(self, tipo, cantidad, personal):
+        return self.cliente.post('/api/movimientos/', {
+            'articulo': self.articulo.id, 'tipo_movimiento': tipo, 'cantidad': cantidad, 'personal': personal.id,
+            'motivo': self.motivo.id,
+        }, format='json')
+
+    def test_devolver_mas_de_lo_prestado_a_la_persona_responde_400(self):
+        # El artículo tiene 3 unidades prestadas, pero ninguna a Bruno
+        self.assertEqual(self.movimiento('Prestamo', 3, self.ana).status_code, 201)
+
+        respuesta = self.movimiento('Regresado', 2, self.bruno)
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('excede lo prestado a esta persona', str(respuesta.json()['error']))
+        self.assertEqual(HistorialPrestamo.objects.get(personal=self.ana).cantidad_restante, 3)
+
+    def test_devolucion_se_reparte_entre_prestamos_del_mas_antiguo_al_mas_reciente(self):
+        self.movimiento('Prestamo', 2, self.ana)
+        self.movimiento('Prestamo', 3, self.ana)
+        primero, segundo = HistorialPrestamo.objects.order_by('id')
+
+        respuesta = self.movimiento('Regresado', 4, self.ana)
+
+        self.assertEqual(respuesta.status_code, 201)
+        primero.refresh_from_db()
+        segundo.refresh_from_db()
+        self.assertEqual((primero.cantidad_restante, segundo.cantidad_restante), (0, 1))
+        self.assertIsNotNone(primero.fecha_devolucion)
+        self.assertIsNone(segundo.fecha_devolucion)
+        devolucion = Movimiento.objects.get(id=respuesta.json()['id'])
+        self.assertEqual(devolucion.prestamo_relacionado_id, primero.movimiento_prestamo_id)
+        self.assertEqual(
+            sorted(devolucion.asignaciones_devolucion.values_list('prestamo_id', 'cantidad')),
+            [(primero.id, 2), (segundo.id, 2)],
+        )
+        self.articulo.refresh_from_db()
+        self.assertEqual((self.articulo.stock_actual, self.articulo.stock_prestado), (9, 1))
+
+    def test_devolucion_solo_descuenta_prestamos_de_la_persona(self):
+        self.movimiento('Prestamo', 2, self.bruno)
+        self.movimiento('Prestamo', 3, self.ana)
+
+        self.assertEqual(self.movimiento('Regresado', 3, self.ana).status_code, 201)
+
+        self.assertEqual(HistorialPrestamo.objects.get(personal=self.bruno).cantidad_restante, 2)
+        self.assertEqual(HistorialPrestamo.objects.get(personal=self.ana).cantidad_restante, 0)
+
+    def test_migracion_registra_las_devoluciones_existentes(self):
+        self.movimiento('Prestamo', 2, self.ana)
+        self.movimiento('Prestamo', 3, self.ana)
+        primera = self.movimiento('Regresado', 2, self.ana).json()['id']
+        segunda = self.movimiento('Regresado', 3, self.ana).json()['id']
+        primero, segundo = HistorialPrestamo.objects.order_by('id')
+        # Antes de 0010 una devolución solo tenía prestamo_relacionado
+        AsignacionDevolucion.objects.all().delete()
+
+        registrar_devoluciones_existentes(apps, None)
+
+        self.assertEqual(
+            sorted(AsignacionDevolucion.objects.values_list('movimiento_devolucion_id', 'prestamo_id', 'cantidad')),
+            [(primera, primero.id, 2), (segunda, segundo.id, 3)],
+        )
+
+
+class LineaTiempoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cls.persona = Personal.objects.create(nombre='Ana', correo_institucional='ana@ejemplo.cl')
+        cls.motivo = Motivo.objects.create(nombre='Clases')
+
+    def mover(self, articulo, tipo, cantidad, **extra):
+        return Movimiento.objects.create(articulo=articulo, tipo_movimiento=tipo, cantidad=cantidad, usuario=self.usuario, **extra)
+
+    def recorrer(self, articulo_id, descendente, limite=2):
+        filas, cursor = linea_tiempo(articulo_id, limite=limite, descendente=descendente)
+        while cursor:
+            pagina, cursor = linea_tiempo(articulo_id, cursor=cursor, limite=limite)
+            filas += pagina
+        return filas
+
+    def test_saldo_final_coincide_con_el_stock_del_articulo(self):
+        # Stock cargado fuera del registro y un movimiento anterior que no lo explica
+        articulo = Articulo.objects.create(nombre='Proyector', stock_actual=10)
+        Movimiento.objects.bulk_create([Movimiento(articulo=articulo, tipo_movimiento='Entrada', cantidad=100, usuario=self.usuario)])
+        Articulo.objects.filter(pk=articulo.pk).update(stock_actual=10)
+        registrar_saldos_iniciales(apps, None)
+        self.mover(articulo, 'Salida', 3)
+        self.mover(articulo, 'Prestamo', 2, personal=self.persona, motivo=self.motivo)
+        articulo.refresh_from_db()
+
+        ascendente = self.recorrer(articulo.id, descendente=False)
+        descendente = self.recorrer(articulo.id, descendente=True)
+
+        self.assertEqual([f['tipo_movimiento'] for f in ascendente], ['Entrada', 'Saldo Inicial', 'Salida', 'Prestamo'])
+        self.assertEqual((ascendente[-1]['stock_actual'], ascendente[-1]['stock_prestado']), (articulo.stock_actual, articulo.stock_prestado))
+        self.assertEqual(ascendente[1]['stock_actual'], 10)
+        self.assertEqual(descendente[0]['stock_actual'], articulo.stock_actual)
+        self.assertEqual(
+            [f['stock_actual'] for f in descendente], [f['stock_actual'] for f in reversed(ascendente)],
+        )
+
+    def test_paginas_encadenan_el_saldo(self):
+        articulo = Articulo.objects.create(nombre='Cable', stock_actual=0)
+        for cantidad in (5, 4, 3):
+            self.mover(articulo, 'Entrada', cantidad)
+        anulada = self.mover(articulo, 'Salida', 2)
+        revertir_movimientos([anulada.id], self.usuario)
+
+        filas = self.recorrer(articulo.id, descendente=False, limite=1)
+
+        self.assertEqual([f['stock_actual'] for f in filas], [5, 9, 12, 10, 12])
+        self.assertEqual([f['anulado'] for f in filas], [False, False, False, True, False])
+
+    def test_endpoint_sigue_el_enlace_next_y_rechaza_cursores_alterados(self):
+        articulo = Articulo.objects.create(nombre='Cable', stock_actual=0)
+        for cantidad in (5, 4, 3):
+            self.mover(articulo, 'Entrada', cantidad)
+        cliente = APIClient(SERVER_NAME='localhost')
+        cliente.force_authenticate(self.usuario)
+
+        pagina = cliente.get(f'/api/articulos/{articulo.id}/linea-tiempo/?orden=asc&limite=2').json()
+        saldos = [f['stock_actual'] for f in pagina['results']]
+        pagina = cliente.get(pagina['next']).json()
+        saldos += [f['stock_actual'] for f in pagina['results']]
+
+        self.assertEqual(saldos, [5, 9, 12])
+        self.assertIsNone(pagina['next'])
+        respuesta = cliente.get(f'/api/articulos/{articulo.id}/linea-tiempo/?cursor=alterado')
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class HistorialArchivadoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cls.articulo = Articulo.objects.create(nombre='Monitor', stock_actual=1)
+        cls.otro = Articulo.objects.create(nombre='Teclado', stock_actual=1)
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        archivo = mock.patch.object(historial, 'DIRECTORIO_ARCHIVO', directorio.name)
+        archivo.start()
+        self.addCleanup(archivo.stop)
+        # Enero de 2020 archivado: una fila por artículo
+        historial.escribir_archivo([
+            {
+                'id': 1000 + i, 'articulo_id': articulo.id, 'tipo_movimiento': 'Entrada', 'cantidad': 1,
+                'stock_anterior': 0, 'stock_actual': 1, 'fecha': historial.inicio_mes(2020, 1) + timedelta(days=i),
+                'usuario_id': self.usuario.id, 'comentario': None, 'motivo_id': None, 'ubicacion_id': None,
+            }
+            for i, articulo in enumerate([self.articulo, self.otro])
+        ], 2020, 1)
+        self.mover(self.articulo)
+        self.cliente = APIClient(SERVER_NAME='localhost')
+        self.cliente.force_authenticate(self.usuario)
+
+    def mover(self, articulo):
+        Movimiento.objects.create(articulo=articulo, tipo_movimiento='Entrada', cantidad=1, usuario=self.usuario)
+
+    def ids(self, consulta=''):
+        respuesta = self.cliente.get(f'/api/historial-stock/{consulta}')
+        self.assertEqual(respuesta.status_code, 200)
+        return [fila['id'] for fila in respuesta.json()]
+
+    def test_filas_archivadas_sin_fecha_desde(self):
+        reciente = HistorialStock.objects.get().id
+        self.assertEqual(self.ids(), [reciente, 1001, 1000])
+        self.assertEqual(self.ids(f'?articulo={self.articulo.id}'), [reciente, 1000])
+        self.assertEqual(self.ids('?fecha_hasta=2020-01-01'), [1000])
+
+    def test_rango_sin_meses_archivados_no_los_lee(self):
+        with mock.patch.object(historial, 'leer_archivo') as leer:
+            self.assertEqual(len(self.ids('?fecha_desde=2020-02-01')), 1)
+        leer.assert_not_called()
+
+    @override_settings(HISTORIAL_LIMITE_COMBINADO=2)
+    def test_combinacion_acotada(self):
+        respuesta = self.cliente.get('/api/historial-stock/')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.ids(f'?articulo={self.articulo.id}')[-1], 1000)
+
+
+class EdicionMasivaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cls.bodega = Ubicacion.objects.create(nombre='Bodega')
+        cls.sala = Ubicacion.objects.create(nombre='Sala 1')
+        cls.operativo = EstadoArticulo.objects.create(nombre='Operativo')
+        cls.baja = EstadoArticulo.objects.create(nombre='De baja')
+
+    def setUp(self):
+        self.cliente = APIClient(SERVER_NAME='localhost')
+        self.cliente.force_authenticate(self.usuario)
+        self.monitor = Articulo.objects.create(
+            nombre='Monitor', stock_actual=2, ubicacion=self.bodega, estado=self.operativo, codigo_interno='MON-1',
+        )
+        self.teclado = Articulo.objects.create(nombre='Teclado', stock_actual=5, ubicacion=self.bodega, estado=self.operativo)
+
+    def editar(self, datos):
+        return self.cliente.post('/api/articulos/edicion-masiva/', datos, format='json')
+
+    def test_registra_cada_cambio_en_el_historial(self):
+        respuesta = self.editar({
+            'ids': [self.monitor.id, self.teclado.id],
+            'cambios': {'ubicacion': self.sala.id, 'estado': self.baja.id},
+        })
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            set(Articulo.objects.values_list('ubicacion_id', 'estado_id')), {(self.sala.id, self.baja.id)},
+        )
+        edicion = HistorialStock.objects.get(articulo=self.monitor, tipo_movimiento='Edicion')
+        self.assertEqual(edicion.comentario, "Edición masiva de ubicacion: 'Bodega' a 'Sala 1'.")
+        self.assertEqual(edicion.stock_actual, 2)
+        cambios = Movimiento.objects.filter(tipo_movimiento='Cambio de Estado')
+        self.assertEqual(
+            sorted(cambios.values_list('articulo_id', 'estado_anterior_id', 'estado_nuevo_id')),
+            [(self.monitor.id, self.operativo.id, self.baja.id), (self.teclado.id, self.operativo.id, self.baja.id)],
+        )
+
+    def test_categoria_con_campos_obligatorios_rechaza_el_lote_completo(self):
+        categoria = Categoria.objects.create(nombre='Computación', requiere_codigo_interno=True)
+
+        respuesta = self.editar({'ids': [self.monitor.id, self.teclado.id], 'cambios': {'categoria': categoria.id}})
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['articulos'], [self.teclado.id])
+        self.assertFalse(Articulo.objects.filter(categoria=categoria).exists())
+        self.assertFalse(HistorialStock.objects.filter(tipo_movimiento='Edicion').exists())
+
+    def test_cambio_de_estado_que_repetiria_un_codigo_se_rechaza(self):
+        Articulo.objects.create(nombre='Pantalla antigua', stock_actual=1, estado=self.baja, codigo_interno='MON-1')
+
+        respuesta = self.editar({'filtro': {'nombre': 'Monitor'}, 'cambios': {'estado': self.baja.id}})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['articulos'], [self.monitor.id])
+        self.monitor.refresh_from_db()
+        self.assertEqual(self.monitor.estado, self.operativo)
+
+    def test_campos_o_filtros_no_permitidos(self):
+        self.assertEqual(self.editar({'ids': [self.monitor.id], 'cambios': {'nombre': 'Otro'}}).status_code, 400)
+        self.assertEqual(self.editar({'filtro': {'mac': 'x'}, 'cambios': {'stock_minimo': 1}}).status_code, 400)
+        self.assertEqual(self.editar({'ids': [self.monitor.id], 'cambios': {'stock_minimo': -1}}).status_code, 400)
+        self.assertEqual(self.editar({'cambios': {'stock_minimo': 1}}).status_code, 400)
+
+
+class SesionConteoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+        cls.bodega = Ubicacion.objects.create(nombre='Bodega')
+        cls.sala = Ubicacion.objects.create(nombre='Sala 1')
+
+    def setUp(self):
+        self.monitor = Articulo.objects.create(nombre='Monitor', stock_actual=10, ubicacion=self.bodega, codigo_interno='MON-1')
+        self.teclado = Articulo.objects.create(nombre='Teclado', stock_actual=5, ubicacion=self.bodega, numero_serie='MON-1')
+        self.mouse = Articulo.objects.create(nombre='Mouse', stock_actual=3, ubicacion=self.bodega, codigo_interno='MOU-1')
+        self.silla = Articulo.objects.create(nombre='Silla', stock_actual=7, ubicacion=self.sala, codigo_interno='SIL-1')
+
+    def test_sesion_toma_la_foto_del_stock_de_su_alcance(self):
+        sesion = abrir_sesion('Bodega', self.usuario, ubicacion=self.bodega)
+
+        self.assertEqual(
+            sorted(sesion.lineas.values_list('articulo_id', 'stock_inicial')),
+            [(self.monitor.id, 10), (self.teclado.id, 5), (self.mouse.id, 3)],
+        )
+
+    def test_lecturas_se_suman_o_reemplazan_y_rechazan_codigos_dudosos(self):
+        sesion = abrir_sesion('Bodega', self.usuario, ubicacion=self.bodega)
+
+        resultado = registrar_conteos(sesion.id, [
+            {'codigo': 'MOU-1'}, {'codigo': 'MOU-1'}, {'articulo': self.monitor.id, 'cantidad': 4},
+            {'codigo': 'MON-1'}, {'codigo': 'SIL-1'},
+        ])
+        registrar_conteos(sesion.id, [{'articulo': self.monitor.id, 'cantidad': 3}])
+        registrar_conteos(sesion.id, [{'codigo': 'MOU-1', 'cantidad': 1}], modo='reemplazar')
+
+        self.assertEqual(resultado['lineas_actualizadas'], 2)
+        self.assertEqual([(r['lectura'], r['error']) for r in resultado['rechazadas']], [
+            (4, 'Código ambiguo.'), (5, 'El artículo no está incluido en la sesión.'),
+        ])
+        self.assertEqual(
+            dict(sesion.lineas.values_list('articulo_id', 'cantidad_contada')),
+            {self.monitor.id: 7, self.teclado.id: None, self.mouse.id: 1},
+        )
+
+    def test_confirmar_ajusta_sobre_el_stock_actual(self):
+        sesion = abrir_sesion('Bodega', self.usuario, ubicacion=self.bodega)
+        registrar_conteos(sesion.id, [{'articulo': self.monitor.id, 'cantidad': 8}], modo='reemplazar')
+        # Una salida durante el conteo no se pierde con el ajuste
+        Movimiento.objects.create(articulo=self.monitor, tipo_movimiento='Salida', cantidad=1, usuario=self.usuario)
+
+        sesion = confirmar_sesion(sesion.id, self.usuario)
+
+        self.monitor.refresh_from_db()
+        self.teclado.refresh_from_db()
+        self.assertEqual((self.monitor.stock_actual, self.teclado.stock_actual), (7, 5))
+        ajuste = Movimiento.objects.get(articulo=self.monitor, comentario__startswith='Ajuste por conteo')
+        self.assertEqual((ajuste.tipo_movimiento, ajuste.cantidad), ('Salida', 2))
+        self.assertEqual(sesion.resultado, {'ajustados': 1, 'entradas': 0, 'salidas': 1, 'no_contados_en_cero': False})
+        with self.assertRaises(ErrorConteo):
+            registrar_conteos(sesion.id, [{'articulo': self.monitor.id}])
+
+    def test_ajuste_que_deja_stock_negativo_no_escribe_nada(self):
+        sesion = abrir_sesion('Bodega', self.usuario, ubicacion=self.bodega)
+        registrar_conteos(sesion.id, [{'articulo': self.mouse.id, 'cantidad': 0}], modo='reemplazar')
+        Movimiento.objects.create(articulo=self.mouse, tipo_movimiento='Salida', cantidad=2, usuario=self.usuario)
+
+        with self.assertRaises(ErrorConteo) as error:
+            confirmar_sesion(sesion.id, self.usuario, no_contados_en_cero=True)
+
+        self.assertEqual(error.exception.detalle, [self.mouse.id])
+        self.assertEqual(Articulo.objects.get(pk=self.monitor.pk).stock_actual, 10)
+        sesion.refresh_from_db()
+        self.assertEqual(sesion.estado, 'Abierta')
+        self.assertEqual(cancelar_sesion(sesion.id).estado, 'Cancelada')
+
+
+class IdempotenciaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@ejemplo.cl', 'clave')
+
+    def setUp(self):
+        self.articulo = Articulo.objects.create(nombre='Cable', stock_actual=10)
+        self.cliente = APIClient(SERVER_NAME='localhost')
+        self.cliente.force_authenticate(self.usuario)
+
+    def entrada(self, cantidad, clave='entrada-1'):
+        return self.cliente.post('/api/movimientos/', {
+            'articulo': self.articulo.id, 'tipo_movimiento': 'Entrada', 'cantidad': cantidad,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=clave)
+
+    def test_reintento_devuelve_la_misma_respuesta_sin_repetir_la_escritura(self):
+        primera = self.entrada(3)
+        segunda = self.entrada(3)
+
+        self.assertEqual((primera.status_code, segunda.status_code), (201, 201))
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(Movimiento.objects.filter(articulo=self.articulo).count(), 1)
+        self.assertEqual(Articulo.objects.get(pk=self.articulo.pk).stock_actual, 13)
+
+    def test_misma_clave_con_otra_solicitud_responde_422(self):
+        self.entrada(3)
+
+        respuesta = self.entrada(4)
+
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(Articulo.objects.get(pk=self.articulo.pk).stock_actual, 13)
+        # Otra clave es otra solicitud
+        self.assertEqual(self.entrada(4, clave='entrada-2').status_code, 201)
+
+    def test_errores_del_servidor_liberan_la_clave(self):
+        respuestas = [Response({'error': 'no disponible'}, status=503), Response({'ok': True}, status=201)]
+
+        class Vista(APIView):
+            permission_classes = []
+
+            @idempotente
+            def post(self, request):
+                return respuestas.pop(0)
+
+        vista = Vista.as_view()
+        fabrica = APIRequestFactory()
+
+        def enviar():
+            solicitud = fabrica.post('/prueba/', {'a': 1}, format='json', HTTP_IDEMPOTENCY_KEY='clave-5xx')
+            force_authenticate(solicitud, self.usuario)
+            return vista(solicitud)
+
+        self.assertEqual(enviar().status_code, 503)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+        self.assertEqual(enviar().status_code, 201)
+        self.assertEqual(enviar().status_code, 201)
+        self.assertEqual(respuestas, [])
+
+    def test_excepcion_libera_la_clave_y_revierte_la_escritura(self):
+        with mock.patch.object(MovimientoViewSet, 'get_success_headers', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.entrada(3)
+
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+        self.assertEqual(Articulo.objects.get(pk=self.articulo.pk).stock_actual, 10)
+        self.assertEqual(self.entrada(3).status_code, 201)
@@ -0,0 +1,68 @@
+# gestion/totales_catalogos.py
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import Articulo, VersionDatos
+
+# Campo de Articulo -> catálogo cuyo listado acepta ?con_totales=1
+CAMPOS_TOTALES = ['categoria', 'ubicacion', 'marca', 'modelo', 'estado']
+
+TOTALES_VACIOS = {'total_articulos': 0, 'total_unidades': 0}
+
+CLAVE_VERSION = 'articulos'
+
+
+def version_articulos():
+    """
+    Versión de los artículos según la base de datos (VersionDatos): la comparten todos
+    los workers, aunque la caché sea por proceso.
+    """
+    valor = VersionDatos.objects.filter(clave=CLAVE_VERSION).values_list('valor', flat=True).first()
+    return valor or 0
+
+
+def subir_version_articulos():
+    if VersionDatos.objects.filter(clave=CLAVE_VERSION).update(valor=F('valor') + 1):
+        return
+    _, creada = VersionDatos.objects.get_or_create(clave=CLAVE_VERSION, defaults={'valor': 1})
+    if not creada:
+        VersionDatos.objects.filter(clave=CLAVE_VERSION).update(valor=F('valor') + 1)
+
+
+def registrar_cambio_articulos():
+    """
+    Sube la versión de los artículos al confirmarse la transacción en curso. Si subiera
+    antes, una lectura concurrente podría volver a guardar los totales sin el cambio.
+    Se encola una sola subida por transacción; si un savepoint revertido descarta la
+    pendiente, el siguiente cambio la vuelve a encolar.
+    """
+    pendientes = transaction.get_connection().run_on_commit
+    if any(pendiente[1] is subir_version_articulos for pendiente in pendientes):
+        return
+    transaction.on_commit(subir_version_articulos)
+
+
+def totales_por_catalogo(campo):
+    """
+    {id del catálogo: {'total_articulos', 'total_unidades'}} para `campo` de Articulo, con
+    una sola consulta agrupada. Se guarda en la caché bajo la versión actual: cualquier
+    escritura de artículos cambia la versión y la siguiente lectura lo recalcula.
+    """
+    clave = f"catalogos:totales:{campo}:{version_articulos()}"
+    totales = cache.get(clave)
+    if totales is None:
+        filas = (
+            Articulo.objects.filter(**{f'{campo}__isnull': False})
+            .values(campo)
+            .annotate(total_articulos=Count('id'), total_unidades=Sum('stock_actual'))
+            .order_by()
+        )
+        totales = {
+            fila[campo]: {'total_articulos': fila['total_articulos'], 'total_unidades': fila['total_unidades'] or 0}
+            for fila in filas
+        }
+        cache.set(clave, totales, settings.CATALOGOS_TOTALES_TTL)
+    return totales
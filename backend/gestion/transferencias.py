@@ -0,0 +1,182 @@
+# gestion/transferencias.py
+
+import logging
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import Articulo, HistorialStock, Movimiento
+from .totales_catalogos import registrar_cambio_articulos
+
+logger = logging.getLogger(__name__)
+
+# Máximo de artículos que se aceptan en una transferencia por lote
+MAXIMO_LOTE_TRANSFERENCIA = 500
+
+# Campos que identifican a "el mismo artículo" en distintos estados
+# (cubiertos por el índice articulo_identidad_idx)
+CAMPOS_IDENTIDAD = ['nombre', 'categoria_id', 'marca_id', 'modelo_id', 'ubicacion_id']
+
+# Datos que hereda el artículo destino cuando hay que crearlo
+CAMPOS_COPIADOS = [
+    'stock_minimo', 'descripcion', 'codigo_interno', 'codigo_minvu', 'numero_serie', 'mac'
+]
+
+
+class ErrorTransferencia(Exception):
+    pass
+
+
+def _identidad(articulo):
+    return tuple(getattr(articulo, campo) for campo in CAMPOS_IDENTIDAD)
+
+
+def transferir_estado(items, estado_nuevo, usuario, comentario=None, motivo=None):
+    """
+    Mueve unidades de uno o varios artículos a su equivalente en `estado_nuevo` (mismo
+    nombre, categoría, marca, modelo y ubicación), creándolo si no existe.
+    `items` es una lista de (articulo_id, cantidad).
+
+    Bloquea los artículos de origen y de destino, mueve el stock con un único UPDATE
+    basado en F() y registra un movimiento por artículo e historial en ambos lados.
+    El número de consultas no depende de la cantidad de artículos.
+    Devuelve los movimientos creados.
+    """
+    cantidades = defaultdict(int)
+    for articulo_id, cantidad in items:
+        if cantidad <= 0:
+            raise ErrorTransferencia("La cantidad debe ser mayor a 0 para una transferencia de estado.")
+        cantidades[articulo_id] += cantidad
+    if not cantidades:
+        raise ErrorTransferencia("No se indicaron artículos para transferir.")
+    if len(cantidades) > MAXIMO_LOTE_TRANSFERENCIA:
+        raise ErrorTransferencia(f"Se pueden transferir hasta {MAXIMO_LOTE_TRANSFERENCIA} artículos por lote.")
+
+    with transaction.atomic():
+        origenes = list(
+            Articulo.objects.select_for_update().filter(id__in=cantidades).order_by('id')
+        )
+        faltantes = set(cantidades) - {a.id for a in origenes}
+        if faltantes:
+            raise ErrorTransferencia(f"No existen los artículos: {', '.join(map(str, sorted(faltantes)))}.")
+
+        for origen in origenes:
+            if origen.estado_id == estado_nuevo.id:
+                raise ErrorTransferencia(f"El artículo '{origen.nombre}' ya está en el estado '{estado_nuevo.nombre}'.")
+            if origen.stock_actual < cantidades[origen.id]:
+                raise ErrorTransferencia(
+                    f"No hay suficiente stock de '{origen.nombre}' para realizar la transferencia."
+                )
+
+        destinos = _bloquear_destinos(origenes, estado_nuevo)
+
+        nuevos = {}
+        for origen in origenes:
+            clave = _identidad(origen)
+            if clave not in destinos and clave not in nuevos:
+                nuevos[clave] = Articulo(
+                    estado=estado_nuevo,
+                    stock_actual=0,
+                    **{campo: getattr(origen, campo) for campo in CAMPOS_IDENTIDAD + CAMPOS_COPIADOS}
+                )
+        if nuevos:
+            try:
+                # Savepoint: un conflicto de códigos únicos no debe romper la transacción externa
+                with transaction.atomic():
+                    Articulo.objects.bulk_create(nuevos.values())
+            except IntegrityError:
+                raise ErrorTransferencia(
+                    f"Ya existe un artículo en el estado '{estado_nuevo.nombre}' con el mismo código, "
+                    "número de serie o MAC."
+                )
+            destinos.update(nuevos)
+
+        # Un solo UPDATE mueve el stock de todos los orígenes y destinos
+        deltas = defaultdict(int)
+        for origen in origenes:
+            deltas[origen.id] -= cantidades[origen.id]
+            deltas[destinos[_identidad(origen)].id] += cantidades[origen.id]
+        Articulo.objects.filter(id__in=deltas).update(
+            stock_actual=F('stock_actual') + Case(
+                *[When(id=articulo_id, then=Value(delta)) for articulo_id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        registrar_cambio_articulos()
+
+        ahora = timezone.now()
+        movimientos = []
+        historial = []
+        for origen in origenes:
+            destino = destinos[_identidad(origen)]
+            cantidad = cantidades[origen.id]
+            texto = comentario or f"Transferencia de {cantidad} unidad(es) al estado '{estado_nuevo.nombre}'."
+            movimientos.append(Movimiento(
+                articulo=origen,
+                tipo_movimiento='Cambio de Estado por Unidad',
+                cantidad=cantidad,
+                fecha=ahora,
+                usuario=usuario,
+                ubicacion_id=origen.ubicacion_id,
+                comentario=texto,
+                motivo=motivo,
+                estado_nuevo=estado_nuevo,
+                estado_anterior_id=origen.estado_id,
+                articulo_destino=destino,
+            ))
+            # Los valores en memoria siguen siendo exactos porque las filas están bloqueadas
+            historial.append(HistorialStock(
+                articulo=origen,
+                tipo_movimiento='Cambio de Estado por Unidad',
+                cantidad=cantidad,
+                stock_anterior=origen.stock_actual,
+                stock_actual=origen.stock_actual - cantidad,
+                usuario=usuario,
+                comentario=texto,
+                motivo=motivo,
+                ubicacion_id=origen.ubicacion_id,
+            ))
+            historial.append(HistorialStock(
+                articulo=destino,
+                tipo_movimiento='Cambio de Estado por Unidad',
+                cantidad=cantidad,
+                stock_anterior=destino.stock_actual,
+                stock_actual=destino.stock_actual + cantidad,
+                usuario=usuario,
+                comentario=f"Recibido desde el artículo {origen.id}. {texto}",
+                motivo=motivo,
+                ubicacion_id=destino.ubicacion_id,
+            ))
+            origen.stock_actual -= cantidad
+            destino.stock_actual += cantidad
+
+        movimientos = Movimiento.objects.bulk_create(movimientos)
+        HistorialStock.objects.bulk_create(historial)
+
+    logger.info(
+        f"Transferencia de estado a '{estado_nuevo.nombre}' por {usuario}: "
+        f"{len(movimientos)} artículo(s), {len(nuevos)} creado(s) en el nuevo estado."
+    )
+    return movimientos
+
+
+def _bloquear_destinos(origenes, estado_nuevo):
+    """
+    Busca y bloquea en una consulta los artículos equivalentes en `estado_nuevo`.
+    Devuelve {identidad: articulo}; si hay duplicados se usa el de menor id.
+    """
+    condicion = Q()
+    for clave in {_identidad(origen) for origen in origenes}:
+        condicion |= Q(**dict(zip(CAMPOS_IDENTIDAD, clave)))
+
+    destinos = {}
+    for destino in (
+        Articulo.objects.select_for_update()
+        .filter(condicion, estado=estado_nuevo)
+        .order_by('id')
+    ):
+        destinos.setdefault(_identidad(destino), destino)
+    return destinos
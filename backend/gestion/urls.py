@@ -18,9 +18,14 @@ from gestion.views import (
     ArticuloStockAPIView,
     MovimientoHistoryView,
     ArticuloListView,
+    LineaTiempoArticuloView,
     CambiarEstadoArticuloAPIView,
     UserViewSet,
-    UsuarioDetailView
+    UsuarioDetailView,
+    CargaArchivoViewSet,
+    SesionConteoViewSet,
+    ConciliacionStockAPIView,
+    TelemetriaRespuestasAPIView
 )
 
 router = DefaultRouter()
@@ -37,12 +42,17 @@ router.register(r'personal', PersonalViewSet, basename='personal')
 router.register(r'historial-prestamo', HistorialPrestamoViewSet, basename='historial_prestamo')
 router.register(r'usuarios', UserViewSet, basename='usuarios')
 router.register(r'tasks', TaskViewSet, basename='task')
+router.register(r'cargas', CargaArchivoViewSet, basename='cargas')
+router.register(r'conteos', SesionConteoViewSet, basename='conteos')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('articulos/<int:pk>/stock/', ArticuloStockAPIView.as_view(), name='articulo-stock'),
     path('articulos/<int:pk>/historial/', MovimientoHistoryView.as_view(), name='movimiento-history'),
+    path('articulos/<int:pk>/linea-tiempo/', LineaTiempoArticuloView.as_view(), name='articulo-linea-tiempo'),
     path('articulos-list/', ArticuloListView.as_view(), name='articulo-list'),
     path('cambiar-estado-articulo/<int:pk>/', CambiarEstadoArticuloAPIView.as_view(), name='cambiar_estado_articulo'),
+    path('conciliacion-stock/', ConciliacionStockAPIView.as_view(), name='conciliacion_stock'),
+    path('telemetria-respuestas/', TelemetriaRespuestasAPIView.as_view(), name='telemetria_respuestas'),
     path('user/', UsuarioDetailView.as_view(), name='user_detail'),
 ]
@@ -1,35 +1,61 @@
 # gestion_bodega/views.py
 
-import os
-import io
-import pandas as pd
-from datetime import datetime
+import itertools
+from datetime import datetime, timedelta
 from django.conf import settings
 from django.urls import reverse
-from rest_framework import viewsets, status, filters, permissions
+from rest_framework import viewsets, status, filters, permissions, renderers
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db import transaction, IntegrityError
+from django.db import transaction, DatabaseError
+from django.db.models import Count, Exists, OuterRef, Q
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
 from rest_framework.views import APIView
 from rest_framework import generics
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser, IsAuthenticated
 from rest_framework.exceptions import ValidationError
-from django.http import HttpResponse
-
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags, urlencode
 
 from .models import (
     Articulo,  Movimiento, HistorialStock, Categoria, Task, Ubicacion,
-    Marca, Modelo, Motivo, Personal, HistorialPrestamo, EstadoArticulo
+    Marca, Modelo, Motivo, Personal, HistorialPrestamo, EstadoArticulo, CargaArchivo, SesionConteo
 )
 from .serializers import (
     ArticuloSerializer, MovimientoSerializer, HistorialStockSerializer,
     CategoriaSerializer, TaskSerializer, UbicacionSerializer, MarcaSerializer, ModeloSerializer, MotivoSerializer,
-    PersonalSerializer, HistorialPrestamoSerializer, EstadoArticuloSerializer, UserSerializer
+    PersonalSerializer, HistorialPrestamoSerializer, EstadoArticuloSerializer, UserSerializer,
+    CargaArchivoSerializer, SesionConteoSerializer, LineaConteoSerializer, campos_solicitados
+)
+from .plantillas import obtener_plantilla
+from .reversiones import ErrorReversion, revertir_movimientos
+from .transferencias import ErrorTransferencia, transferir_estado
+from .historial import filas_archivadas, meses_archivados_en_rango
+from .conciliacion import ErrorConciliacion, conciliar
+from .conteos import (
+    ErrorConteo, abrir_sesion, cancelar_sesion, confirmar_sesion, diferencias, registrar_conteos,
+)
+from .edicion_masiva import ErrorEdicionMasiva, editar_articulos, seleccionar_articulos
+from .json_rapido import JSONRapidoRenderer, filas_valores, plan_valores, transmitir_arreglo
+from .telemetria import reiniciar_telemetria, resumen_respuestas
+from .idempotencia import idempotente
+from .totales_catalogos import totales_por_catalogo
+from .sincronizacion_personal import sincronizar_personal
+from .replicas import (
+    escribio_recientemente, leyendo_de_replica, leyendo_de_replica_activo, marcar_replica_caida,
+    replica_disponible, usar_primario,
+)
+from .linea_tiempo import LIMITE_LINEA_TIEMPO, LIMITE_MAXIMO_LINEA_TIEMPO, ErrorCursor, linea_tiempo
+from .importacion import (
+    ErrorImportacion, validar_formato, filas_desde_archivo, importar_filas, hash_archivo,
+    previsualizar_filas, obtener_previsualizacion, previsualizacion_en_cache, reporte_csv
+)
+from .cargas import (
+    ErrorCarga, crear_carga, recibir_fragmento, parsear_content_range, ruta_carga,
+    hash_carga, eliminar_archivo_carga
 )
 
 import logging
@@ -38,7 +64,139 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-class ArticuloViewSet(viewsets.ModelViewSet):
+def respuesta_importacion(resultado, continue_on_errors):
+    """
+    Respuesta HTTP de una importación a partir del resultado de importar_filas.
+    """
+    creados = resultado['creados']
+    actualizados = resultado['actualizados']
+    omitidos = resultado['omitidos']
+    errores = resultado['errores']
+
+    # Preparar la respuesta
+    response_data = {
+        "creados": creados,
+        "actualizados": actualizados,
+        "omitidos": omitidos
+    }
+
+    if errores:
+        response_data["errores"] = errores
+        logger.warning(f"Importación completada con errores. Creados: {creados}, Actualizados: {actualizados}, Omitidos: {omitidos}, Errores: {len(errores)}.")
+        if not continue_on_errors:
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            # Informar al usuario que hubo errores pero la importación continuó
+            return Response(response_data, status=status.HTTP_200_OK)
+
+    logger.info(f"Importación realizada con éxito. Creados: {creados}, Actualizados: {actualizados}, Omitidos: {omitidos}.")
+    return Response(
+        {
+            "creados": creados,
+            "actualizados": actualizados,
+            "omitidos": omitidos,
+            "mensaje": "Importación realizada con éxito."
+        },
+        status=status.HTTP_200_OK
+    )
+
+
+def respuesta_previsualizacion(previa, hash_contenido, desde_cache):
+    """
+    Respuesta compacta de una previsualización (dry run); el detalle por fila se descarga
+    desde reporte_url.
+    """
+    logger.info(f"Previsualización de importación: {previa['resumen']}")
+    return Response({
+        "dry_run": True,
+        "hash": hash_contenido,
+        "desde_cache": desde_cache,
+        "generado": previa['generado'],
+        "total_filas": previa['total_filas'],
+        "resumen": previa['resumen'],
+        "catalogos_nuevos": previa['catalogos_nuevos'],
+        "reporte_url": reverse('articulos-reporte-importacion', kwargs={'hash_contenido': hash_contenido}),
+    }, status=status.HTTP_200_OK)
+
+
+class CamposDispersosViewMixin:
+    """
+    Con ?fields= o ?vista= (ver CamposDispersosMixin en serializers.py) la consulta lee
+    solo las columnas que se van a serializar. Los campos relacionados se serializan como
+    id, por lo que en ese caso tampoco hacen falta los JOIN de select_related.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        campos = campos_solicitados(self.request, serializer_class.VISTAS)
+        if campos is None:
+            return queryset
+        try:
+            columnas = serializer_class.campos_modelo(campos)
+        except KeyError:
+            # El serializador responde con el error de campos desconocidos
+            return queryset
+        return queryset.select_related(None).only(*columnas)
+
+
+class ListadoRapidoMixin:
+    """
+    Listado sin instanciar modelos: si todos los campos del serializador salen de una
+    columna, se lee con values() y se codifica con JSONRapidoRenderer (orjson si está
+    instalado). La salida es la misma que la del serializador. Con ?stream=1 el arreglo
+    se envía por partes mientras se recorre la consulta.
+    """
+    renderer_classes = [JSONRapidoRenderer, renderers.BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        plan = plan_valores(self.get_serializer(), self.get_queryset().model)
+        if plan is None or self.paginator is not None or not isinstance(request.accepted_renderer, JSONRapidoRenderer):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.query_params.get('stream') == '1':
+            # El cuerpo se recorre después de que dispatch() termina, fuera de
+            # leyendo_de_replica(): se fija aquí la base que eligió el router y se lee el
+            # primer lote, para que un fallo de la réplica aún se repita en el primario.
+            filas = filas_valores(queryset.using(queryset.db), plan, iterar=True)
+            primera = next(filas, None)
+            if primera is not None:
+                filas = itertools.chain([primera], filas)
+            return StreamingHttpResponse(
+                transmitir_arreglo(filas),
+                content_type=request.accepted_renderer.media_type,
+            )
+        return Response(list(filas_valores(queryset, plan)))
+
+
+class LecturaReplicaMixin:
+    """
+    Las peticiones de solo lectura (GET/HEAD/OPTIONS) de la vista leen de la réplica
+    (DATABASE_REPLICA_URL) si está configurada y responde, salvo que el usuario haya
+    escrito hace menos de REPLICA_ADHERENCIA_SEGUNDOS. Si la réplica falla a mitad de la
+    petición, esta se repite en el primario (en un listado con ?stream=1, solo si falla
+    antes del primer lote).
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or not replica_disponible():
+            return super().dispatch(request, *args, **kwargs)
+        with leyendo_de_replica():
+            try:
+                return super().dispatch(request, *args, **kwargs)
+            except DatabaseError as e:
+                marcar_replica_caida(e)
+        return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            leyendo_de_replica_activo() and request.user.is_authenticated
+            and escribio_recientemente(request.user.pk)
+        ):
+            usar_primario()
+
+
+class ArticuloViewSet(LecturaReplicaMixin, ListadoRapidoMixin, CamposDispersosViewMixin, viewsets.ModelViewSet):
     
     
     
@@ -51,6 +209,8 @@ class ArticuloViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['nombre', 'numero_serie', 'codigo_minvu', 'codigo_interno', 'mac']
+    # Las acciones de plantilla e importación lo fijan (ver gestion/limites.py)
+    throttle_scope = None
     ordering_fields = ['nombre', 'stock_minimo', 'stock_actual']
     ordering = ['nombre']
 
@@ -62,6 +222,7 @@ class ArticuloViewSet(viewsets.ModelViewSet):
         logger.info(f"Artículo creado: {serializer.instance.nombre}")
 
     @action(detail=True, methods=['put', 'patch'], url_path='actualizar-stock')
+    @idempotente
     def actualizar_stock(self, request, pk=None):
         """
         Actualiza el stock de un artículo existente.
@@ -82,21 +243,22 @@ class ArticuloViewSet(viewsets.ModelViewSet):
             return Response({"error": "El stock actual debe ser un número válido y no negativo."}, status=400)
 
         with transaction.atomic():
+            articulo = Articulo.objects.select_for_update().get(pk=articulo.pk)
             stock_anterior = articulo.stock_actual
-            articulo.stock_actual = stock_actual
-            articulo.save()
+            diferencia = stock_actual - stock_anterior
 
-            HistorialStock.objects.create(
-                articulo=articulo,
-                tipo_movimiento='Actualización de Stock',
-                cantidad=stock_actual,
-                stock_anterior=stock_anterior,
-                stock_actual=stock_actual,
-                usuario=request.user,
-                comentario=f"Actualización de stock de {stock_anterior} a {stock_actual}.",
-                motivo=None,
-                ubicacion=articulo.ubicacion
-            )
+            # La diferencia se registra como movimiento para que el stock siga cuadrando con
+            # el registro de movimientos; Movimiento.save ajusta el stock y escribe el historial.
+            if diferencia:
+                Movimiento.objects.create(
+                    articulo=articulo,
+                    tipo_movimiento='Entrada' if diferencia > 0 else 'Salida',
+                    cantidad=abs(diferencia),
+                    usuario=request.user,
+                    comentario=f"Actualización de stock de {stock_anterior} a {stock_actual}.",
+                    motivo=None,
+                    ubicacion=articulo.ubicacion
+                )
 
             articulo_serializer = self.get_serializer(articulo)
             logger.info(f"Stock actualizado para artículo {articulo.nombre}: {stock_anterior} -> {stock_actual}")
@@ -106,461 +268,122 @@ class ArticuloViewSet(viewsets.ModelViewSet):
                 "articulo": articulo_serializer.data
             }, status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=['get'], url_path='plantilla')
+    @action(detail=False, methods=['get'], url_path='plantilla', throttle_scope='exportacion')
     def descargar_plantilla(self, request):
         """
         Descarga una plantilla de Excel para importar artículos con formatos específicos.
+        La plantilla incluye listas desplegables con los catálogos actuales y se sirve desde
+        memoria con ETag; solo se reconstruye cuando cambian los catálogos.
         """
-        headers = [
-            'nombre',
-            'stock_actual',
-            'stock_minimo',
-            'categoria',
-            'ubicacion',
-            'marca',
-            'modelo',
-            'estado',
-            'numero_serie',
-            'mac',
-            'codigo_interno',
-            'codigo_minvu',
-            'descripcion'
-        ]
+        contenido, version = obtener_plantilla()
+        etag = f'"{version}"'
 
-        # Crear un nuevo libro de trabajo y una hoja activa
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Plantilla_Articulos"
-
-        # Definir estilos
-        bold_font = Font(bold=True)
-        center_alignment = Alignment(horizontal='center', vertical='center')
-        thin_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-
-        # Escribir encabezados con estilos
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.font = bold_font
-            cell.alignment = center_alignment
-            cell.border = thin_border
-
-        # Ajustar ancho de columnas
-        column_widths = [20, 15, 15, 15, 15, 15, 15, 15, 20, 17, 15, 15, 25]
-        for i, width in enumerate(column_widths, 1):
-            col_letter = get_column_letter(i)
-            ws.column_dimensions[col_letter].width = width
-
-        # Agregar una fila de ejemplo
-        ws.append([
-            'Ejemplo Artículo',
-            10,  # stock_actual
-            5,   # stock_minimo
-            'Tecnología',
-            'Bodega 1',
-            'Marca Ejemplo',
-            'Modelo Ejemplo',
-            'Bueno',
-            'SN123456',
-            '00:1A:2B:3C:4D:5E',
-            'CI78910',
-            'CM11213',
-            'Descripción del artículo.'
-        ])
-
-        # Aplicar estilos a la fila de ejemplo
-        for cell in ws[2]:
-            cell.alignment = Alignment(horizontal='left', vertical='center')
-            cell.border = thin_border
-
-        # Guardar el libro en un buffer
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
 
         # Crear la respuesta HTTP
         response = HttpResponse(
-            buffer,
+            contenido,
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
         response['Content-Disposition'] = 'attachment; filename=plantilla_articulos.xlsx'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
         logger.info("Plantilla de importación descargada correctamente.")
         return response
 
-    @action(detail=False, methods=['post'], url_path='importar')
+    @action(detail=False, methods=['post'], url_path='importar', throttle_scope='importacion')
+    @idempotente(atomica=False)
     def importar_articulos(self, request):
         """
-        Importa artículos desde un archivo Excel (.xlsx).
+        Importa artículos desde un archivo Excel (.xlsx), CSV (.csv, UTF-8) o Parquet (.parquet).
         - Campos requeridos: nombre, stock_actual, stock_minimo, categoria, ubicacion
         - Campos opcionales: marca, modelo, estado, numero_serie, mac, codigo_interno, codigo_minvu, descripcion
         - Los campos opcionales se dejan en blanco si no hay contenido en la celda.
+        - Con dry_run=true no se escribe nada: devuelve el resumen de lo que se crearía,
+          actualizaría o rechazaría y la URL del reporte por fila.
+        Para archivos grandes usar las subidas por fragmentos de /api/cargas/.
         """
         file = request.FILES.get('file')
         continue_on_errors = request.data.get('continue_on_errors', 'true').lower() == 'true'
+        dry_run = str(request.data.get('dry_run', 'false')).lower() == 'true'
 
         if not file:
             logger.warning("No se ha proporcionado ningún archivo para importar.")
             return Response({"error": "No se ha proporcionado ningún archivo."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 1) Leer archivo con pandas
         try:
-            if file.name.endswith('.xlsx') or file.name.endswith('.xls'):
-                df = pd.read_excel(file, engine='openpyxl')
-                logger.info(f"Archivo Excel '{file.name}' leído correctamente.")
-            else:
-                logger.warning("Formato de archivo no soportado para importación.")
-                return Response({"error": "Formato no soportado. Usa archivos Excel (.xlsx o .xls)."}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            logger.error(f"Error al leer el archivo: {str(e)}")
-            return Response({"error": f"Error al leer el archivo: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 2) Validar columnas requeridas
-        required_fields = ['nombre', 'stock_actual', 'stock_minimo', 'categoria', 'ubicacion']
-        missing_columns = [col for col in required_fields if col not in df.columns]
-        if missing_columns:
-            ejemplo_estructura = {
-                "nombre": "Ejemplo Artículo",
-                "stock_actual": 10,
-                "stock_minimo": 5,
-                "categoria": "Tecnología",
-                "ubicacion": "Bodega 1"
-            }
-            logger.warning(f"Faltan columnas obligatorias en el archivo: {', '.join(missing_columns)}.")
+            validar_formato(file.name)
+            if dry_run:
+                hash_contenido = hash_archivo(file)
+                previa, desde_cache = obtener_previsualizacion(
+                    hash_contenido,
+                    lambda: previsualizar_filas(filas_desde_archivo(file, file.name))
+                )
+                return respuesta_previsualizacion(previa, hash_contenido, desde_cache)
+
+            resultado = importar_filas(filas_desde_archivo(file, file.name), request.user, continue_on_errors)
+        except ErrorImportacion as e:
+            return Response(e.datos, status=status.HTTP_400_BAD_REQUEST)
+
+        return respuesta_importacion(resultado, continue_on_errors)
+
+    @action(detail=False, methods=['get'], url_path=r'importar/reporte/(?P<hash_contenido>[0-9a-f]{64})',
+            url_name='reporte-importacion')
+    def reporte_importacion(self, request, hash_contenido=None):
+        """
+        Descarga en CSV el reporte por fila de una previsualización de importación.
+        """
+        previa = previsualizacion_en_cache(hash_contenido)
+        if previa is None:
             return Response(
-                {
-                    "error": f"Faltan columnas obligatorias: {', '.join(missing_columns)}.",
-                    "ejemplo_formato": ejemplo_estructura
-                },
-                status=status.HTTP_400_BAD_REQUEST
+                {"error": "La previsualización expiró, no existe o los datos cambiaron desde entonces. "
+                          "Vuelve a ejecutar la importación con dry_run=true."},
+                status=status.HTTP_404_NOT_FOUND
             )
+        response = HttpResponse(reporte_csv(previa), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename=reporte_importacion_{hash_contenido[:12]}.csv'
+        return response
 
-        # 3) Renombrar columnas para que coincidan con los nombres esperados en el código
-        column_mapping = {
-            'Nombre': 'nombre',
-            'nombre': 'nombre',
-            'Stock_Actual': 'stock_actual',
-            'stock_actual': 'stock_actual',
-            'Stock_Minimo': 'stock_minimo',
-            'stock_minimo': 'stock_minimo',
-            'Categoría': 'categoria',
-            'categoría': 'categoria',
-            'Ubicación': 'ubicacion',
-            'ubicación': 'ubicacion',
-            'Marca': 'marca',
-            'marca': 'marca',
-            'Modelo': 'modelo',
-            'modelo': 'modelo',
-            'Estado': 'estado',
-            'estado': 'estado',
-            'N° Serie': 'numero_serie',
-            'n° serie': 'numero_serie',
-            'MAC': 'mac',
-            'mac': 'mac',
-            'Cód. Interno': 'codigo_interno',
-            'cód. interno': 'codigo_interno',
-            'Cód. Minvu': 'codigo_minvu',
-            'cód. minvu': 'codigo_minvu',
-            'Descripción': 'descripcion',
-            'descripción': 'descripcion',
-        }
-
-        # Limpiar los nombres de las columnas para evitar espacios en blanco
-        df.columns = df.columns.str.strip()
-
-        df.rename(columns=column_mapping, inplace=True)
-
-        # Registrar las columnas después de renombrar para depuración
-        logger.debug(f"Columnas después de renombrar: {df.columns.tolist()}")
+    @action(detail=False, methods=['post'], url_path='edicion-masiva')
+    @idempotente
+    def edicion_masiva(self, request):
+        """
+        Cambia ubicación, estado, categoría o stock mínimo de muchos artículos a la vez:
+        {"ids": [...]} o {"filtro": {"categoria": id, ...}}, más
+        {"cambios": {"ubicacion": id, "stock_minimo": n, ...}, "comentario": "..."}
+        """
+        ids = request.data.get('ids')
+        filtro = request.data.get('filtro')
+        cambios = request.data.get('cambios')
+        if (ids is not None and not isinstance(ids, list)) or (filtro is not None and not isinstance(filtro, dict)):
+            return Response(
+                {"error": "'ids' debe ser una lista y 'filtro' un objeto."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(cambios, dict):
+            return Response({"error": "El campo 'cambios' es requerido."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 4) Preprocesar DataFrame para manejar valores faltantes y tipos de datos
         try:
-            # Llenar NaN con cadenas vacías para campos opcionales
-            df = df.where(pd.notnull(df), '')
-
-            # Convertir columnas numéricas
-            numeric_fields = ['stock_actual', 'stock_minimo']
-            for field in numeric_fields:
-                if field in df.columns:
-                    df[field] = pd.to_numeric(df[field], errors='coerce').fillna(0).astype(int)
-
-            # Convertir columnas que deberían ser cadenas a string y limpiar espacios
-            string_fields = [
-                'nombre', 'categoria', 'ubicacion', 'estado', 'modelo', 'marca',
-                'numero_serie', 'codigo_minvu', 'codigo_interno', 'mac', 'descripcion'
-            ]
-            for field in string_fields:
-                if field in df.columns:
-                    df[field] = df[field].astype(str).str.strip()
-                    # Convertir cadenas vacías a None para campos únicos
-                    if field in ['numero_serie', 'mac', 'codigo_interno', 'codigo_minvu']:
-                        df[field] = df[field].replace({'': None})
-
-            logger.info("DataFrame preprocesado correctamente.")
-            logger.debug(f"Tipos de Datos:\n{df.dtypes}")
-        except Exception as e:
-            logger.error(f"Error al preprocesar el DataFrame: {str(e)}")
-            return Response({"error": f"Error al procesar los datos: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 5) Optimizar consultas a la base de datos cargando en caché
-        categorias_cache = {c.nombre.lower(): c for c in Categoria.objects.all()}
-        ubicaciones_cache = {u.nombre.lower(): u for u in Ubicacion.objects.all()}
-        marcas_cache = {m.nombre.lower(): m for m in Marca.objects.all()}
-        modelos_cache = {m.nombre.lower(): m for m in Modelo.objects.all()}
-        estados_cache = {e.nombre.lower(): e for e in EstadoArticulo.objects.all()}
-
-        errores = []
-        creados = 0
-        actualizados = 0
-        omitidos = 0  # Contador para filas omitidas
-
-        total_filas = len(df)
-        logger.info(f"Total de filas a procesar (sin encabezado): {total_filas}")
-
-        # 6) Iterar filas individuales
-        for index, row in df.iterrows():
-            fila_num = index + 2  # Asumiendo que el encabezado está en la fila 1
-
-            logger.debug(f"Procesando fila {fila_num}: {row.to_dict()}")
-
-            # Verificar que existan los 5 campos requeridos
-            nombre_val = row.get('nombre')
-            stock_actual_val = row.get('stock_actual')
-            stock_minimo_val = row.get('stock_minimo')
-            categoria_val = row.get('categoria')
-            ubicacion_val = row.get('ubicacion')
-
-            if not nombre_val or stock_actual_val is None or stock_minimo_val is None or not categoria_val or not ubicacion_val:
-                omitidos += 1
-                logger.warning(f"Fila {fila_num}: Faltan campos requeridos. Se omitirá esta fila.")
-                if continue_on_errors:
-                    errores.append(f"Fila {fila_num}: Faltan uno o más campos requeridos (nombre, stock_actual, stock_minimo, categoria, ubicacion).")
-                    continue
-                else:
-                    errores.append(f"Fila {fila_num}: Faltan uno o más campos requeridos (nombre, stock_actual, stock_minimo, categoria, ubicacion).")
-                    break  # Detener si no se debe continuar
-
-            try:
-                nombre_str = str(nombre_val).strip()
-                stock_actual_int = int(stock_actual_val)
-                stock_minimo_int = int(stock_minimo_val)
-                if stock_actual_int < 0:
-                    raise ValueError("El stock actual no puede ser negativo.")
-                if stock_minimo_int < 0:
-                    raise ValueError("El stock mínimo no puede ser negativo.")
-            except Exception as e:
-                errores.append(f"Fila {fila_num}: Error al convertir datos requeridos - {str(e)}.")
-                logger.error(f"Fila {fila_num}: Error al convertir datos requeridos - {str(e)}.")
-                if not continue_on_errors:
-                    break
-                else:
-                    omitidos += 1
-                    continue
-
-            # 7) Obtener o crear objetos de FK por nombre usando caché
-            try:
-                # Categoria
-                categoria_nombre = str(categoria_val).strip().lower()
-                categoria_obj = categorias_cache.get(categoria_nombre)
-                if not categoria_obj:
-                    categoria_obj, created = Categoria.objects.get_or_create(
-                        nombre__iexact=categoria_val,
-                        defaults={'nombre': categoria_val}
-                    )
-                    if created:
-                        categorias_cache[categoria_nombre] = categoria_obj
-                        logger.info(f"Categoría creada: {categoria_obj.nombre} (ID: {categoria_obj.id})")
-
-                # Ubicacion
-                ubicacion_nombre = str(ubicacion_val).strip().lower()
-                ubicacion_obj = ubicaciones_cache.get(ubicacion_nombre)
-                if not ubicacion_obj:
-                    ubicacion_obj, created = Ubicacion.objects.get_or_create(
-                        nombre__iexact=ubicacion_val,
-                        defaults={'nombre': ubicacion_val}
-                    )
-                    if created:
-                        ubicaciones_cache[ubicacion_nombre] = ubicacion_obj
-                        logger.info(f"Ubicación creada: {ubicacion_obj.nombre} (ID: {ubicacion_obj.id})")
-
-                # Marca (opcional)
-                marca_val = row.get('marca')
-                marca_obj = None
-                if marca_val:
-                    marca_nombre = str(marca_val).strip().lower()
-                    if marca_nombre:
-                        marca_obj = marcas_cache.get(marca_nombre)
-                        if not marca_obj:
-                            marca_obj, created = Marca.objects.get_or_create(
-                                nombre__iexact=marca_nombre,
-                                defaults={'nombre': marca_val}
-                            )
-                            if created:
-                                marcas_cache[marca_nombre] = marca_obj
-                                logger.info(f"Marca creada: {marca_obj.nombre} (ID: {marca_obj.id})")
-
-                # Modelo (opcional)
-                modelo_val = row.get('modelo')
-                modelo_obj = None
-                if modelo_val:
-                    modelo_nombre = str(modelo_val).strip().lower()
-                    if modelo_nombre:
-                        modelo_obj = modelos_cache.get(modelo_nombre)
-                        if not modelo_obj:
-                            modelo_obj, created = Modelo.objects.get_or_create(
-                                nombre__iexact=modelo_nombre,
-                                defaults={'nombre': modelo_val}
-                            )
-                            if created:
-                                modelos_cache[modelo_nombre] = modelo_obj
-                                logger.info(f"Modelo creado: {modelo_obj.nombre} (ID: {modelo_obj.id})")
-
-                # Estado (opcional)
-                estado_val = row.get('estado')
-                estado_obj = None
-                if estado_val:
-                    estado_nombre = str(estado_val).strip().lower()
-                    if estado_nombre:
-                        estado_obj = estados_cache.get(estado_nombre)
-                        if not estado_obj:
-                            estado_obj, created = EstadoArticulo.objects.get_or_create(
-                                nombre__iexact=estado_nombre,
-                                defaults={'nombre': estado_val}
-                            )
-                            if created:
-                                estados_cache[estado_nombre] = estado_obj
-                                logger.info(f"Estado creado: {estado_obj.nombre} (ID: {estado_obj.id})")
-            except Exception as e:
-                errores.append(f"Fila {fila_num}: Error al obtener o crear objetos de FK - {str(e)}.")
-                logger.error(f"Fila {fila_num}: Error al obtener o crear objetos de FK - {str(e)}.")
-                if not continue_on_errors:
-                    break
-                else:
-                    omitidos += 1
-                    continue
-
-            # Campos opcionales
-            numero_serie = row.get('numero_serie')
-            mac = row.get('mac')
-            codigo_interno = row.get('codigo_interno')
-            codigo_minvu = row.get('codigo_minvu')
-            descripcion = row.get('descripcion')
-
-            # Convertir campos únicos a None si están vacíos
-            numero_serie = numero_serie.strip() if isinstance(numero_serie, str) and numero_serie.strip() else None
-            mac = mac.strip() if isinstance(mac, str) and mac.strip() else None
-            codigo_interno = codigo_interno.strip() if isinstance(codigo_interno, str) and codigo_interno.strip() else None
-            codigo_minvu = codigo_minvu.strip() if isinstance(codigo_minvu, str) and codigo_minvu.strip() else None
-            descripcion = descripcion.strip() if isinstance(descripcion, str) and descripcion.strip() else None
-
-            # 8) Verificar duplicados en campos únicos: numero_serie, mac, codigo_interno, codigo_minvu
-            unique_fields = {
-                'numero_serie': numero_serie,
-                'mac': mac,
-                'codigo_interno': codigo_interno,
-                'codigo_minvu': codigo_minvu,
-            }
-
-            existing_articulos = Articulo.objects.none()
-            for field_name, field_value in unique_fields.items():
-                if field_value:
-                    existing_articulos |= Articulo.objects.filter(**{field_name: field_value})
-
-            if existing_articulos.exists():
-                # **Actualizar** el artículo existente
-                articulo_existente = existing_articulos.first()
-                articulo_existente.stock_actual = stock_actual_int
-                articulo_existente.stock_minimo = stock_minimo_int
-                articulo_existente.nombre = nombre_str  # Opcional: actualizar el nombre
-                articulo_existente.categoria = categoria_obj
-                articulo_existente.ubicacion = ubicacion_obj
-                articulo_existente.marca = marca_obj
-                articulo_existente.modelo = modelo_obj
-                articulo_existente.estado = estado_obj
-                articulo_existente.numero_serie = numero_serie if numero_serie else articulo_existente.numero_serie
-                articulo_existente.mac = mac if mac else articulo_existente.mac
-                articulo_existente.codigo_interno = codigo_interno if codigo_interno else articulo_existente.codigo_interno
-                articulo_existente.codigo_minvu = codigo_minvu if codigo_minvu else articulo_existente.codigo_minvu
-                articulo_existente.descripcion = descripcion if descripcion else articulo_existente.descripcion
-
-                try:
-                    articulo_existente.save()
-                    actualizados += 1
-                    logger.info(f"Fila {fila_num}: Artículo '{nombre_str}' actualizado con stock actual {stock_actual_int} y stock mínimo {stock_minimo_int}.")
-                except Exception as e:
-                    errores.append(f"Fila {fila_num}: Error al actualizar el artículo - {str(e)}.")
-                    logger.error(f"Fila {fila_num}: Error al actualizar el artículo - {str(e)}.")
-                    if not continue_on_errors:
-                        break
-                    else:
-                        omitidos += 1
-                        continue
-            else:
-                # Crear nuevo artículo
-                try:
-                    Articulo.objects.create(
-                        nombre=nombre_str,
-                        categoria=categoria_obj,
-                        marca=marca_obj,
-                        modelo=modelo_obj,
-                        ubicacion=ubicacion_obj,
-                        estado=estado_obj,
-                        numero_serie=numero_serie,
-                        mac=mac,
-                        codigo_interno=codigo_interno,
-                        codigo_minvu=codigo_minvu,
-                        descripcion=descripcion,
-                        stock_minimo=stock_minimo_int,
-                        stock_actual=stock_actual_int
-                    )
-                    creados += 1
-                    logger.info(f"Fila {fila_num}: Artículo '{nombre_str}' creado con stock actual {stock_actual_int} y stock mínimo {stock_minimo_int}.")
-                except IntegrityError as ie:
-                    errores.append(f"Fila {fila_num}: Error de integridad al crear el artículo - {str(ie)}.")
-                    logger.error(f"Fila {fila_num}: Error de integridad al crear el artículo - {str(ie)}.")
-                    if not continue_on_errors:
-                        break
-                    else:
-                        omitidos += 1
-                        continue
-                except Exception as e:
-                    errores.append(f"Fila {fila_num}: Error al crear el artículo - {str(e)}.")
-                    logger.error(f"Fila {fila_num}: Error al crear el artículo - {str(e)}.")
-                    if not continue_on_errors:
-                        break
-                    else:
-                        omitidos += 1
-                        continue
-
-        # 10) Preparar la respuesta
-        response_data = {
-            "creados": creados,
-            "actualizados": actualizados,
-            "omitidos": omitidos
-        }
+            actualizados = editar_articulos(
+                seleccionar_articulos(ids=ids, filtro=filtro), cambios, request.user,
+                comentario=request.data.get('comentario') or None,
+            )
+        except ErrorEdicionMasiva as e:
+            logger.warning(f"Edición masiva rechazada: {e}")
+            respuesta = {"error": str(e)}
+            if e.articulos:
+                respuesta["articulos"] = e.articulos
+            return Response(respuesta, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({"error": "Los ids y filtros deben ser valores válidos."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if errores:
-            response_data["errores"] = errores
-            logger.warning(f"Importación completada con errores. Creados: {creados}, Actualizados: {actualizados}, Omitidos: {omitidos}, Errores: {len(errores)}.")
-            if not continue_on_errors:
-                return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                # Informar al usuario que hubo errores pero la importación continuó
-                return Response(response_data, status=status.HTTP_200_OK)
-
-        logger.info(f"Importación realizada con éxito. Creados: {creados}, Actualizados: {actualizados}, Omitidos: {omitidos}.")
-        return Response(
-            {
-                "creados": creados,
-                "actualizados": actualizados,
-                "omitidos": omitidos,
-                "mensaje": "Importación realizada con éxito."
-            },
-            status=status.HTTP_200_OK
-        )
+        return Response({
+            "message": "Artículos actualizados correctamente.",
+            "actualizados": actualizados
+        }, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['put', 'patch'], url_path='actualizar-stock-minimo')
     def actualizar_stock_minimo(self, request, pk=None):
@@ -609,8 +432,236 @@ class ArticuloViewSet(viewsets.ModelViewSet):
 
 
 
+class SesionConteoViewSet(viewsets.GenericViewSet):
+    """
+    Tomas de inventario físico:
+    1. POST /conteos/ con nombre (y opcionalmente ubicacion/categoria) abre la sesión y
+       guarda el stock de cada artículo incluido.
+    2. POST /conteos/<id>/lecturas/ con {"lecturas": [{"codigo" o "articulo", "cantidad"}],
+       "modo": "sumar"|"reemplazar"}, en tantos envíos como se quiera.
+    3. GET /conteos/<id>/diferencias/ muestra conteo contra stock inicial.
+    4. POST /conteos/<id>/confirmar/ registra los ajustes; /cancelar/ la descarta.
+    """
+    serializer_class = SesionConteoSerializer
+    permission_classes = [IsAuthenticated]
+    LIMITE_DIFERENCIAS = 500
+
+    def get_queryset(self):
+        return SesionConteo.objects.annotate(
+            total_lineas=Count('lineas'),
+            lineas_contadas=Count('lineas', filter=Q(lineas__cantidad_contada__isnull=False)),
+        ).order_by('-fecha_inicio')
+
+    def list(self, request):
+        return Response(self.get_serializer(self.get_queryset(), many=True).data)
+
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sesion = abrir_sesion(
+            serializer.validated_data['nombre'], request.user,
+            ubicacion=serializer.validated_data.get('ubicacion'),
+            categoria=serializer.validated_data.get('categoria'),
+        )
+        return Response(self.get_serializer(self.get_queryset().get(pk=sesion.pk)).data, status=status.HTTP_201_CREATED)
+
+    def _error(self, e):
+        respuesta = {"error": str(e)}
+        if e.detalle:
+            respuesta["articulos"] = e.detalle
+        return Response(respuesta, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['post'], url_path='lecturas')
+    @idempotente
+    def lecturas(self, request, pk=None):
+        sesion = self.get_object()
+        lecturas = request.data.get('lecturas')
+        if not isinstance(lecturas, list):
+            return Response({"error": "El campo 'lecturas' debe ser una lista."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            resultado = registrar_conteos(sesion.id, lecturas, modo=request.data.get('modo', 'sumar'))
+        except ErrorConteo as e:
+            return self._error(e)
+        return Response(resultado, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='diferencias')
+    def ver_diferencias(self, request, pk=None):
+        sesion = self.get_object()
+        lineas = diferencias(sesion, no_contados_en_cero=request.query_params.get('no_contados_en_cero') == '1')
+        try:
+            limite = int(request.query_params.get('limite', self.LIMITE_DIFERENCIAS))
+        except ValueError:
+            return Response({"error": "El límite debe ser un número entero."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "total": lineas.count(),
+            "no_contadas": sesion.lineas.filter(cantidad_contada__isnull=True).count(),
+            "diferencias": LineaConteoSerializer(lineas.select_related('articulo')[:max(limite, 0)], many=True).data,
+        })
+
+    @action(detail=True, methods=['post'], url_path='confirmar')
+    def confirmar(self, request, pk=None):
+        sesion = self.get_object()
+        try:
+            sesion = confirmar_sesion(
+                sesion.id, request.user,
+                no_contados_en_cero=request.data.get('no_contados_en_cero') in (True, 'true', '1', 1),
+            )
+        except ErrorConteo as e:
+            logger.warning(f"No se pudo confirmar la sesión de conteo {sesion.id}: {e}")
+            return self._error(e)
+        return Response(self.get_serializer(self.get_queryset().get(pk=sesion.pk)).data)
+
+    @action(detail=True, methods=['post'], url_path='cancelar')
+    def cancelar(self, request, pk=None):
+        sesion = self.get_object()
+        try:
+            sesion = cancelar_sesion(sesion.id)
+        except ErrorConteo as e:
+            return self._error(e)
+        return Response(self.get_serializer(self.get_queryset().get(pk=sesion.pk)).data)
+
+
+class CargaArchivoViewSet(viewsets.GenericViewSet):
+    """
+    Subidas por fragmentos (reanudables) de archivos de importación:
+    1. POST /cargas/ con nombre_archivo y tamano_total inicia la carga.
+    2. PUT /cargas/<id>/fragmento/ con el cuerpo binario y Content-Range: bytes inicio-fin/total.
+    3. GET /cargas/<id>/ devuelve bytes_recibidos para reanudar tras un corte.
+    4. POST /cargas/<id>/importar/ importa el archivo (acepta dry_run y continue_on_errors).
+    Las cargas no importadas se borran con el comando purgar_cargas (CARGA_VIGENCIA_HORAS).
+    """
+    serializer_class = CargaArchivoSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_scope = None
+
+    def get_queryset(self):
+        return CargaArchivo.objects.filter(usuario=self.request.user)
+
+    def _respuesta_carga(self, carga, status_code=status.HTTP_200_OK):
+        response = Response(self.get_serializer(carga).data, status=status_code)
+        response['Upload-Offset'] = str(carga.bytes_recibidos)
+        return response
+
+    def create(self, request, *args, **kwargs):
+        nombre_archivo = request.data.get('nombre_archivo')
+        tamano_total = request.data.get('tamano_total')
+
+        if not nombre_archivo or tamano_total is None:
+            return Response({"error": "Los campos 'nombre_archivo' y 'tamano_total' son requeridos."}, status=400)
+        try:
+            tamano_total = int(tamano_total)
+        except (TypeError, ValueError):
+            return Response({"error": "El campo 'tamano_total' debe ser un número entero."}, status=400)
+
+        try:
+            validar_formato(nombre_archivo)
+            carga = crear_carga(request.user, nombre_archivo, tamano_total)
+        except ErrorImportacion as e:
+            return Response(e.datos, status=status.HTTP_400_BAD_REQUEST)
+        except ErrorCarga as e:
+            return Response(e.datos, status=e.codigo)
+
+        response = self._respuesta_carga(carga, status.HTTP_201_CREATED)
+        response['Location'] = reverse('cargas-detail', kwargs={'pk': carga.id})
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._respuesta_carga(self.get_object())
+
+    def destroy(self, request, *args, **kwargs):
+        carga = self.get_object()
+        eliminar_archivo_carga(carga)
+        carga.delete()
+        logger.info(f"Carga eliminada: {carga.nombre_archivo}")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put', 'patch'], url_path='fragmento')
+    def fragmento(self, request, pk=None):
+        """
+        Recibe un fragmento binario y lo escribe en disco por bloques, sin cargarlo en memoria.
+        """
+        carga = self.get_object()
+        longitud = int(request.META.get('CONTENT_LENGTH') or 0)
+        if longitud <= 0:
+            return Response({"error": "El fragmento está vacío."}, status=400)
+
+        try:
+            content_range = request.headers.get('Content-Range')
+            if content_range:
+                inicio, fin, total = parsear_content_range(content_range)
+                if fin - inicio + 1 != longitud:
+                    raise ErrorCarga("Content-Range no coincide con el tamaño del cuerpo.")
+            else:
+                inicio, total = int(request.headers.get('Upload-Offset', carga.bytes_recibidos)), None
+            carga, completo = recibir_fragmento(carga.id, request.user, request.stream, inicio, longitud, total)
+        except ErrorCarga as e:
+            return Response(e.datos, status=e.codigo)
+        except ValueError:
+            return Response({"error": "La cabecera Upload-Offset debe ser un número entero."}, status=400)
+
+        if not completo:
+            response = self._respuesta_carga(carga, status.HTTP_409_CONFLICT)
+            response.data['error'] = "El fragmento llegó incompleto; reanuda desde bytes_recibidos."
+            return response
+        return self._respuesta_carga(carga)
+
+    @action(detail=True, methods=['post'], url_path='importar', throttle_scope='importacion')
+    @idempotente(atomica=False)
+    def importar(self, request, pk=None):
+        """
+        Importa el archivo de una carga completada leyéndolo en streaming desde disco.
+        """
+        carga = self.get_object()
+        continue_on_errors = str(request.data.get('continue_on_errors', 'true')).lower() == 'true'
+        dry_run = str(request.data.get('dry_run', 'false')).lower() == 'true'
+
+        if carga.estado == 'En Progreso':
+            return Response(
+                {"error": "La carga aún no está completa.", "bytes_recibidos": carga.bytes_recibidos},
+                status=status.HTTP_409_CONFLICT
+            )
+        ruta = ruta_carga(carga)
+
+        if dry_run:
+            if carga.estado != 'Completada':
+                return Response({"error": "La carga ya fue importada."}, status=status.HTTP_409_CONFLICT)
+            hash_contenido = hash_carga(carga)
+            try:
+                previa, desde_cache = obtener_previsualizacion(
+                    hash_contenido,
+                    lambda: previsualizar_filas(filas_desde_archivo(ruta, carga.nombre_archivo))
+                )
+            except ErrorImportacion as e:
+                return Response(e.datos, status=status.HTTP_400_BAD_REQUEST)
+            return respuesta_previsualizacion(previa, hash_contenido, desde_cache)
+
+        # Transición atómica para que dos peticiones no importen el mismo archivo
+        if not CargaArchivo.objects.filter(pk=carga.pk, estado='Completada').update(estado='Importando'):
+            return Response({"error": "La carga ya fue importada o se está importando."}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            resultado = importar_filas(filas_desde_archivo(ruta, carga.nombre_archivo), request.user, continue_on_errors)
+        except ErrorImportacion as e:
+            CargaArchivo.objects.filter(pk=carga.pk).update(estado='Completada')
+            return Response(e.datos, status=status.HTTP_400_BAD_REQUEST)
+        except Exception:
+            CargaArchivo.objects.filter(pk=carga.pk).update(estado='Completada')
+            raise
+
+        carga.estado = 'Importada'
+        carga.resultado = resultado
+        carga.save(update_fields=['estado', 'resultado', 'fecha_actualizacion'])
+        eliminar_archivo_carga(carga)
+        return respuesta_importacion(resultado, continue_on_errors)
+
+
 class MovimientoViewSet(viewsets.ModelViewSet):
-    queryset = Movimiento.objects.all()
+    queryset = Movimiento.objects.annotate(
+        anulado=Exists(Movimiento.objects.filter(movimiento_revertido=OuterRef('pk')))
+    )
     serializer_class = MovimientoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -618,6 +669,7 @@ class MovimientoViewSet(viewsets.ModelViewSet):
     ordering_fields = ['fecha', 'tipo_movimiento', 'cantidad']
     ordering = ['-fecha']
 
+    @idempotente
     def create(self, request, *args, **kwargs):
         logger.debug(f"Datos recibidos para Movimiento: {request.data}")
         serializer = self.get_serializer(data=request.data)
@@ -627,8 +679,9 @@ class MovimientoViewSet(viewsets.ModelViewSet):
                 movimiento = serializer.save()
                 logger.info(f"Movimiento creado: {movimiento.tipo_movimiento} para artículo {movimiento.articulo.nombre}")
         except ValidationError as e:
-            logger.error(f"Error de Validación al crear movimiento: {e.message_dict}")
-            return Response({"error": e.message_dict}, status=status.HTTP_400_BAD_REQUEST)
+            # ValidationError de DRF: la levanta save() del serializador (devoluciones, transferencias)
+            logger.error(f"Error de Validación al crear movimiento: {e.detail}")
+            return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Error General al crear movimiento: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -637,66 +690,97 @@ class MovimientoViewSet(viewsets.ModelViewSet):
         return Response(MovimientoSerializer(movimiento).data, status=status.HTTP_201_CREATED, headers=headers)
 
     @action(detail=True, methods=['post'], url_path='anular')
+    @idempotente
     def anular_movimiento(self, request, pk=None):
         """
-        Anula un movimiento específico, ajustando el stock y eliminando el historial correspondiente.
+        Anula un movimiento registrando un movimiento 'Anulacion' que compensa su efecto.
+        El movimiento original se conserva en el historial.
         """
         movimiento = self.get_object()
+        try:
+            anulacion, = revertir_movimientos([movimiento.id], request.user, request.data.get('comentario'))
+        except ErrorReversion as e:
+            logger.warning(f"No se pudo anular el movimiento {movimiento.id}: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if movimiento.tipo_movimiento not in ['Prestamo', 'Regresado']:
-            logger.warning(f"Intento de anular movimiento de tipo inválido: {movimiento.tipo_movimiento}")
-            return Response({"error": "Solo se pueden anular movimientos de tipo Prestamo o Regresado."}, status=400)
+        logger.info(f"Movimiento anulado: {movimiento.id}")
+        return Response({
+            "message": "Movimiento anulado correctamente.",
+            "anulacion": MovimientoSerializer(anulacion).data,
+        }, status=status.HTTP_200_OK)
 
-        with transaction.atomic():
-            articulo = movimiento.articulo
+    @action(detail=False, methods=['post'], url_path='anular-lote')
+    @idempotente
+    def anular_lote(self, request):
+        """
+        Anula varios movimientos en una sola transacción: {"ids": [...], "comentario": "..."}.
+        Si alguno no se puede anular, no se anula ninguno.
+        """
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return Response({"error": "El campo 'ids' debe ser una lista de IDs de movimientos."}, status=400)
 
-            if movimiento.tipo_movimiento == 'Prestamo':
-                articulo.stock_actual += movimiento.cantidad
-                articulo.stock_prestado -= movimiento.cantidad
-                if articulo.stock_prestado <= 0:
-                    articulo.prestado = False
-                articulo.save()
+        try:
+            anulaciones = revertir_movimientos(ids, request.user, request.data.get('comentario'))
+        except ErrorReversion as e:
+            logger.warning(f"No se pudo anular el lote de movimientos: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-                # Anular HistorialPrestamo
-                historial_prestamo = HistorialPrestamo.objects.filter(
-                    articulo=articulo,
-                    personal=movimiento.personal,
-                    cantidad_restante__gte=movimiento.cantidad
-                ).order_by('fecha_prestamo').first()
-
-                if historial_prestamo:
-                    historial_prestamo.cantidad_restante -= movimiento.cantidad
-                    if historial_prestamo.cantidad_restante < 0:
-                        historial_prestamo.cantidad_restante = 0
-                    historial_prestamo.save()
-                    logger.info(f"Historial de préstamo actualizado para artículo {articulo.nombre}.")
-                else:
-                    logger.error("No se encontró un historial de préstamo correspondiente.")
-                    return Response({"error": "No se encontró un historial de préstamo correspondiente."}, status=400)
-
-            elif movimiento.tipo_movimiento == 'Regresado':
-                articulo.stock_actual -= movimiento.cantidad
-                articulo.stock_prestado += movimiento.cantidad
-                if articulo.stock_prestado > 0:
-                    articulo.prestado = True
-                articulo.save()
-
-                # Anular movimiento relacionado
-                if hasattr(movimiento, 'prestamo_relacionado') and movimiento.prestamo_relacionado:
-                    historial_prestamo = movimiento.prestamo_relacionado
-                    if isinstance(historial_prestamo, HistorialPrestamo):
-                        historial_prestamo.cantidad_restante += movimiento.cantidad
-                        historial_prestamo.save()
-                        logger.info(f"Historial de préstamo relacionado actualizado para artículo {articulo.nombre}.")
-
-            # Eliminar el movimiento
-            movimiento.delete()
-            logger.info(f"Movimiento anulado y eliminado: {movimiento.id}")
-
-            return Response({"message": "Movimiento anulado correctamente."}, status=status.HTTP_200_OK)
-
-
-class CategoriaViewSet(viewsets.ModelViewSet):
+        return Response({
+            "message": f"{len(anulaciones)} movimientos anulados correctamente.",
+            "anulaciones": MovimientoSerializer(anulaciones, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+
+    @action(detail=False, methods=['post'], url_path='cambio-estado-lote')
+    @idempotente
+    def cambio_estado_lote(self, request):
+        """
+        Transfiere unidades de varios artículos a un nuevo estado en una sola transacción:
+        {"estado_nuevo": id, "items": [{"articulo": id, "cantidad": n}, ...],
+         "comentario": "...", "motivo": id}
+        """
+        estado_nuevo = get_object_or_404(EstadoArticulo, id=request.data.get('estado_nuevo'))
+        motivo_id = request.data.get('motivo')
+        motivo = get_object_or_404(Motivo, id=motivo_id) if motivo_id else None
+
+        items = request.data.get('items')
+        try:
+            items = [(int(item['articulo']), int(item['cantidad'])) for item in items]
+        except (TypeError, KeyError, ValueError):
+            return Response(
+                {"error": "El campo 'items' debe ser una lista de objetos con 'articulo' y 'cantidad'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            movimientos = transferir_estado(
+                items, estado_nuevo, request.user,
+                comentario=request.data.get('comentario') or None, motivo=motivo
+            )
+        except ErrorTransferencia as e:
+            logger.warning(f"No se pudo realizar la transferencia de estado por lote: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(MovimientoSerializer(movimientos, many=True).data, status=status.HTTP_201_CREATED)
+
+class TotalesCatalogoViewMixin:
+    """
+    ?con_totales=1 agrega a cada registro cuántos artículos y unidades tiene, calculados
+    con una consulta agrupada por catálogo que queda en caché hasta la próxima escritura
+    de artículos. `campo_totales` es la clave foránea de Articulo hacia el catálogo.
+    """
+    campo_totales = None
+
+    def get_serializer_context(self):
+        contexto = super().get_serializer_context()
+        if self.request is not None and self.request.query_params.get('con_totales') == '1':
+            contexto['totales'] = totales_por_catalogo(self.campo_totales)
+        return contexto
+
+
+class CategoriaViewSet(TotalesCatalogoViewMixin, viewsets.ModelViewSet):
+    campo_totales = 'categoria'
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     filter_backends = [filters.SearchFilter]
@@ -708,7 +792,8 @@ class CategoriaViewSet(viewsets.ModelViewSet):
         logger.info(f"Categoría creada: {serializer.instance.nombre}")
 
 
-class UbicacionViewSet(viewsets.ModelViewSet):
+class UbicacionViewSet(TotalesCatalogoViewMixin, viewsets.ModelViewSet):
+    campo_totales = 'ubicacion'
     queryset = Ubicacion.objects.all()
     serializer_class = UbicacionSerializer
     filter_backends = [filters.SearchFilter]
@@ -720,7 +805,8 @@ class UbicacionViewSet(viewsets.ModelViewSet):
         logger.info(f"Ubicación creada: {serializer.instance.nombre}")
 
 
-class MarcaViewSet(viewsets.ModelViewSet):
+class MarcaViewSet(TotalesCatalogoViewMixin, viewsets.ModelViewSet):
+    campo_totales = 'marca'
     queryset = Marca.objects.all()
     serializer_class = MarcaSerializer
     filter_backends = [filters.SearchFilter]
@@ -732,7 +818,8 @@ class MarcaViewSet(viewsets.ModelViewSet):
         logger.info(f"Marca creada: {serializer.instance.nombre}")
 
 
-class ModeloViewSet(viewsets.ModelViewSet):
+class ModeloViewSet(TotalesCatalogoViewMixin, viewsets.ModelViewSet):
+    campo_totales = 'modelo'
     queryset = Modelo.objects.select_related('marca').all()
     serializer_class = ModeloSerializer
     filter_backends = [filters.SearchFilter]
@@ -762,13 +849,49 @@ class PersonalViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ['id', 'nombre', 'correo_institucional', 'seccion']
     permission_classes = [IsAuthenticated]
+    throttle_scope = None
 
     def perform_create(self, serializer):
         serializer.save()
         logger.info(f"Personal creado: {serializer.instance.nombre}")
 
+    @action(detail=False, methods=['post'], url_path='sincronizar', throttle_scope='importacion')
+    @idempotente
+    def sincronizar(self, request):
+        """
+        Sincroniza el personal con un archivo completo (.xlsx, .csv o .parquet) con las
+        columnas nombre, correo_institucional y opcionalmente seccion.
+        - dry_run=true: solo informa qué se crearía, actualizaría y quedaría ausente.
+        - continue_on_errors=false: si alguna fila tiene errores no se escribe nada.
+        - eliminar_ausentes=true: borra a los ausentes que no tienen préstamos ni movimientos.
+        """
+        file = request.FILES.get('file')
+        if not file:
+            return Response({"error": "No se ha proporcionado ningún archivo."}, status=status.HTTP_400_BAD_REQUEST)
+
+        opciones = {
+            nombre: str(request.data.get(nombre, por_defecto)).lower() == 'true'
+            for nombre, por_defecto in (('dry_run', 'false'), ('continue_on_errors', 'true'), ('eliminar_ausentes', 'false'))
+        }
+        try:
+            resultado = sincronizar_personal(file, file.name, **opciones)
+        except ErrorImportacion as e:
+            return Response(e.datos, status=status.HTTP_400_BAD_REQUEST)
+
+        if resultado['errores'] and not opciones['continue_on_errors']:
+            return Response(resultado, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resultado, status=status.HTTP_200_OK)
+
 
-class HistorialStockViewSet(viewsets.ModelViewSet):
+class HistorialStockViewSet(LecturaReplicaMixin, ListadoRapidoMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Historial de stock (solo lectura: es un registro de solo inserción).
+    Filtros opcionales: ?articulo=<id>&fecha_desde=AAAA-MM-DD&fecha_hasta=AAAA-MM-DD.
+    Si el rango (abierto si falta alguna fecha) incluye meses ya archivados en backups/
+    (ver archivar_historial), sus filas se agregan a la respuesta, hasta
+    HISTORIAL_LIMITE_COMBINADO registros; la búsqueda y el orden personalizados solo
+    aplican a las filas que siguen en la base de datos.
+    """
     queryset = HistorialStock.objects.select_related('articulo', 'usuario', 'motivo', 'ubicacion').all()
     serializer_class = HistorialStockSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -777,6 +900,65 @@ class HistorialStockViewSet(viewsets.ModelViewSet):
     ordering = ['-fecha']
     permission_classes = [IsAuthenticated]
 
+    def _parametros(self):
+        parametros = {}
+        articulo = self.request.query_params.get('articulo')
+        if articulo:
+            try:
+                parametros['articulo_id'] = int(articulo)
+            except ValueError:
+                raise ValidationError({"articulo": "Debe ser un ID numérico."})
+        for nombre, clave in (('fecha_desde', 'desde'), ('fecha_hasta', 'hasta')):
+            valor = self.request.query_params.get(nombre)
+            if not valor:
+                continue
+            # parse_datetime también acepta 'AAAA-MM-DD', así que la fecha sola se prueba antes
+            try:
+                dia = parse_date(valor)
+            except ValueError:
+                dia = None
+            if dia is not None:
+                # fecha_hasta incluye el día completo
+                fecha = datetime.combine(dia + timedelta(days=1) if clave == 'hasta' else dia, datetime.min.time())
+            else:
+                fecha = parse_datetime(valor)
+                if fecha is None:
+                    raise ValidationError({nombre: "Usa el formato AAAA-MM-DD o ISO 8601."})
+            parametros[clave] = timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
+        return parametros
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        parametros = self._parametros()
+        if 'articulo_id' in parametros:
+            queryset = queryset.filter(articulo_id=parametros['articulo_id'])
+        if 'desde' in parametros:
+            queryset = queryset.filter(fecha__gte=parametros['desde'])
+        if 'hasta' in parametros:
+            queryset = queryset.filter(fecha__lt=parametros['hasta'])
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        parametros = self._parametros()
+        if not meses_archivados_en_rango(parametros.get('desde'), parametros.get('hasta')):
+            return super().list(request, *args, **kwargs)
+
+        # Las filas de la base y de los archivos se combinan en memoria: se acota cuántas
+        limite = settings.HISTORIAL_LIMITE_COMBINADO
+        registros = list(self.filter_queryset(self.get_queryset())[:limite + 1])
+        registros += [
+            HistorialStock(**fila)
+            for fila in itertools.islice(filas_archivadas(**parametros), limite + 1 - len(registros))
+        ]
+        if len(registros) > limite:
+            return Response(
+                {"error": f"El rango incluye meses archivados y supera los {limite} registros. "
+                          "Acota la consulta con fecha_desde, fecha_hasta o articulo."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        registros.sort(key=lambda h: (h.fecha, h.id), reverse=True)
+        return Response(self.get_serializer(registros, many=True).data)
+
 
 class HistorialPrestamoViewSet(viewsets.ModelViewSet):
     queryset = HistorialPrestamo.objects.all()
@@ -801,7 +983,8 @@ class HistorialPrestamoViewSet(viewsets.ModelViewSet):
             logger.info(f"Préstamo realizado: {serializer.instance.articulo.nombre}")
 
 
-class EstadoArticuloViewSet(viewsets.ModelViewSet):
+class EstadoArticuloViewSet(TotalesCatalogoViewMixin, viewsets.ModelViewSet):
+    campo_totales = 'estado'
     queryset = EstadoArticulo.objects.all()
     serializer_class = EstadoArticuloSerializer
     filter_backends = [filters.SearchFilter]
@@ -848,6 +1031,72 @@ class UsuarioDetailView(APIView):
         })
 
 
+class ConciliacionStockAPIView(APIView):
+    """
+    GET: informa los artículos cuyo stock no coincide con el registro de movimientos
+    (?ids=1,2,3 para limitar la revisión, ?limite=N para el detalle).
+    POST {"reparar": true, "ids": [...]}: además corrige las diferencias.
+    """
+    permission_classes = [IsAdminUser]
+    LIMITE_DETALLE = 500
+
+    def _ids(self, valor):
+        if valor in (None, '', []):
+            return None
+        if isinstance(valor, str):
+            valor = valor.split(',')
+        try:
+            return [int(i) for i in valor]
+        except (TypeError, ValueError):
+            raise ValidationError({"ids": "Debe ser una lista de ids de artículos."})
+
+    def _limite(self, valor):
+        try:
+            return max(int(valor), 0) if valor not in (None, '') else self.LIMITE_DETALLE
+        except (TypeError, ValueError):
+            raise ValidationError({"limite": "Debe ser un número entero."})
+
+    def get(self, request):
+        resumen = conciliar(
+            ids=self._ids(request.query_params.get('ids')),
+            limite=self._limite(request.query_params.get('limite')),
+        )
+        return Response(resumen, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        reparar = request.data.get('reparar') in (True, 'true', '1', 1)
+        try:
+            resumen = conciliar(
+                ids=self._ids(request.data.get('ids')),
+                reparar=reparar,
+                usuario=request.user,
+                limite=self._limite(request.data.get('limite')),
+            )
+        except ErrorConciliacion as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info(
+            f"Conciliación de stock solicitada por {request.user.username}: "
+            f"{resumen['total_discrepancias']} discrepancia(s), reparar={reparar}."
+        )
+        return Response(resumen, status=status.HTTP_200_OK)
+
+
+class TelemetriaRespuestasAPIView(APIView):
+    """
+    GET: tamaño de las respuestas de la API por endpoint (ver gestion/telemetria.py), del
+    worker que atiende la petición (`proceso`).
+    DELETE: reinicia los contadores de ese worker.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(resumen_respuestas(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        reiniciar_telemetria()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class ArticuloStockAPIView(generics.RetrieveAPIView):
     queryset = Articulo.objects.all()
     serializer_class = ArticuloSerializer
@@ -855,7 +1104,7 @@ class ArticuloStockAPIView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class MovimientoHistoryView(generics.ListAPIView):
+class MovimientoHistoryView(LecturaReplicaMixin, generics.ListAPIView):
     serializer_class = MovimientoSerializer
     permission_classes = [IsAuthenticated]
 
@@ -866,8 +1115,41 @@ class MovimientoHistoryView(generics.ListAPIView):
         return queryset
 
 
-class ArticuloListView(generics.ListAPIView):
-    queryset = Articulo.objects.all()
+class LineaTiempoArticuloView(LecturaReplicaMixin, APIView):
+    """
+    Movimientos de un artículo con su efecto y el stock/prestado resultante.
+    Parámetros: ?orden=asc|desc (por defecto desc), ?limite=N, ?cursor=... (de 'next').
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        articulo = get_object_or_404(Articulo.objects.only('id'), pk=pk)
+        try:
+            limite = int(request.query_params.get('limite', LIMITE_LINEA_TIEMPO))
+        except ValueError:
+            return Response({"error": "El límite debe ser un número entero."}, status=status.HTTP_400_BAD_REQUEST)
+        limite = min(max(limite, 1), LIMITE_MAXIMO_LINEA_TIEMPO)
+
+        try:
+            filas, cursor = linea_tiempo(
+                articulo.id,
+                cursor=request.query_params.get('cursor'),
+                limite=limite,
+                descendente=request.query_params.get('orden', 'desc') != 'asc',
+            )
+        except ErrorCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        siguiente = None
+        if cursor:
+            siguiente = request.build_absolute_uri(
+                f"{request.path}?{urlencode({'cursor': cursor, 'limite': limite})}"
+            )
+        return Response({"next": siguiente, "results": filas}, status=status.HTTP_200_OK)
+
+
+class ArticuloListView(LecturaReplicaMixin, CamposDispersosViewMixin, generics.ListAPIView):
+    queryset = Articulo.objects.select_related('categoria', 'marca', 'modelo', 'ubicacion', 'estado').all()
     serializer_class = ArticuloSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['nombre']
@@ -897,9 +1179,8 @@ class CambiarEstadoArticuloAPIView(generics.UpdateAPIView):
 
         with transaction.atomic():
             estado_anterior = articulo.estado
-            articulo.estado = estado_nuevo
-            articulo.save()
-
+            # Movimiento.save cambia el estado del artículo y guarda estado_anterior, que es
+            # lo que usa la anulación para volver atrás
             movimiento = Movimiento.objects.create(
                 articulo=articulo,
                 tipo_movimiento="Cambio de Estado",
@@ -907,8 +1188,10 @@ class CambiarEstadoArticuloAPIView(generics.UpdateAPIView):
                 usuario=request.user,
                 ubicacion=articulo.ubicacion,
                 comentario=f"Cambio de estado de '{estado_anterior.nombre}' a '{estado_nuevo.nombre}'.",
-                motivo=None
+                motivo=None,
+                estado_nuevo=estado_nuevo
             )
+            articulo.refresh_from_db()
 
             movimiento_serializer = MovimientoSerializer(movimiento)
             articulo_serializer = self.get_serializer(articulo)
@@ -0,0 +1,77 @@
+# gunicorn.conf.py
+#
+# Perfil de servicio para producción. Gunicorn carga este archivo con
+# `gunicorn -c gunicorn.conf.py` y todos los valores pueden sobrescribirse
+# mediante variables de entorno (Railway define PORT automáticamente).
+#
+# Perfiles disponibles (GUNICORN_PERFIL):
+#   - sync:    un proceso por worker, sin hilos (comportamiento anterior).
+#   - gthread: workers con hilos; recomendado para la API (por defecto).
+#   - asgi:    workers de uvicorn sobre inventario_api.asgi:application.
+
+import multiprocessing
+import os
+
+
+def _entero(nombre, por_defecto):
+    valor = os.environ.get(nombre)
+    if valor in (None, ''):
+        return por_defecto
+    return int(valor)
+
+
+CPUS = multiprocessing.cpu_count()
+PERFIL = os.environ.get('GUNICORN_PERFIL', 'gthread').strip().lower()
+
+if PERFIL not in ('sync', 'gthread', 'asgi'):
+    raise ValueError(f"GUNICORN_PERFIL inválido: '{PERFIL}'. Usa sync, gthread o asgi.")
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8080')}")
+wsgi_app = 'inventario_api.wsgi:application'
+
+# Con hilos o ASGI cada worker atiende varias peticiones a la vez, por lo que
+# basta con un worker por CPU (+1). El perfil sync necesita la fórmula clásica.
+if PERFIL == 'sync':
+    workers = _entero('GUNICORN_WORKERS', CPUS * 2 + 1)
+    threads = 1
+    worker_class = 'sync'
+elif PERFIL == 'gthread':
+    workers = _entero('GUNICORN_WORKERS', CPUS + 1)
+    threads = _entero('GUNICORN_THREADS', 4)
+    worker_class = 'gthread'
+else:
+    workers = _entero('GUNICORN_WORKERS', CPUS + 1)
+    threads = 1
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'inventario_api.asgi:application'
+
+# Las importaciones de Excel pueden tardar; el resto de la API responde en ms.
+timeout = _entero('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _entero('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _entero('GUNICORN_KEEPALIVE', 5)
+
+# Reciclar workers periódicamente evita que la memoria de pandas/openpyxl
+# se acumule tras importaciones grandes.
+max_requests = _entero('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _entero('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = os.environ.get('GUNICORN_ERRORLOG', '-')
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+# Cargar la aplicación antes de hacer fork reduce la memoria total, pero las
+# conexiones a la base de datos no deben compartirse entre procesos.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from django.db import connections
+        for conexion in connections.all(initialized_only=True):
+            conexion.close()
+
+
+def post_worker_init(worker):
+    # Purga periódica de tokens vencidos si PURGA_TOKENS_INTERVALO > 0
+    from gestion.mantenimiento_tokens import iniciar_purga_periodica
+    iniciar_purga_periodica()
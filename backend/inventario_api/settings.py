@@ -5,6 +5,7 @@ from datetime import timedelta
 import os
 from decouple import config
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # WhiteNoise Middleware
+    'gestion.middleware.CompresionAPIMiddleware',  # gzip/brotli de respuestas de la API
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Debe estar antes de CommonMiddleware
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'gestion.middleware.AdherenciaReplicaMiddleware',  # Lecturas al primario tras escribir
 ]
 
 ROOT_URLCONF = 'inventario_api.urls'
@@ -71,23 +74,74 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'inventario_api.wsgi.application'
+ASGI_APPLICATION = 'inventario_api.asgi.application'
 
 # Database Configuration
+# DB_POOL activa el pool de conexiones de psycopg 3 (requiere `psycopg[pool]`).
+# Con el pool activo Django exige conn_max_age=0: el pool reutiliza las conexiones.
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=600, cast=int)
+
 if DEBUG:
     DATABASES = {
         'default': dj_database_url.parse(
             config('DATABASE_PUBLIC_URL'),
-            conn_max_age=600
+            conn_max_age=DB_CONN_MAX_AGE,
+            conn_health_checks=True
         )
     }
 else:
     DATABASES = {
         'default': dj_database_url.config(
             default=config('DATABASE_URL'),
-            conn_max_age=600
+            conn_max_age=DB_CONN_MAX_AGE,
+            conn_health_checks=True
         )
     }
 
+# Réplica de lectura opcional. Solo la usan las vistas con LecturaReplicaMixin (ver
+# gestion/replicas.py); las escrituras y el resto de las lecturas van siempre a 'default'.
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=True
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['gestion.replicas.RouterReplica']
+# Tras escribir, las lecturas del usuario van al primario durante este tiempo (retraso de replicación)
+REPLICA_ADHERENCIA_SEGUNDOS = config('REPLICA_ADHERENCIA_SEGUNDOS', default=5, cast=int)
+# Si la réplica falla, el proceso usa el primario durante este tiempo antes de reintentar
+REPLICA_REINTENTO_SEGUNDOS = config('REPLICA_REINTENTO_SEGUNDOS', default=30, cast=int)
+
+if DB_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        DB_POOL = False
+    else:
+        for base in DATABASES.values():
+            if base['ENGINE'] != 'django.db.backends.postgresql':
+                continue
+            base['CONN_MAX_AGE'] = 0
+            base.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': config('DB_POOL_MIN', default=2, cast=int),
+                'max_size': config('DB_POOL_MAX', default=10, cast=int),
+                'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+            }
+
+# Caché (previsualizaciones de importación, etc.). Por defecto en memoria local del
+# proceso; en producción con varios workers conviene un backend compartido (Redis).
+# Con DATABASE_REPLICA_URL es obligatorio (ver gestion/checks.py).
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='gestion-bodega'),
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -126,26 +180,74 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Subidas por fragmentos de archivos de importación
+CARGAS_DIR = os.path.join(MEDIA_ROOT, 'cargas')
+CARGA_TAMANO_MAXIMO = config('CARGA_TAMANO_MAXIMO', default=200 * 1024 * 1024, cast=int)
+# Segundos tras los que vence la reserva de un fragmento que no terminó de escribirse
+CARGA_RESERVA_SEGUNDOS = config('CARGA_RESERVA_SEGUNDOS', default=300, cast=int)
+# Horas sin cambios tras las que purgar_cargas borra una carga no importada y su archivo
+CARGA_VIGENCIA_HORAS = config('CARGA_VIGENCIA_HORAS', default=48, cast=int)
+
+# Máximo de registros del historial de stock cuando se combinan con meses archivados
+HISTORIAL_LIMITE_COMBINADO = config('HISTORIAL_LIMITE_COMBINADO', default=50000, cast=int)
+
+# Compresión de respuestas de la API (gestion/middleware.py). Los endpoints de tokens
+# quedan excluidos por BREACH. Brotli se usa solo si el paquete está instalado.
+COMPRESION_API_PREFIJOS = ['/api/']
+COMPRESION_API_EXCLUIDOS = ['/api/token/']
+COMPRESION_API_UMBRAL = config('COMPRESION_API_UMBRAL', default=1024, cast=int)
+COMPRESION_BROTLI_CALIDAD = config('COMPRESION_BROTLI_CALIDAD', default=5, cast=int)
+# Respuestas más grandes que esto se registran como advertencia (ver gestion/telemetria.py)
+PRESUPUESTO_RESPUESTA_API = config('PRESUPUESTO_RESPUESTA_API', default=1024 * 1024, cast=int)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'gestion.autenticacion.JWTAutenticacionCacheada',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Cubetas de tokens por usuario y clase de endpoint (ver gestion/limites.py).
+    # '120/min' admite ráfagas de 120 peticiones y se recupera a 2 por segundo.
+    'DEFAULT_THROTTLE_CLASSES': [
+        'gestion.limites.CubetaTokensThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anonimo': config('LIMITE_ANONIMO', default='30/min'),
+        'lectura': config('LIMITE_LECTURA', default='300/min'),
+        'escritura': config('LIMITE_ESCRITURA', default='120/min'),
+        'importacion': config('LIMITE_IMPORTACION', default='10/min'),
+        'exportacion': config('LIMITE_EXPORTACION', default='30/min'),
+    },
 }
 
+# Dónde viven las cubetas: 'local' (memoria del proceso), 'cache' (la caché configurada,
+# compartida entre workers si es Redis) o 'auto' (local si la caché es LocMemCache).
+LIMITES_ALMACEN = config('LIMITES_ALMACEN', default='auto')
+
+# Idempotency-Key en movimientos, importaciones y actualizaciones de stock (ver gestion/idempotencia.py).
+# Horas que se guarda la respuesta de una clave y segundos tras los que una clave que
+# quedó 'En proceso' (el worker murió) puede volver a usarse.
+IDEMPOTENCIA_TTL = config('IDEMPOTENCIA_TTL', default=24, cast=int)
+IDEMPOTENCIA_ABANDONO = config('IDEMPOTENCIA_ABANDONO', default=300, cast=int)
+
+# Segundos que se guardan los totales de artículos por catálogo (?con_totales=1). Toda
+# escritura de artículos los invalida antes; el plazo solo acota la memoria de la caché.
+CATALOGOS_TOTALES_TTL = config('CATALOGOS_TOTALES_TTL', default=600, cast=int)
+
 # Configuración de CORS
 CORS_ALLOWED_ORIGINS = [
     'https://gestionbodega-front.up.railway.app',
 ]
 
 CORS_ALLOW_CREDENTIALS = True  # Permitir cookies y credenciales
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'Retry-After']
 
 # Configuración de CSRF
 CSRF_TRUSTED_ORIGINS = [
@@ -176,3 +278,13 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
     'JTI_CLAIM': 'jti',
 }
+
+# Caché en memoria de usuarios autenticados por JWT (ver gestion/autenticacion.py)
+JWT_CACHE_USUARIOS_MAXIMO = config('JWT_CACHE_USUARIOS_MAXIMO', default=1024, cast=int)
+JWT_CACHE_USUARIOS_TTL = config('JWT_CACHE_USUARIOS_TTL', default=60, cast=int)
+
+# Purga de tokens vencidos de token_blacklist (ver gestion/mantenimiento_tokens.py).
+# Con PURGA_TOKENS_INTERVALO en 0 no hay purga en segundo plano y se usa el comando purgar_tokens.
+PURGA_TOKENS_INTERVALO = config('PURGA_TOKENS_INTERVALO', default=0, cast=int)
+PURGA_TOKENS_TAMANO_LOTE = config('PURGA_TOKENS_TAMANO_LOTE', default=5000, cast=int)
+PURGA_TOKENS_MARGEN = config('PURGA_TOKENS_MARGEN', default=0, cast=int)